@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from functools import partial
+import logging
+import os
+
+from app.services.error_handling_service import ErrorHandlingService
+from app.services.executor_service import run_blocking
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/invoices/errors", tags=["errors"])
+
+@router.get("/statistics")
+async def get_error_statistics():
+    """获取错误统计信息"""
+    try:
+        error_handler = ErrorHandlingService()
+        return await run_blocking('storage', error_handler.get_error_statistics)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/generate_report")
+async def generate_error_report():
+    """生成错误处理报告"""
+    try:
+        error_handler = ErrorHandlingService()
+        report_path = await run_blocking('storage', error_handler.create_manual_review_report)
+        return {
+            "message": "错误报告生成成功",
+            "report_path": report_path
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/unrecognized")
+async def list_unrecognized_files(
+    category: Optional[str] = Query(None, description="分类（未识别目录下的子目录）"),
+    error_type: Optional[str] = Query(None, description="错误类型"),
+    name: Optional[str] = Query(None, description="文件名（包含匹配）"),
+    min_confidence: Optional[float] = Query(None, description="最低置信度"),
+    max_confidence: Optional[float] = Query(None, description="最高置信度"),
+    sort_by: Optional[str] = Query("added_at", description="排序字段 added_at/modified_time/file_size/confidence_score/file_name"),
+    sort_order: Optional[str] = Query("desc", description="排序方向 asc/desc"),
+    limit: Optional[int] = Query(100, ge=0, description="返回数量限制"),
+    offset: Optional[int] = Query(0, ge=0, description="偏移量"),
+    refresh: bool = Query(False, description="扫描未识别目录重建索引")
+):
+    """分页列出未识别的发票文件（读取索引，不遍历目录）"""
+    try:
+        error_handler = ErrorHandlingService()
+        if refresh:
+            await run_blocking('storage', error_handler.unrecognized_index.rebuild)
+        # category 与 run_blocking 的参数同名，用 partial 传入过滤条件
+        list_files = partial(
+            error_handler.list_unrecognized_files,
+            category=category, error_type=error_type, name=name,
+            min_confidence=min_confidence, max_confidence=max_confidence,
+            sort_by=sort_by, sort_order=sort_order, limit=limit, offset=offset
+        )
+        return await run_blocking('storage', list_files)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/delete_unrecognized")
+async def delete_unrecognized_file(request: dict):
+    """删除未识别的发票文件"""
+    try:
+        file_path = request.get("file_path")
+        if not file_path:
+            raise HTTPException(status_code=400, detail="文件路径不能为空")
+
+        # 检查文件是否存在
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail="文件不存在")
+
+        # 检查文件是否在未识别目录中
+        error_handler = ErrorHandlingService()
+        if not error_handler.is_unrecognized_path(file_path):
+            raise HTTPException(status_code=403, detail="只能删除未识别目录中的文件")
+
+        # 删除文件并更新索引
+        await run_blocking('storage', error_handler.delete_unrecognized_file, file_path)
+
+        return {
+            "message": "文件删除成功",
+            "file_path": file_path
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/clear_all_unrecognized")
+async def clear_all_unrecognized_files():
+    """清空所有未识别的发票文件"""
+    try:
+        error_handler = ErrorHandlingService()
+        deleted_count = await run_blocking('storage', error_handler.clear_unrecognized_files)
+
+        return {
+            "message": f"成功清空 {deleted_count} 个未识别文件",
+            "deleted_count": deleted_count
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
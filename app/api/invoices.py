@@ -5,8 +5,12 @@ from datetime import datetime
 import logging
 import os
 
-from app.services.invoice_service_excel import InvoiceServiceExcel
-from app.services.error_handling_service import ErrorHandlingService
+from app.database import get_db
+from app.models.invoice import (
+    Invoice, InvoiceFilter, InvoiceResponse, ProcessingStatus,
+    InvoiceUpload, InvoiceUploadResponse
+)
+from app.services.invoice_service import InvoiceService
 from app.services.file_service import file_service
 
 logger = logging.getLogger(__name__)
@@ -171,114 +175,6 @@ async def get_invoice_raw_text(invoice_id: int, db: Session = Depends(get_db)):
         logger.error(f"Error getting invoice raw text: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/errors/statistics")
-async def get_error_statistics():
-    """获取错误统计信息"""
-    try:
-        error_handler = ErrorHandlingService()
-        stats = error_handler.get_error_statistics()
-        return stats
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.post("/errors/generate_report")
-async def generate_error_report():
-    """生成错误处理报告"""
-    try:
-        error_handler = ErrorHandlingService()
-        report_path = error_handler.create_manual_review_report()
-        return {
-            "message": "错误报告生成成功",
-            "report_path": report_path
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.get("/errors/unrecognized")
-async def list_unrecognized_files():
-    """列出未识别的发票文件"""
-    try:
-        error_handler = ErrorHandlingService()
-        unrecognized_files = []
-
-        # 遍历未识别目录
-        for root, dirs, files in os.walk(error_handler.unrecognized_dir):
-            for file in files:
-                if not file.endswith(('.txt', '.json')):
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, error_handler.unrecognized_dir)
-                    category = os.path.dirname(relative_path) if os.path.dirname(relative_path) else "root"
-
-                    unrecognized_files.append({
-                        "file_name": file,
-                        "category": category,
-                        "file_path": file_path,
-                        "file_size": os.path.getsize(file_path),
-                        "modified_time": datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
-                    })
-
-        return {
-            "total_count": len(unrecognized_files),
-            "files": unrecognized_files
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.delete("/errors/delete_unrecognized")
-async def delete_unrecognized_file(request: dict):
-    """删除未识别的发票文件"""
-    try:
-        file_path = request.get("file_path")
-        if not file_path:
-            raise HTTPException(status_code=400, detail="文件路径不能为空")
-
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="文件不存在")
-
-        # 检查文件是否在未识别目录中
-        error_handler = ErrorHandlingService()
-        if not file_path.startswith(error_handler.unrecognized_dir):
-            raise HTTPException(status_code=403, detail="只能删除未识别目录中的文件")
-
-        # 删除文件
-        os.remove(file_path)
-
-        return {
-            "message": "文件删除成功",
-            "file_path": file_path
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.delete("/errors/clear_all_unrecognized")
-async def clear_all_unrecognized_files():
-    """清空所有未识别的发票文件"""
-    try:
-        error_handler = ErrorHandlingService()
-        deleted_count = 0
-
-        # 遍历未识别目录，删除所有文件
-        for root, dirs, files in os.walk(error_handler.unrecognized_dir):
-            for file in files:
-                if not file.endswith(('.txt', '.json')):  # 保留日志文件
-                    file_path = os.path.join(root, file)
-                    try:
-                        os.remove(file_path)
-                        deleted_count += 1
-                    except Exception as e:
-                        logger.warning(f"删除文件失败: {file_path}, 错误: {e}")
-
-        return {
-            "message": f"成功清空 {deleted_count} 个未识别文件",
-            "deleted_count": deleted_count
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 @router.post("/upload", response_model=InvoiceUploadResponse)
 async def upload_invoices(
     files: List[UploadFile] = File(...),
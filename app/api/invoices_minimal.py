@@ -9,45 +9,112 @@ import os
 
 from app.services.invoice_service_minimal import InvoiceServiceMinimal
 from app.services.file_service import file_service
+from app.services.job_service import job_manager
+from app.services.executor_service import run_blocking
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/invoices", tags=["invoices"])
 
 @router.post("/process")
-async def process_invoices():
-    """处理所有发票文件"""
+async def process_invoices(
+    full_scan: bool = Query(False, description="忽略扫描清单，重新全量扫描目录")
+):
+    """提交后台任务处理新增或修改过的发票文件，进度通过 /api/invoices/jobs/{job_id}/events 获取"""
     try:
-        service = InvoiceServiceMinimal()
-        stats = service.process_all_invoices()
+        def run_processing(progress_callback, cancel_event):
+            service = InvoiceServiceMinimal()
+            stats = service.process_all_invoices(
+                progress_callback=progress_callback,
+                cancel_event=cancel_event,
+                full_scan=full_scan
+            )
+            return {
+                "total_files": stats['total'],
+                "processed_files": stats['processed'],
+                "failed_files": stats['failed'],
+                "skipped_files": stats['skipped']
+            }
+
+        job = job_manager.submit("process_invoices", run_processing)
         
         return {
-            "total_files": stats['total'],
-            "processed_files": stats['processed'],
-            "failed_files": stats['failed'],
-            "skipped_files": stats['skipped'],
-            "status": "completed"
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": f"/api/invoices/jobs/{job.job_id}",
+            "events_url": f"/api/invoices/jobs/{job.job_id}/events"
+        }
+    except Exception as e:
+        logger.error(f"提交处理任务失败: {e}")
+        raise HTTPException(status_code=500, detail=f"提交处理任务失败: {str(e)}")
+
+@router.post("/reextract")
+async def reextract_invoices():
+    """提交后台任务，用已存储的原始文本重新执行识别规则（不重新OCR），进度通过任务事件获取"""
+    try:
+        def run_reextract(progress_callback, cancel_event):
+            service = InvoiceServiceMinimal()
+            stats = service.reextract_all_invoices(
+                progress_callback=progress_callback,
+                cancel_event=cancel_event
+            )
+            return {
+                "total_records": stats['total'],
+                "updated_records": stats['updated'],
+                "unchanged_records": stats['unchanged'],
+                "skipped_records": stats['skipped']
+            }
+
+        job = job_manager.submit("reextract_invoices", run_reextract)
+
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": f"/api/invoices/jobs/{job.job_id}",
+            "events_url": f"/api/invoices/jobs/{job.job_id}/events"
         }
     except Exception as e:
-        logger.error(f"处理发票失败: {e}")
-        raise HTTPException(status_code=500, detail=f"处理发票失败: {str(e)}")
+        logger.error(f"提交重新提取任务失败: {e}")
+        raise HTTPException(status_code=500, detail=f"提交重新提取任务失败: {str(e)}")
 
 @router.get("/")
 async def get_invoices(
-    limit: Optional[int] = Query(100, description="返回数量限制"),
-    offset: Optional[int] = Query(0, description="偏移量")
+    limit: Optional[int] = Query(100, ge=0, description="返回数量限制"),
+    offset: Optional[int] = Query(0, ge=0, description="偏移量（提供cursor时忽略）"),
+    cursor: Optional[str] = Query(None, description="上一页返回的next_cursor"),
+    invoice_number: Optional[str] = Query(None, description="发票号码（包含匹配）"),
+    seller_name: Optional[str] = Query(None, description="销售方名称（包含匹配）"),
+    buyer_name: Optional[str] = Query(None, description="购买方名称（包含匹配）"),
+    min_amount: Optional[float] = Query(None, description="最小价税合计"),
+    max_amount: Optional[float] = Query(None, description="最大价税合计"),
+    start_date: Optional[str] = Query(None, description="开票日期起（YYYY-MM-DD）"),
+    end_date: Optional[str] = Query(None, description="开票日期止（YYYY-MM-DD）"),
+    sort_by: Optional[str] = Query("created_at", description="排序字段"),
+    sort_order: Optional[str] = Query("desc", description="排序方向 asc/desc")
 ):
-    """获取发票列表"""
+    """获取发票列表（支持过滤、排序和游标分页）"""
+    # 过滤条件与 InvoiceFilter 字段一致
+    filters = {
+        'invoice_number': invoice_number, 'seller_name': seller_name, 'buyer_name': buyer_name,
+        'min_amount': min_amount, 'max_amount': max_amount, 'start_date': start_date, 'end_date': end_date
+    }
     try:
         service = InvoiceServiceMinimal()
-        invoices = service.get_invoices(limit=limit, offset=offset)
+        result = await run_blocking(
+            'storage', service.query_invoices, filters,
+            sort_by=sort_by, sort_order=sort_order, limit=limit, offset=offset, cursor=cursor
+        )
         
         return {
-            "invoices": invoices,
-            "total": len(invoices),
+            "invoices": result['invoices'],
+            "total": len(result['invoices']),
+            "matched": result['matched'],
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": result['next_cursor']
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取发票列表失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取发票列表失败: {str(e)}")
@@ -57,7 +124,7 @@ async def get_statistics():
     """获取统计信息"""
     try:
         service = InvoiceServiceMinimal()
-        stats = service.get_invoice_stats()
+        stats = await run_blocking('storage', service.get_invoice_stats)
         return stats
     except Exception as e:
         logger.error(f"获取统计信息失败: {e}")
@@ -68,7 +135,7 @@ async def export_to_csv(export_path: Optional[str] = Query(None)):
     """导出数据到CSV文件"""
     try:
         service = InvoiceServiceMinimal()
-        file_path = service.export_to_csv(export_path)
+        file_path = await run_blocking('storage', service.export_to_csv, export_path)
         
         return {
             "message": "导出成功",
@@ -106,7 +173,7 @@ async def upload_invoices(files: List[UploadFile] = File(...)):
 
         for upload_file in files:
             # 保存文件
-            result = file_service.save_uploaded_file(upload_file)
+            result = await run_blocking('files', file_service.save_uploaded_file, upload_file)
 
             upload_info = {
                 "file_name": upload_file.filename,
@@ -119,8 +186,10 @@ async def upload_invoices(files: List[UploadFile] = File(...)):
             # 如果文件保存成功，尝试处理
             if result['success']:
                 try:
-                    process_result = service.upload_invoice_file(
-                        result['file_path'], 
+                    process_result = await run_blocking(
+                        'ocr',
+                        service.upload_invoice_file,
+                        result['file_path'],
                         result['file_type']
                     )
                     upload_info.update(process_result)
@@ -154,20 +223,20 @@ async def delete_invoice_file(file_name: str):
         image_path = file_service.image_dir / file_name
 
         file_path = None
-        if pdf_path.exists():
+        if await run_blocking('files', pdf_path.exists):
             file_path = str(pdf_path)
-        elif image_path.exists():
+        elif await run_blocking('files', image_path.exists):
             file_path = str(image_path)
         else:
             raise HTTPException(status_code=404, detail="文件不存在")
 
         # 删除文件
-        result = file_service.delete_file(file_path)
+        result = await run_blocking('files', file_service.delete_file, file_path)
 
         if result['success']:
             # 同时删除CSV中对应的记录
             service = InvoiceServiceMinimal()
-            deleted = service.delete_invoice_by_file_path(file_path)
+            deleted = await run_blocking('storage', service.delete_invoice_by_file_path, file_path)
 
             message = f"文件删除成功"
             if deleted:
@@ -191,7 +260,7 @@ async def delete_invoice_file(file_name: str):
 async def list_invoice_files():
     """列出所有发票文件"""
     try:
-        files = file_service.list_files()
+        files = await run_blocking('files', file_service.list_files)
 
         # 按类型分组
         pdf_files = [f for f in files if f['file_type'] == 'pdf']
@@ -216,7 +285,7 @@ async def get_processing_status():
     """获取处理状态"""
     try:
         service = InvoiceServiceMinimal()
-        status = service.get_processing_status()
+        status = await run_blocking('storage', service.get_processing_status)
         return status
     except Exception as e:
         logger.error(f"获取处理状态失败: {e}")
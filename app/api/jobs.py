@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import logging
+from typing import Optional
+
+from app.services.job_service import job_manager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/invoices/jobs", tags=["jobs"])
+
+@router.get("/")
+async def list_jobs():
+    """列出最近的后台任务"""
+    return {"jobs": job_manager.list_jobs()}
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str):
+    """获取任务状态和进度"""
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    """取消任务（运行中的任务在当前文件处理完成后停止）"""
+    job = job_manager.cancel_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job.is_finished and job.status != 'cancelled':
+        message = "任务已结束，无法取消"
+    else:
+        message = "已请求取消任务"
+    return {"message": message, "job": job.to_dict()}
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    poll_interval: float = Query(0.5, ge=0.1, le=5.0, description="事件轮询间隔（秒）"),
+    last_event_id: Optional[str] = Header(None, description="EventSource重连时携带的最后事件序号")
+):
+    """以Server-Sent Events推送任务的逐文件进度
+
+    重连时从 Last-Event-ID 之后继续推送；该位置之后的事件已被丢弃时先推送 reset 事件（数据为任务快照），
+    客户端应据此重置进度后继续接收。
+    """
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    try:
+        start_seq = max(int(last_event_id), 0) if last_event_id else 0
+    except ValueError:
+        logger.warning(f"Last-Event-ID 无效: {last_event_id}，从头推送")
+        start_seq = 0
+
+    async def event_stream():
+        last_seq = start_seq
+        idle_seconds = 0.0
+        while True:
+            reset_seq, events = job.events_since(last_seq)
+            if reset_seq is not None:
+                last_seq = reset_seq
+                payload = json.dumps(job.to_dict(), ensure_ascii=False)
+                yield f"id: {reset_seq}\nevent: reset\ndata: {payload}\n\n"
+            for event in events:
+                last_seq = event['seq']
+                payload = json.dumps(event['data'], ensure_ascii=False)
+                yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {payload}\n\n"
+                if event['event'] == 'done':
+                    return
+            if not events and job.is_finished:
+                # 续传位置已在 done 事件之后
+                return
+
+            # 长时间无事件时发送心跳注释行，防止代理断开空闲连接
+            idle_seconds = 0.0 if events else idle_seconds + poll_interval
+            if idle_seconds >= 15:
+                idle_seconds = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(poll_interval)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
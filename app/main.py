@@ -5,14 +5,27 @@ from fastapi.encoders import jsonable_encoder
 import logging
 import os
 import json
+import threading
+
+from app.services.model_registry import warm_up_models, get_model_status
+from app.services.executor_service import get_executor_metrics
+from app.services.watch_service import start_watcher, stop_watcher, get_watcher_status
 
 # 根据环境变量选择存储类型
 storage_type = os.getenv('STORAGE_TYPE', 'excel')
 
 if storage_type == 'csv':
     from app.api.invoices_minimal import router as invoices_router
+    from app.services.invoice_service_minimal import InvoiceServiceMinimal as InvoiceService
+elif storage_type == 'sqlite':
+    from app.api.invoices_sqlite import router as invoices_router
+    from app.services.invoice_service_sqlite import InvoiceServiceSQLite as InvoiceService
 else:
     from app.api.invoices_excel import router as invoices_router
+    from app.services.invoice_service_excel import InvoiceServiceExcel as InvoiceService
+
+from app.api.jobs import router as jobs_router
+from app.api.errors import router as errors_router
 
 # 配置日志
 logging.basicConfig(
@@ -39,12 +52,29 @@ app = FastAPI(
     default_response_class=UnicodeJSONResponse
 )
 
-# 无需创建数据库表，使用文件存储（Excel或CSV）
-# create_tables()  # 已禁用数据库
+# 无需创建数据库表，使用文件存储（Excel或CSV）或SQLite存储服务（自动建表）
+# create_tables()  # 已禁用SQLAlchemy数据库
 
-# 注册API路由
+# 注册API路由（任务和错误路由需在发票路由之前注册，避免被 /api/invoices/{invoice_id} 等路径匹配）
+app.include_router(jobs_router)
+app.include_router(errors_router)
 app.include_router(invoices_router)
 
+@app.on_event("startup")
+async def warm_up_ocr():
+    """启动时在后台线程加载并预热OCR模型（OCR_WARMUP=false 时跳过，改为首次使用时加载）"""
+    if os.getenv('OCR_WARMUP', 'true').lower() in ('1', 'true', 'yes'):
+        threading.Thread(target=warm_up_models, name="ocr-warmup", daemon=True).start()
+
+@app.on_event("startup")
+async def start_invoice_watcher():
+    """WATCH_MODE 不为 off 时监听发票目录，新放入的文件自动处理"""
+    start_watcher(InvoiceService)
+
+@app.on_event("shutdown")
+async def stop_invoice_watcher():
+    stop_watcher()
+
 # 挂载静态文件
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -57,7 +87,15 @@ async def read_root():
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {"status": "healthy", "message": "Invoice OCR system is running"}
+    model_status = get_model_status()
+    return {
+        "status": "healthy",
+        "message": "Invoice OCR system is running",
+        "ocr_ready": model_status['ready'],
+        "ocr_model": model_status,
+        "executors": get_executor_metrics(),
+        "watcher": get_watcher_status()
+    }
 
 if __name__ == "__main__":
     import uvicorn
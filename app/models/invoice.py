@@ -14,6 +14,7 @@ class Invoice(Base):
     file_path = Column(String, unique=True, index=True)
     file_name = Column(String, index=True)
     file_type = Column(String)  # 'image' or 'pdf'
+    file_hash = Column(String, index=True)  # 文件内容MD5，用于去重
     
     # 发票基本信息
     invoice_number = Column(String, index=True)
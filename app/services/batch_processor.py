@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .model_registry import get_easyocr_reader
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内的OCR服务实例（每个进程只初始化一次）
+_worker_ocr_service = None
+
+
+def get_default_workers() -> int:
+    """读取并行处理进程数配置 INVOICE_WORKERS（默认1即串行，0表示使用全部CPU核心）"""
+    value = os.getenv('INVOICE_WORKERS', '1')
+    try:
+        workers = int(value)
+    except ValueError:
+        logger.warning(f"INVOICE_WORKERS 配置无效: {value}，使用串行处理")
+        return 1
+
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def get_default_write_batch() -> Tuple[int, float]:
+    """读取批量写入配置：INVOICE_WRITE_BATCH 条数（默认50）和 INVOICE_WRITE_INTERVAL 秒数（默认5）"""
+    try:
+        max_records = max(1, int(os.getenv('INVOICE_WRITE_BATCH', '50')))
+    except ValueError:
+        logger.warning(f"INVOICE_WRITE_BATCH 配置无效: {os.getenv('INVOICE_WRITE_BATCH')}，使用默认值50")
+        max_records = 50
+    try:
+        max_seconds = max(0.0, float(os.getenv('INVOICE_WRITE_INTERVAL', '5')))
+    except ValueError:
+        logger.warning(f"INVOICE_WRITE_INTERVAL 配置无效: {os.getenv('INVOICE_WRITE_INTERVAL')}，使用默认值5秒")
+        max_seconds = 5.0
+    return max_records, max_seconds
+
+
+class StorageWriteBuffer:
+    """存储批量写入缓冲 - 识别结果累积到 max_records 条，或最早一条已等待 max_seconds 秒时，
+    调用一次 storage.add_invoices 写入（Excel每次写入都要整体重写文件）
+    """
+
+    def __init__(self, storage, max_records: Optional[int] = None, max_seconds: Optional[float] = None,
+                 on_failed: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        """
+        Args:
+            on_failed: 写入失败时回调，参数为未能写入的记录
+        """
+        default_records, default_seconds = get_default_write_batch()
+        self.storage = storage
+        self.max_records = max(1, max_records if max_records is not None else default_records)
+        self.max_seconds = max_seconds if max_seconds is not None else default_seconds
+        self.on_failed = on_failed
+        self.written = 0
+        self._records: List[Dict[str, Any]] = []
+        self._first_added = 0.0
+
+    def add(self, record: Dict[str, Any]):
+        if not self._records:
+            self._first_added = time.monotonic()
+        self._records.append(record)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """达到条数或等待时间上限时写入"""
+        if len(self._records) >= self.max_records or (
+                self._records and time.monotonic() - self._first_added >= self.max_seconds):
+            self.flush()
+
+    def flush(self) -> List[int]:
+        """写入全部缓冲记录，返回新记录ID"""
+        records, self._records = self._records, []
+        if not records:
+            return []
+        try:
+            new_ids = self.storage.add_invoices(records)
+        except Exception as e:
+            logger.error(f"批量写入发票记录失败: {len(records)} 条, 错误: {e}")
+            if self.on_failed:
+                self.on_failed(records)
+            return []
+        self.written += len(new_ids)
+        return new_ids
+
+
+def _init_worker(ocr_service_cls):
+    """工作进程初始化：创建OCR服务，并限制每个进程的计算线程数避免CPU超额订阅"""
+    global _worker_ocr_service
+
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    _worker_ocr_service = ocr_service_cls()
+
+    # 在工作进程启动时加载模型，而不是在处理第一个文件时
+    get_easyocr_reader()
+
+
+def _process_file_in_worker(file_path: str, file_type: str,
+                            file_hash: Optional[str] = None) -> Tuple[str, str, Dict[str, Any]]:
+    """在工作进程中执行文本提取和发票信息识别"""
+    try:
+        invoice_info = _worker_ocr_service.process_invoice_file(file_path, file_hash)
+    except Exception as e:
+        logger.error(f"工作进程处理文件失败: {file_path}, 错误: {e}")
+        invoice_info = {}
+    return file_path, file_type, invoice_info
+
+
+class BatchProcessor:
+    """并行批处理引擎 - 多进程执行文本提取与规则识别，结果汇总到单一存储写入者"""
+
+    def __init__(self, ocr_service_cls, workers: Optional[int] = None):
+        self.ocr_service_cls = ocr_service_cls
+        self.workers = workers if workers is not None else get_default_workers()
+
+    def run(self, files: List[Tuple[str, str]],
+            store_result: Callable[[str, str, Dict[str, Any]], bool],
+            on_complete: Optional[Callable[[str, str], None]] = None,
+            cancel_event: Optional[threading.Event] = None,
+            file_hashes: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+        """并行处理文件列表
+
+        工作进程只负责OCR和规则识别，识别结果回到当前进程，由 store_result 串行写入存储，
+        因此存储服务无需考虑并发写入。
+
+        Args:
+            on_complete: 每个文件结束时回调 (file_path, 'processed'|'failed')
+            cancel_event: 设置后取消尚未开始的文件（已完成的文件仍会入库）
+            file_hashes: 调用方已计算的 {文件路径: 内容哈希}，工作进程不再重复计算
+
+        Returns:
+            {'processed': 成功数, 'failed': 失败数}
+        """
+        stats = {'processed': 0, 'failed': 0}
+        if not files:
+            return stats
+
+        workers = max(1, min(self.workers, len(files)))
+        logger.info(f"启动并行处理: {len(files)} 个文件，{workers} 个工作进程")
+
+        # 使用spawn避免fork继承已加载的模型和线程状态
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(self.ocr_service_cls,)) as executor:
+            futures = {
+                executor.submit(_process_file_in_worker, file_path, file_type,
+                                (file_hashes or {}).get(file_path)): file_path
+                for file_path, file_type in files
+            }
+
+            for future in as_completed(futures):
+                file_path = futures[future]
+                status = 'failed'
+                try:
+                    _, file_type, invoice_info = future.result()
+                    if invoice_info and store_result(file_path, file_type, invoice_info):
+                        status = 'processed'
+                    else:
+                        logger.warning(f"OCR处理失败: {file_path}")
+                except Exception as e:
+                    logger.error(f"处理文件出错 {file_path}: {e}")
+
+                stats[status] += 1
+                if on_complete:
+                    on_complete(file_path, status)
+
+                # 已完成的文件先入库再检查取消，避免结果被丢弃
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("处理任务已取消，停止剩余文件")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+
+        return stats
@@ -5,18 +5,37 @@ import os
 import csv
 import json
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Any
 from datetime import datetime
 from pathlib import Path
 
+from .invoice_keys import invoice_key, normalize_key_part
+from .invoice_query import DEFAULT_SORT, InvoiceQueryIndex
+from .invoice_stats import InvoiceStats, stats_sidecar_path
+
 logger = logging.getLogger(__name__)
 
+# 进程内共享的追加写状态：文件路径 -> {'signature': 上次写入后的文件签名 (mtime_ns, 大小), 'max_id': 最大ID, 'unsynced': 未fsync行数,
+#   'hash_index': {文件哈希: ID}, 'key_index': {(发票号码, 销售方税号): ID}, 'path_index': {文件路径: ID},
+#   'stats': 首次使用时加载的 InvoiceStats}
+_append_state: Dict[str, Dict[str, Any]] = {}
+_append_lock = threading.RLock()
+
+# 查询索引缓存：文件路径 -> {'signature': (mtime_ns, size), 'index': InvoiceQueryIndex}
+_query_cache: Dict[str, Dict[str, Any]] = {}
+
 class CSVStorageService:
     """CSV存储服务 - 替代pandas+Excel，极致轻量"""
     
-    def __init__(self, csv_file_path: str = "./data/invoices.csv"):
+    def __init__(self, csv_file_path: str = "./data/invoices.csv", fsync_batch_size: int = None):
         self.csv_file_path = Path(csv_file_path)
         self.csv_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 每追加多少行执行一次fsync（默认读取 CSV_FSYNC_BATCH）
+        if fsync_batch_size is None:
+            fsync_batch_size = int(os.getenv('CSV_FSYNC_BATCH', '20'))
+        self.fsync_batch_size = max(1, fsync_batch_size)
         
         # 定义CSV列结构
         self.columns = [
@@ -26,9 +45,13 @@ class CSVStorageService:
             'seller_name', 'seller_tax_number',
             'buyer_name', 'buyer_tax_number',
             'raw_text', 'processed', 'created_at', 'updated_at',
-            'recognition_quality', 'confidence_score', 'error_reason'
+            'recognition_quality', 'confidence_score', 'error_reason',
+            'file_hash', 'duplicate_of'
         ]
         
+        # 统计文件（与CSV放在一起，记录对应的CSV文件大小）
+        self.stats_path = stats_sidecar_path(self.csv_file_path)
+        
         # 初始化CSV文件
         self._initialize_csv_file()
     
@@ -41,6 +64,13 @@ class CSVStorageService:
             logger.info(f"创建新的CSV文件: {self.csv_file_path}")
         else:
             logger.info(f"使用现有CSV文件: {self.csv_file_path}")
+            # 旧版本文件缺少新增列时整体重写一次，保证追加行与表头一致
+            with open(self.csv_file_path, 'r', newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), None)
+            if header != self.columns:
+                with _append_lock:
+                    self._save_data(self._load_data())
+                logger.info(f"CSV文件列结构已更新: {self.csv_file_path}")
     
     def _load_data(self) -> List[Dict[str, Any]]:
         """加载CSV数据"""
@@ -78,162 +108,353 @@ class CSVStorageService:
             logger.error(f"加载CSV文件失败: {e}")
             return []
     
+    def _clean_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """按列结构整理一行数据"""
+        clean_row = {}
+        for col in self.columns:
+            value = row.get(col, '')
+            # 处理复杂对象（如recognition_quality）
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            clean_row[col] = value
+        return clean_row
+    
     def _save_data(self, data: List[Dict[str, Any]]):
-        """保存数据到CSV"""
+        """保存数据到CSV（全量重写）"""
         try:
             # 确保目录存在
             self.csv_file_path.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(self.csv_file_path, 'w', newline='', encoding='utf-8') as f:
+            # 先写临时文件再替换，避免重写过程中断导致数据丢失
+            tmp_path = self.csv_file_path.with_name(self.csv_file_path.name + '.tmp')
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.DictWriter(f, fieldnames=self.columns)
                 writer.writeheader()
                 for row in data:
-                    # 确保所有字段都存在
-                    clean_row = {}
-                    for col in self.columns:
-                        value = row.get(col, '')
-                        # 处理复杂对象（如recognition_quality）
-                        if isinstance(value, (dict, list)):
-                            value = json.dumps(value, ensure_ascii=False)
-                        clean_row[col] = value
-                    writer.writerow(clean_row)
+                    writer.writerow(self._clean_row(row))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.csv_file_path)
+            
+            # 更新追加写状态
+            state = self._index_rows(
+                (row.get('id'), row.get('file_hash'), row.get('invoice_number'), row.get('seller_tax_number'),
+                 row.get('file_path'))
+                for row in data
+            )
+            with _append_lock:
+                state.update(signature=self._file_signature(self.csv_file_path.stat()), unsynced=0,
+                             stats=InvoiceStats.from_records(data))
+                _append_state[str(self.csv_file_path)] = state
+                state['stats'].save(self.stats_path, state['signature'])
             
             logger.info(f"数据已保存到CSV: {self.csv_file_path}")
         except Exception as e:
             logger.error(f"保存CSV文件失败: {e}")
             raise
     
+    @staticmethod
+    def _index_rows(rows: Iterable[tuple]) -> Dict[str, Any]:
+        """由 (ID, 文件哈希, 发票号码, 销售方税号, 文件路径) 构建最大ID、去重索引和路径索引（重复时保留最早的记录）"""
+        max_id = 0
+        hash_index: Dict[str, int] = {}
+        key_index: Dict[tuple, int] = {}
+        path_index: Dict[str, int] = {}
+        for row_id, file_hash, invoice_number, seller_tax_number, file_path in rows:
+            if isinstance(row_id, str):
+                row_id = int(row_id) if row_id.isdigit() else None
+            if not isinstance(row_id, int):
+                continue
+            max_id = max(max_id, row_id)
+            file_hash = normalize_key_part(file_hash)
+            if file_hash:
+                hash_index.setdefault(file_hash, row_id)
+            key = invoice_key(invoice_number, seller_tax_number)
+            if key:
+                key_index.setdefault(key, row_id)
+            if file_path:
+                path_index.setdefault(file_path, row_id)
+        return {'max_id': max_id, 'hash_index': hash_index, 'key_index': key_index, 'path_index': path_index}
+
+    def _scan_state(self) -> Dict[str, Any]:
+        """扫描CSV构建最大ID和去重索引（仅解析所需的列）"""
+        with open(self.csv_file_path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header or 'id' not in header:
+                return self._index_rows([])
+            positions = [header.index(col) if col in header else None
+                         for col in ('id', 'file_hash', 'invoice_number', 'seller_tax_number', 'file_path')]
+            return self._index_rows(
+                tuple(row[pos] if pos is not None and pos < len(row) else None for pos in positions)
+                for row in reader
+            )
+    
+    @staticmethod
+    def _file_signature(stat: os.stat_result) -> tuple:
+        """文件签名（修改时间和大小），用于判断文件是否被外部修改"""
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _get_append_state(self) -> Dict[str, int]:
+        """获取追加写状态；文件被外部修改（修改时间或大小不一致）时重新扫描最大ID和去重索引
+
+        调用方需持有 _append_lock
+        """
+        key = str(self.csv_file_path)
+        signature = self._file_signature(self.csv_file_path.stat())
+        state = _append_state.get(key)
+        if state is None or state['signature'] != signature:
+            state = self._scan_state()
+            state.update(signature=signature, unsynced=0)
+            _append_state[key] = state
+        return state
+    
+    def _append_rows(self, rows: List[Dict[str, Any]]):
+        """以追加方式写入记录，并按批次执行fsync
+
+        调用方需持有 _append_lock
+        """
+        state = self._get_append_state()
+        with open(self.csv_file_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+            for row in rows:
+                writer.writerow(self._clean_row(row))
+            f.flush()
+            state['unsynced'] += len(rows)
+            if state['unsynced'] >= self.fsync_batch_size:
+                os.fsync(f.fileno())
+                state['unsynced'] = 0
+            state['signature'] = self._file_signature(os.fstat(f.fileno()))
+    
+    def flush(self):
+        """将尚未fsync的追加写入落盘"""
+        with _append_lock:
+            state = _append_state.get(str(self.csv_file_path))
+            if not state or state['unsynced'] == 0:
+                return
+            with open(self.csv_file_path, 'a', encoding='utf-8') as f:
+                os.fsync(f.fileno())
+            state['unsynced'] = 0
+    
+    def compact(self) -> int:
+        """压缩CSV文件：解析全部记录后整体重写，返回记录数"""
+        with _append_lock:
+            data = self._load_data()
+            self._save_data(data)
+        logger.info(f"CSV文件压缩完成: {self.csv_file_path}, 共 {len(data)} 条记录")
+        return len(data)
+    
     def add_invoice(self, invoice_data: Dict[str, Any]) -> int:
-        """添加发票记录"""
+        """添加发票记录（追加写入一行，不重写整个文件）"""
+        return self.add_invoices([invoice_data])[0]
+    
+    def add_invoices(self, records: List[Dict[str, Any]]) -> List[int]:
+        """批量添加发票记录：连续分配ID，一次追加写入全部行，返回新记录ID列表"""
+        if not records:
+            return []
         try:
-            data = self._load_data()
+            with _append_lock:
+                state = self._get_append_state()
+                now = datetime.now().isoformat()
+                new_rows = []
+                new_hashes: Dict[str, int] = {}
+                new_keys: Dict[tuple, int] = {}
+                new_paths: Dict[str, int] = {}
+                
+                for offset, invoice_data in enumerate(records, 1):
+                    # 生成新的ID
+                    new_id = state['max_id'] + offset
+                    
+                    # 准备新记录
+                    new_record = {
+                        'id': new_id,
+                        'created_at': now,
+                        'updated_at': now,
+                        'processed': True
+                    }
+                    
+                    # 添加发票数据
+                    for key, value in invoice_data.items():
+                        if key in self.columns and key != 'id':
+                            new_record[key] = value
+                    
+                    # 相同发票号码和销售方税号的已有记录（语义重复，包括同一批次中较早的记录）
+                    key = invoice_key(new_record.get('invoice_number'), new_record.get('seller_tax_number'))
+                    if key:
+                        duplicate_of = state['key_index'].get(key, new_keys.get(key))
+                        if duplicate_of is not None:
+                            new_record['duplicate_of'] = duplicate_of
+                            logger.warning(f"发票号码与已有记录重复: {key[0]}, 已有记录ID: {duplicate_of}")
+                        new_keys.setdefault(key, new_id)
+                    file_hash = normalize_key_part(new_record.get('file_hash'))
+                    if file_hash:
+                        new_hashes.setdefault(file_hash, new_id)
+                    if new_record.get('file_path'):
+                        new_paths.setdefault(new_record['file_path'], new_id)
+                    new_rows.append(new_record)
+                
+                # 一次追加写入，成功后再更新ID、索引和统计
+                previous_signature = state['signature']
+                self._append_rows(new_rows)
+                stats = state.get('stats') or InvoiceStats.load(self.stats_path, previous_signature)
+                if stats is not None:
+                    for row in new_rows:
+                        stats.add(row)
+                    state['stats'] = stats
+                    stats.save(self.stats_path, state['signature'])
+                state['max_id'] += len(new_rows)
+                for file_hash, new_id in new_hashes.items():
+                    state['hash_index'].setdefault(file_hash, new_id)
+                for key, new_id in new_keys.items():
+                    state['key_index'].setdefault(key, new_id)
+                for file_path, new_id in new_paths.items():
+                    state['path_index'].setdefault(file_path, new_id)
             
-            # 生成新的ID
-            if data:
-                max_id = max([row.get('id', 0) for row in data if row.get('id')])
-                new_id = max_id + 1
+            new_ids = [row['id'] for row in new_rows]
+            if len(new_ids) == 1:
+                logger.info(f"添加发票记录成功，ID: {new_ids[0]}")
             else:
-                new_id = 1
-            
-            # 准备新记录
-            new_record = {
-                'id': new_id,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat(),
-                'processed': True
-            }
-            
-            # 添加发票数据
-            for key, value in invoice_data.items():
-                if key in self.columns:
-                    new_record[key] = value
-            
-            # 添加到数据列表
-            data.append(new_record)
-            
-            # 保存
-            self._save_data(data)
-            
-            logger.info(f"添加发票记录成功，ID: {new_id}")
-            return new_id
+                logger.info(f"批量添加发票记录成功: {len(new_ids)} 条，ID {new_ids[0]}-{new_ids[-1]}")
+            return new_ids
             
         except Exception as e:
             logger.error(f"添加发票记录失败: {e}")
             raise
     
     def get_invoice_by_file_path(self, file_path: str) -> Optional[Dict[str, Any]]:
-        """根据文件路径获取发票记录"""
+        """根据文件路径获取发票记录（路径索引判断是否存在，命中时从查询索引取整行）"""
         try:
-            data = self._load_data()
-            for row in data:
-                if row.get('file_path') == file_path:
-                    return row
-            return None
+            with _append_lock:
+                row_id = self._get_append_state()['path_index'].get(file_path)
+            if row_id is None:
+                return None
+            return self._get_query_index().get(row_id)
         except Exception as e:
             logger.error(f"查询发票记录失败: {e}")
             return None
     
+    def find_by_file_hash(self, file_hash: str) -> Optional[int]:
+        """按文件内容哈希查找已有记录ID（内存索引）"""
+        if not file_hash:
+            return None
+        with _append_lock:
+            return self._get_append_state()['hash_index'].get(file_hash)
+    
+    def find_duplicate_invoice(self, invoice_number: Any, seller_tax_number: Any) -> Optional[int]:
+        """按 发票号码 + 销售方税号 查找已有记录ID（内存索引）"""
+        key = invoice_key(invoice_number, seller_tax_number)
+        if key is None:
+            return None
+        with _append_lock:
+            return self._get_append_state()['key_index'].get(key)
+    
+    def _get_query_index(self) -> InvoiceQueryIndex:
+        """获取查询索引，文件修改时间或大小变化时重新构建"""
+        key = str(self.csv_file_path)
+        with _append_lock:
+            try:
+                stat = self.csv_file_path.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                signature = None
+            entry = _query_cache.get(key)
+            if entry is None or signature is None or entry['signature'] != signature:
+                entry = {'signature': signature, 'index': InvoiceQueryIndex(self._load_data())}
+                if signature is not None:
+                    _query_cache[key] = entry
+            return entry['index']
+    
+    def query_invoices(self, filters: Optional[Dict[str, Any]] = None, sort_by: str = DEFAULT_SORT,
+                       sort_order: str = 'desc', limit: int = 100, offset: int = 0,
+                       cursor: Optional[str] = None) -> Dict[str, Any]:
+        """按条件过滤、排序并分页（参数和返回值见 InvoiceQueryIndex.query）"""
+        return self._get_query_index().query(filters, sort_by, sort_order, limit, offset, cursor)
+    
     def get_all_invoices(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
-        """获取所有发票记录"""
+        """获取所有发票记录（按创建时间降序）"""
         try:
-            data = self._load_data()
-            
-            # 按创建时间降序排序
-            data.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-            # 分页
-            start_idx = offset
-            end_idx = offset + limit
-            return data[start_idx:end_idx]
-            
+            return self.query_invoices(limit=limit, offset=offset)['invoices']
         except Exception as e:
             logger.error(f"获取发票列表失败: {e}")
             return []
     
+    def _get_stats(self) -> InvoiceStats:
+        """获取增量统计；统计文件缺失或与CSV不一致时由全表数据重建
+
+        调用方需持有 _append_lock
+        """
+        state = self._get_append_state()
+        stats = state.get('stats') or InvoiceStats.load(self.stats_path, state['signature'])
+        if stats is None or stats.extremes_stale:
+            stats = InvoiceStats.from_records(self._load_data())
+            stats.save(self.stats_path, state['signature'])
+            logger.info(f"已重建统计信息: {self.stats_path}")
+        state['stats'] = stats
+        return stats
+    
     def get_invoice_stats(self) -> Dict[str, Any]:
-        """获取发票统计信息"""
+        """获取发票统计信息（读取增量维护的统计，不扫描全表）"""
         try:
-            data = self._load_data()
-            
-            if not data:
-                return {
-                    'total_invoices': 0,
-                    'total_amount': 0.0,
-                    'avg_amount': 0.0,
-                    'processed_count': 0
-                }
-            
-            # 计算统计信息
-            total_invoices = len(data)
-            processed_count = len([row for row in data if row.get('processed')])
-            
-            # 金额统计
-            valid_amounts = []
-            for row in data:
-                amount = row.get('total_amount')
-                if amount and isinstance(amount, (int, float)):
-                    valid_amounts.append(amount)
-            
-            total_amount = sum(valid_amounts) if valid_amounts else 0.0
-            avg_amount = total_amount / len(valid_amounts) if valid_amounts else 0.0
-            
-            return {
-                'total_invoices': total_invoices,
-                'total_amount': float(total_amount),
-                'avg_amount': float(avg_amount),
-                'processed_count': processed_count
-            }
-            
+            with _append_lock:
+                return self._get_stats().summary()
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
-            return {
-                'total_invoices': 0,
-                'total_amount': 0.0,
-                'avg_amount': 0.0,
-                'processed_count': 0
-            }
+            return InvoiceStats().summary()
     
     def delete_invoice_by_file_path(self, file_path: str) -> bool:
         """根据文件路径删除发票记录"""
         try:
-            data = self._load_data()
-            original_len = len(data)
-            
-            # 删除匹配的记录
-            data = [row for row in data if row.get('file_path') != file_path]
-            
-            if len(data) < original_len:
-                self._save_data(data)
-                logger.info(f"删除发票记录成功: {file_path}")
-                return True
-            else:
-                logger.warning(f"未找到要删除的发票记录: {file_path}")
-                return False
+            with _append_lock:
+                data = self._load_data()
+                original_len = len(data)
+                
+                # 删除匹配的记录
+                data = [row for row in data if row.get('file_path') != file_path]
+                
+                if len(data) < original_len:
+                    self._save_data(data)
+                    logger.info(f"删除发票记录成功: {file_path}")
+                    return True
+                else:
+                    logger.warning(f"未找到要删除的发票记录: {file_path}")
+                    return False
                 
         except Exception as e:
             logger.error(f"删除发票记录失败: {e}")
             return False
     
+    def iter_invoices(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """按文件顺序分批返回全部记录（开始时读取一次快照，迭代期间的写入不影响本次遍历）"""
+        data = self._load_data()
+        for start in range(0, len(data), batch_size):
+            yield data[start:start + batch_size]
+    
+    def update_invoices(self, updates: List[Dict[str, Any]]) -> int:
+        """按ID批量更新字段（整体重写一次文件），每项为 {'id': ID, 字段: 新值, ...}，返回更新的记录数"""
+        if not updates:
+            return 0
+        
+        updates_by_id = {update['id']: update for update in updates}
+        now = datetime.now().isoformat()
+        updated = 0
+        with _append_lock:
+            data = self._load_data()
+            for row in data:
+                update = updates_by_id.get(row.get('id'))
+                if update is None:
+                    continue
+                for key, value in update.items():
+                    if key in self.columns and key != 'id':
+                        row[key] = value
+                row['updated_at'] = now
+                updated += 1
+            
+            if updated:
+                self._save_data(data)
+        
+        logger.info(f"批量更新发票记录: {updated} 条")
+        return updated
+    
     def export_to_csv(self, export_path: str = None) -> str:
         """导出数据到CSV文件"""
         try:
@@ -252,13 +473,7 @@ class CSVStorageService:
                     writer = csv.DictWriter(f, fieldnames=self.columns)
                     writer.writeheader()
                     for row in data:
-                        clean_row = {}
-                        for col in self.columns:
-                            value = row.get(col, '')
-                            if isinstance(value, (dict, list)):
-                                value = json.dumps(value, ensure_ascii=False)
-                            clean_row[col] = value
-                        writer.writerow(clean_row)
+                        writer.writerow(self._clean_row(row))
             
             logger.info(f"数据导出成功: {export_path}")
             return export_path
@@ -6,7 +6,9 @@ import shutil
 import logging
 from datetime import datetime
 from typing import Dict, Optional, List, Tuple
-import json
+
+from .error_log import get_error_log
+from .unrecognized_index import get_unrecognized_index
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +18,19 @@ class ErrorHandlingService:
     def __init__(self, base_dir: str = "invoices"):
         self.base_dir = base_dir
         self.unrecognized_dir = os.path.join(base_dir, "unrecognized")
-        self.error_log_file = os.path.join(base_dir, "error_log.json")
+        self.error_log_file = os.path.join(base_dir, "error_log.jsonl")
         
         # 创建必要的目录
         self._ensure_directories()
         
+        # 追加写的错误日志（旧版 error_log.json 首次使用时自动转换）
+        self.error_log = get_error_log(self.error_log_file, os.path.join(base_dir, "error_log.json"))
+        
+        # 隔离文件索引（列表和报告不再遍历未识别目录）
+        self.unrecognized_index = get_unrecognized_index(
+            self.unrecognized_dir, os.path.join(base_dir, "unrecognized_index.jsonl")
+        )
+        
         # 识别质量阈值
         self.quality_thresholds = {
             'min_fields_required': 4,  # 至少需要4个关键字段
@@ -218,6 +228,10 @@ class ErrorHandlingService:
             
             # 记录错误信息
             self._log_error(file_path, target_path, invoice_info, error_reason, confidence_score, error_type)
+            try:
+                self.unrecognized_index.add(target_path, error_type, error_reason, confidence_score)
+            except Exception as e:
+                logger.error(f"更新未识别文件索引失败: {e}")
             
             logger.warning(f"发票移入未识别目录: {file_path} -> {target_path} (原因: {error_reason})")
             
@@ -260,60 +274,48 @@ class ErrorHandlingService:
             'file_size': os.path.getsize(new_path) if os.path.exists(new_path) else 0
         }
         
-        # 读取现有日志
-        error_log = []
-        if os.path.exists(self.error_log_file):
-            try:
-                with open(self.error_log_file, 'r', encoding='utf-8') as f:
-                    error_log = json.load(f)
-            except:
-                error_log = []
-        
-        # 添加新记录
-        error_log.append(error_entry)
-        
-        # 保持最近1000条记录
-        if len(error_log) > 1000:
-            error_log = error_log[-1000:]
-        
-        # 写入日志文件
+        # 追加一行，不读取和重写已有日志
         try:
-            with open(self.error_log_file, 'w', encoding='utf-8') as f:
-                json.dump(error_log, f, ensure_ascii=False, indent=2)
+            self.error_log.append(error_entry)
         except Exception as e:
             logger.error(f"写入错误日志失败: {e}")
     
     def get_error_statistics(self) -> Dict:
-        """获取错误统计信息"""
-        
-        if not os.path.exists(self.error_log_file):
-            return {}
-        
+        """获取错误统计信息（增量维护的计数器）"""
         try:
-            with open(self.error_log_file, 'r', encoding='utf-8') as f:
-                error_log = json.load(f)
-        except:
+            return self.error_log.statistics()
+        except Exception as e:
+            logger.error(f"读取错误统计失败: {e}")
             return {}
-        
-        # 统计各类错误
-        stats = {
-            'total_errors': len(error_log),
-            'error_types': {},
-            'recent_errors': error_log[-10:] if error_log else [],
-            'avg_confidence': 0.0
-        }
-        
-        if error_log:
-            # 按错误类型统计
-            for entry in error_log:
-                error_type = entry.get('error_type', 'unknown')
-                stats['error_types'][error_type] = stats['error_types'].get(error_type, 0) + 1
-            
-            # 计算平均置信度
-            confidences = [entry.get('confidence_score', 0) for entry in error_log]
-            stats['avg_confidence'] = sum(confidences) / len(confidences)
-        
-        return stats
+    
+    def list_unrecognized_files(self, **filters) -> Dict:
+        """分页列出未识别文件（参数见 UnrecognizedIndex.list_files）"""
+        return self.unrecognized_index.list_files(**filters)
+    
+    def is_unrecognized_path(self, file_path: str) -> bool:
+        """路径是否位于未识别目录中"""
+        root = os.path.realpath(self.unrecognized_dir)
+        return os.path.commonpath([root, os.path.realpath(file_path)]) == root
+    
+    def delete_unrecognized_file(self, file_path: str):
+        """删除未识别文件并更新索引"""
+        os.remove(file_path)
+        self.unrecognized_index.remove(file_path)
+    
+    def clear_unrecognized_files(self) -> int:
+        """删除未识别目录中的全部文件（保留报告和日志），返回删除的文件数"""
+        deleted_count = 0
+        for root, dirs, files in os.walk(self.unrecognized_dir):
+            for file in files:
+                if not file.endswith(('.txt', '.json')):
+                    file_path = os.path.join(root, file)
+                    try:
+                        os.remove(file_path)
+                        deleted_count += 1
+                    except Exception as e:
+                        logger.warning(f"删除文件失败: {file_path}, 错误: {e}")
+        self.unrecognized_index.clear()
+        return deleted_count
     
     def create_manual_review_report(self) -> str:
         """创建人工审核报告"""
@@ -321,6 +323,7 @@ class ErrorHandlingService:
         report_path = os.path.join(self.unrecognized_dir, "manual_review_report.txt")
         
         stats = self.get_error_statistics()
+        listing = self.unrecognized_index.list_files(sort_order='asc', limit=None)
         
         with open(report_path, 'w', encoding='utf-8') as f:
             f.write("发票识别错误处理报告\n")
@@ -334,15 +337,14 @@ class ErrorHandlingService:
             for error_type, count in stats.get('error_types', {}).items():
                 f.write(f"  {error_type}: {count}\n")
             
-            f.write("\n未识别文件目录结构:\n")
-            for root, dirs, files in os.walk(self.unrecognized_dir):
-                level = root.replace(self.unrecognized_dir, '').count(os.sep)
-                indent = ' ' * 2 * level
-                f.write(f"{indent}{os.path.basename(root)}/\n")
-                subindent = ' ' * 2 * (level + 1)
-                for file in files:
-                    if not file.endswith('.txt'):
-                        f.write(f"{subindent}{file}\n")
+            f.write(f"\n未识别文件 ({listing['total_count']}):\n")
+            files_by_category: Dict[str, List[Dict]] = {}
+            for entry in listing['files']:
+                files_by_category.setdefault(entry['category'], []).append(entry)
+            for category, entries in sorted(files_by_category.items()):
+                f.write(f"  {category}/ ({len(entries)})\n")
+                for entry in entries:
+                    f.write(f"    {entry['file_name']}\n")
         
         logger.info(f"人工审核报告已生成: {report_path}")
         return report_path
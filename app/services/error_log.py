@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 统计中返回的最近错误条数
+RECENT_ERRORS = 10
+
+# 进程内共享的错误日志：日志路径 -> ErrorLog（同一文件的计数器只维护一份）
+_logs: Dict[str, "ErrorLog"] = {}
+_logs_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        logger.warning(f"{name} 配置无效: {value}，使用默认值 {default}")
+        return default
+    return number if number > 0 else default
+
+
+class ErrorLog:
+    """追加写的JSONL错误日志
+
+    写入：每条记录编码为一行后以 O_APPEND 一次 os.write 追加，内核保证多线程和多个识别进程的并发追加
+    不会互相覆盖，写入路径不加锁也不读取已有内容；文件超过 max_bytes 后轮转为 .1 ~ .N。
+    统计：计数器只增量读取上次位置之后新增的行（首次使用时解析一次保留的轮转文件），不重复解析整个文件。
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, backups: Optional[int] = None):
+        self.path = path
+        self.max_bytes = max_bytes or _env_int('ERROR_LOG_MAX_BYTES', 5 * 1024 * 1024)
+        self.backups = backups or _env_int('ERROR_LOG_BACKUPS', 3)
+
+        # 读取侧状态（由 _lock 保护）
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self.total_errors = 0
+        self.error_types: Dict[str, int] = {}
+        self._confidence_sum = 0.0
+        self._recent = deque(maxlen=RECENT_ERRORS)
+
+    def _backup_path(self, index: int) -> str:
+        return f"{self.path}.{index}"
+
+    def append(self, entry: Dict[str, Any]):
+        """追加一条错误记录"""
+        line = (json.dumps(entry, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            stat = os.fstat(fd)
+        finally:
+            os.close(fd)
+        if stat.st_size >= self.max_bytes:
+            self._rotate(stat.st_ino)
+
+    def _rotate(self, inode: int):
+        """按大小轮转：error_log.jsonl -> .1 -> .2 ...，超出保留数量的最旧文件被覆盖"""
+        try:
+            # 已被其他写入方轮转时不再重复轮转
+            if os.stat(self.path).st_ino != inode:
+                return
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(self._backup_path(index)):
+                    os.replace(self._backup_path(index), self._backup_path(index + 1))
+            os.replace(self.path, self._backup_path(1))
+            logger.info(f"错误日志已轮转: {self.path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"错误日志轮转失败: {e}")
+
+    def _consume(self, path: str, offset: int) -> int:
+        """读取 offset 之后的完整行计入计数器，返回新的读取位置（末尾未写完的行留待下次）"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return offset
+        end = data.rfind(b'\n') + 1
+        for raw in data[:end].splitlines():
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            self.total_errors += 1
+            error_type = entry.get('error_type', 'unknown')
+            self.error_types[error_type] = self.error_types.get(error_type, 0) + 1
+            try:
+                self._confidence_sum += float(entry.get('confidence_score') or 0)
+            except (TypeError, ValueError):
+                pass
+            self._recent.append(entry)
+        return offset + end
+
+    def _catch_up(self):
+        """计入其他线程或进程新追加的记录（调用方需持有 _lock）"""
+        if not self._loaded:
+            for index in range(self.backups, 0, -1):
+                self._consume(self._backup_path(index), 0)
+            self._loaded = True
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._inode:
+            # 当前文件已轮转（可能不止一次）：读完旧文件中尚未计入的部分，以及其后轮转出的文件
+            if self._inode is not None:
+                for index in range(self.backups, 0, -1):
+                    try:
+                        inode = os.stat(self._backup_path(index)).st_ino
+                    except FileNotFoundError:
+                        continue
+                    if inode == self._inode:
+                        self._consume(self._backup_path(index), self._offset)
+                        for newer in range(index - 1, 0, -1):
+                            self._consume(self._backup_path(newer), 0)
+                        break
+            self._inode = stat.st_ino
+            self._offset = 0
+        elif stat.st_size < self._offset:
+            self._offset = 0
+        if stat.st_size > self._offset:
+            self._offset = self._consume(self.path, self._offset)
+
+    def statistics(self) -> Dict[str, Any]:
+        """错误统计：总数、按类型计数、最近的错误和平均置信度"""
+        with self._lock:
+            self._catch_up()
+            return {
+                'total_errors': self.total_errors,
+                'error_types': dict(self.error_types),
+                'recent_errors': list(self._recent),
+                'avg_confidence': self._confidence_sum / self.total_errors if self.total_errors else 0.0
+            }
+
+
+def _migrate_legacy_log(legacy_path: str, path: str):
+    """旧版整体重写的 error_log.json 转换为JSONL（仅在新日志尚不存在时执行一次）"""
+    if not os.path.exists(legacy_path) or os.path.exists(path):
+        return
+    try:
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries if isinstance(entries, list) else []:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        os.replace(tmp_path, path)
+        os.remove(legacy_path)
+        logger.info(f"旧版错误日志已转换: {legacy_path} -> {path}")
+    except (OSError, ValueError) as e:
+        logger.warning(f"转换旧版错误日志失败: {e}")
+
+
+def get_error_log(path: str, legacy_path: Optional[str] = None) -> ErrorLog:
+    """获取进程内共享的错误日志实例"""
+    key = os.path.abspath(path)
+    with _logs_lock:
+        error_log = _logs.get(key)
+        if error_log is None:
+            if legacy_path:
+                _migrate_legacy_log(legacy_path, path)
+            error_log = _logs[key] = ErrorLog(path)
+        return error_log
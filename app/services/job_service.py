@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import uuid
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingJob:
+    """后台处理任务 - 记录状态、进度事件和执行结果"""
+
+    def __init__(self, job_type: str, max_events: int = 1000):
+        self.job_id = uuid.uuid4().hex
+        self.job_type = job_type
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.progress = {'total': 0, 'completed': 0}
+        self.cancel_event = threading.Event()
+        self.future = None
+
+        # 进度事件（带递增序号，供SSE按序号增量读取）
+        self._events = deque(maxlen=max_events)
+        self._event_seq = 0
+        self._lock = threading.Lock()
+
+    def add_event(self, event_type: str, data: Dict[str, Any]):
+        """追加进度事件"""
+        with self._lock:
+            self._event_seq += 1
+            self._events.append({'seq': self._event_seq, 'event': event_type, 'data': data})
+
+    def get_events(self, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """获取序号大于 after_seq 的事件"""
+        with self._lock:
+            return [event for event in self._events if event['seq'] > after_seq]
+
+    def events_since(self, after_seq: int = 0) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+        """SSE续传：获取序号大于 after_seq 的事件
+
+        after_seq 之后的事件已有部分被丢弃（或序号超出已产生的范围）时无法无缝续传，
+        返回保留的全部事件以及它们之前的序号，调用方应先推送 reset 事件让客户端按任务快照重置；
+        可以续传时第一个返回值为 None。
+        """
+        with self._lock:
+            oldest = self._events[0]['seq'] if self._events else self._event_seq + 1
+            if after_seq > self._event_seq or oldest > after_seq + 1:
+                return oldest - 1, list(self._events)
+            return None, [event for event in self._events if event['seq'] > after_seq]
+
+    def report_progress(self, progress: Dict[str, Any]):
+        """处理流程的进度回调：更新计数并记录事件"""
+        if 'total' in progress:
+            self.progress['total'] = progress['total']
+        if 'index' in progress:
+            self.progress['completed'] = progress['index']
+        self.add_event('progress', progress)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    """后台任务管理器 - 任务在独立线程中串行执行，不阻塞事件循环"""
+
+    def __init__(self, max_workers: int = 1, max_history: int = 50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="invoice-job")
+        self.max_history = max_history
+        self.jobs: "OrderedDict[str, ProcessingJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job_type: str, func: Callable[..., Any]) -> ProcessingJob:
+        """提交任务
+
+        func 以关键字参数接收 progress_callback 和 cancel_event，返回值作为任务结果
+        """
+        job = ProcessingJob(job_type)
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._trim_history()
+
+        job.add_event('status', {'status': job.status})
+        job.future = self.executor.submit(self._run_job, job, func)
+        logger.info(f"任务已提交: {job.job_id} ({job_type})")
+        return job
+
+    def _run_job(self, job: ProcessingJob, func: Callable[..., Any]):
+        """在工作线程中执行任务"""
+        if job.cancel_event.is_set():
+            self._finish(job, 'cancelled')
+            return
+
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        job.add_event('status', {'status': job.status})
+
+        try:
+            job.result = func(progress_callback=job.report_progress, cancel_event=job.cancel_event)
+            self._finish(job, 'cancelled' if job.cancel_event.is_set() else 'completed')
+        except Exception as e:
+            logger.error(f"任务执行失败: {job.job_id}, 错误: {e}")
+            job.error = str(e)
+            self._finish(job, 'failed')
+
+    def _finish(self, job: ProcessingJob, status: str):
+        job.status = status
+        job.finished_at = datetime.now().isoformat()
+        job.add_event('done', job.to_dict())
+        logger.info(f"任务结束: {job.job_id}, 状态: {status}")
+
+    def _trim_history(self):
+        """只保留最近的已结束任务（调用方需持有 _lock）"""
+        while len(self.jobs) > self.max_history:
+            oldest_id = next((job_id for job_id, job in self.jobs.items() if job.is_finished), None)
+            if oldest_id is None:
+                break
+            del self.jobs[oldest_id]
+
+    def get_job(self, job_id: str) -> Optional[ProcessingJob]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in reversed(list(self.jobs.values()))]
+
+    def cancel_job(self, job_id: str) -> Optional[ProcessingJob]:
+        """请求取消任务：排队中的任务直接取消，运行中的任务在处理完当前文件后停止"""
+        job = self.get_job(job_id)
+        if job is None or job.is_finished:
+            return job
+
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, 'cancelled')
+        else:
+            job.add_event('status', {'status': 'cancelling'})
+        logger.info(f"已请求取消任务: {job_id}")
+        return job
+
+
+# 全局任务管理器实例
+job_manager = JobManager()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+try:
+    import easyocr
+    EASYOCR_AVAILABLE = True
+except ImportError:
+    EASYOCR_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 进程内共享的模型实例，所有服务实例复用同一个EasyOCR Reader
+_easyocr_reader = None
+_reader_lock = threading.Lock()
+_model_status = {
+    'loaded': False,
+    'warmed_up': False,
+    'error': None,
+    'load_seconds': None
+}
+
+
+def get_easyocr_reader() -> Optional[Any]:
+    """获取共享的EasyOCR Reader（首次调用时加载模型，加载失败返回None）"""
+    global _easyocr_reader
+
+    if _easyocr_reader is not None or not EASYOCR_AVAILABLE:
+        return _easyocr_reader
+
+    with _reader_lock:
+        # 双重检查，避免并发请求重复加载模型
+        if _easyocr_reader is not None or _model_status['error']:
+            return _easyocr_reader
+
+        try:
+            start_time = time.time()
+            # 使用预下载的模型
+            model_storage_dir = os.getenv('EASYOCR_MODULE_PATH', '/home/appuser/.EasyOCR')
+            _easyocr_reader = easyocr.Reader(
+                ['ch_sim', 'en'],
+                gpu=False,  # 强制使用CPU
+                model_storage_directory=model_storage_dir,
+                download_enabled=False  # 不下载，使用预下载的模型
+            )
+            _model_status['loaded'] = True
+            _model_status['load_seconds'] = round(time.time() - start_time, 2)
+            logger.info(f"EasyOCR初始化成功，耗时 {_model_status['load_seconds']} 秒")
+        except Exception as e:
+            _model_status['error'] = str(e)
+            logger.error(f"EasyOCR初始化失败: {e}")
+
+    return _easyocr_reader
+
+
+def warm_up_models() -> bool:
+    """加载模型并执行一次空白图片推理，使首个真实请求无需等待模型初始化"""
+    reader = get_easyocr_reader()
+    if reader is None:
+        return False
+
+    try:
+        import numpy as np
+        reader.readtext(np.zeros((32, 128, 3), dtype=np.uint8))
+        _model_status['warmed_up'] = True
+        logger.info("EasyOCR预热完成")
+        return True
+    except Exception as e:
+        logger.warning(f"EasyOCR预热失败: {e}")
+        return False
+
+
+def is_ocr_ready() -> bool:
+    """OCR模型是否已加载可用"""
+    return _easyocr_reader is not None
+
+
+def get_model_status() -> Dict[str, Any]:
+    """获取模型加载状态"""
+    return {
+        'easyocr_available': EASYOCR_AVAILABLE,
+        'ready': is_ocr_ready(),
+        **_model_status
+    }
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 进程内共享的缓存索引：缓存目录 -> OrderedDict(content_hash -> 文件大小)，按访问时间从旧到新排列
+_cache_indexes: Dict[str, "OrderedDict[str, int]"] = {}
+_index_lock = threading.RLock()
+
+
+class OCRResultCache:
+    """基于文件内容哈希的OCR结果缓存 - 持久化原始文本和识别字段，按总大小LRU淘汰"""
+
+    def __init__(self, cache_dir: str = None, max_size_mb: float = None):
+        self.cache_dir = Path(cache_dir or os.getenv('OCR_CACHE_DIR', './data/ocr_cache'))
+        if max_size_mb is None:
+            max_size_mb = float(os.getenv('OCR_CACHE_MAX_MB', '200'))
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+
+        # 最大容量为0时禁用缓存
+        self.enabled = self.max_size_bytes > 0
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, content_hash: str) -> Path:
+        """缓存文件路径（按哈希前两位分目录，避免单目录文件过多）"""
+        return self.cache_dir / content_hash[:2] / f"{content_hash}.json"
+
+    def _get_index(self) -> "OrderedDict[str, int]":
+        """获取缓存索引，首次使用时扫描缓存目录构建
+
+        调用方需持有 _index_lock
+        """
+        key = str(self.cache_dir.resolve())
+        index = _cache_indexes.get(key)
+        if index is None:
+            entries = []
+            for entry_file in self.cache_dir.glob('*/*.json'):
+                try:
+                    stat = entry_file.stat()
+                    entries.append((stat.st_mtime, entry_file.stem, stat.st_size))
+                except FileNotFoundError:
+                    continue
+            entries.sort()
+            index = OrderedDict((content_hash, size) for _, content_hash, size in entries)
+            _cache_indexes[key] = index
+            logger.info(f"OCR缓存索引已加载: {len(index)} 条，目录: {self.cache_dir}")
+        return index
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希读取缓存，命中时刷新访问时间"""
+        if not self.enabled or not content_hash:
+            return None
+
+        entry_path = self._entry_path(content_hash)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError) as e:
+            logger.warning(f"OCR缓存文件损坏，已忽略: {entry_path}, 错误: {e}")
+            return None
+
+        # 记录访问时间（用于重启后恢复LRU顺序）
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        with _index_lock:
+            index = self._get_index()
+            if content_hash in index:
+                index.move_to_end(content_hash)
+
+        logger.info(f"OCR缓存命中: {content_hash}")
+        return entry
+
+    def put(self, content_hash: str, raw_text: str, fields: Dict[str, Any], engine_version: str):
+        """写入缓存并按总大小淘汰最久未使用的条目"""
+        if not self.enabled or not content_hash:
+            return
+
+        entry = {
+            'content_hash': content_hash,
+            'engine_version': engine_version,
+            'raw_text': raw_text,
+            'fields': fields,
+            'cached_at': datetime.now().isoformat()
+        }
+
+        entry_path = self._entry_path(content_hash)
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, entry_path)
+            size = entry_path.stat().st_size
+        except Exception as e:
+            logger.warning(f"写入OCR缓存失败: {content_hash}, 错误: {e}")
+            return
+
+        with _index_lock:
+            index = self._get_index()
+            index[content_hash] = size
+            index.move_to_end(content_hash)
+            self._evict(index)
+
+    def _evict(self, index: "OrderedDict[str, int]"):
+        """淘汰最久未使用的条目直到总大小不超过上限
+
+        调用方需持有 _index_lock
+        """
+        total_size = sum(index.values())
+        while total_size > self.max_size_bytes and len(index) > 1:
+            content_hash, size = index.popitem(last=False)
+            total_size -= size
+            try:
+                self._entry_path(content_hash).unlink()
+            except FileNotFoundError:
+                pass
+            logger.debug(f"淘汰OCR缓存: {content_hash}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        if not self.enabled:
+            return {'enabled': False, 'entries': 0, 'size_bytes': 0, 'max_size_bytes': 0}
+
+        with _index_lock:
+            index = self._get_index()
+            return {
+                'enabled': True,
+                'entries': len(index),
+                'size_bytes': sum(index.values()),
+                'max_size_bytes': self.max_size_bytes
+            }
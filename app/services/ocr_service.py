@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import os
 import re
 import logging
@@ -39,11 +40,7 @@ class OCRService:
         try:
             # 使用PIL打开图片
             image = Image.open(image_path)
-
-            # 使用Tesseract进行OCR识别
-            # 配置OCR参数，优化中文识别
-            custom_config = r'--oem 3 --psm 6 -l chi_sim+eng'
-            text = pytesseract.image_to_string(image, config=custom_config)
+            text = self._read_image_text(image)
 
             logger.info(f"从图片 {image_path} 提取文本成功，长度: {len(text)}")
             return text
@@ -52,10 +49,21 @@ class OCRService:
             logger.error(f"从图片 {image_path} 提取文本失败: {e}")
             return ""
     
+    def _read_image_text(self, image) -> str:
+        """使用Tesseract进行OCR识别"""
+        # 配置OCR参数，优化中文识别
+        custom_config = r'--oem 3 --psm 6 -l chi_sim+eng'
+        return pytesseract.image_to_string(image, config=custom_config)
+
+    def _read_png_text(self, png: bytes) -> str:
+        """识别PDF渲染出的单页PNG"""
+        return self._read_image_text(Image.open(io.BytesIO(png)))
+    
     def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """从PDF中提取文本 - 使用轻量级PDF处理器"""
+        """从PDF中提取文本 - 使用轻量级PDF处理器，扫描件渲染页面后用Tesseract识别"""
         try:
-            return self.pdf_processor.extract_text_from_pdf(pdf_path)
+            ocr_page = self._read_png_text if TESSERACT_AVAILABLE else None
+            return self.pdf_processor.extract_text_from_pdf(pdf_path, ocr_page=ocr_page)
         except Exception as e:
             logger.error(f"从PDF {pdf_path} 提取文本失败: {e}")
             return ""
@@ -13,15 +13,12 @@ try:
 except ImportError:
     PIL_AVAILABLE = False
 
-try:
-    import easyocr
-    EASYOCR_AVAILABLE = True
-except ImportError:
-    EASYOCR_AVAILABLE = False
-
-from .invoice_recognition_engine import InvoiceRecognitionEngine
+from .invoice_recognition_engine import InvoiceRecognitionEngine, ENGINE_VERSION
 from .error_handling_service import ErrorHandlingService
 from .pdf_processor import PDFProcessor
+from .model_registry import EASYOCR_AVAILABLE, get_easyocr_reader
+from .ocr_cache_service import OCRResultCache
+from .file_service import file_service
 
 logger = logging.getLogger(__name__)
 
@@ -32,23 +29,12 @@ class OCRServiceLite:
         self.engine = InvoiceRecognitionEngine()
         self.error_handler = ErrorHandlingService()
         self.pdf_processor = PDFProcessor()
-        
-        # 初始化EasyOCR
-        self.easyocr_reader = None
-        if EASYOCR_AVAILABLE:
-            try:
-                # 使用预下载的模型
-                model_storage_dir = os.getenv('EASYOCR_MODULE_PATH', '/home/appuser/.EasyOCR')
-                self.easyocr_reader = easyocr.Reader(
-                    ['ch_sim', 'en'], 
-                    gpu=False,  # 强制使用CPU
-                    model_storage_directory=model_storage_dir,
-                    download_enabled=False  # 不下载，使用预下载的模型
-                )
-                logger.info("EasyOCR初始化成功")
-            except Exception as e:
-                logger.error(f"EasyOCR初始化失败: {e}")
-                self.easyocr_reader = None
+        self.result_cache = OCRResultCache()
+    
+    @property
+    def easyocr_reader(self):
+        """共享的EasyOCR Reader（进程内只加载一次，首次使用时初始化）"""
+        return get_easyocr_reader()
     
     def extract_text_from_image(self, image_path: str) -> str:
         """从图片中提取文本 - 使用EasyOCR"""
@@ -57,16 +43,7 @@ class OCRServiceLite:
             return ""
 
         try:
-            # 使用EasyOCR进行文本识别
-            results = self.easyocr_reader.readtext(image_path)
-            
-            # 提取文本内容
-            text_lines = []
-            for (bbox, text, confidence) in results:
-                if confidence > 0.5:  # 置信度阈值
-                    text_lines.append(text)
-            
-            text = '\n'.join(text_lines)
+            text = self._read_image_text(image_path)
             logger.info(f"从图片 {image_path} 提取文本成功，长度: {len(text)}")
             return text
 
@@ -74,10 +51,24 @@ class OCRServiceLite:
             logger.error(f"从图片 {image_path} 提取文本失败: {e}")
             return ""
     
+    def _read_image_text(self, image) -> str:
+        """EasyOCR识别图片文本（image 为图片路径或PNG字节）"""
+        reader = self.easyocr_reader
+        if not reader:
+            return ""
+
+        # 提取文本内容
+        text_lines = []
+        for (bbox, text, confidence) in reader.readtext(image):
+            if confidence > 0.5:  # 置信度阈值
+                text_lines.append(text)
+        return '\n'.join(text_lines)
+    
     def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """从PDF中提取文本 - 使用轻量级PDF处理器"""
+        """从PDF中提取文本 - 使用轻量级PDF处理器，扫描件渲染页面后用EasyOCR识别"""
         try:
-            return self.pdf_processor.extract_text_from_pdf(pdf_path)
+            ocr_page = self._read_image_text if EASYOCR_AVAILABLE else None
+            return self.pdf_processor.extract_text_from_pdf(pdf_path, ocr_page=ocr_page)
         except Exception as e:
             logger.error(f"从PDF {pdf_path} 提取文本失败: {e}")
             return ""
@@ -106,13 +97,24 @@ class OCRServiceLite:
             logger.error(f"提取发票信息失败: {e}")
             return {}
     
-    def process_invoice_file(self, file_path: str) -> Dict:
-        """处理发票文件 - 完整流程"""
+    def process_invoice_file(self, file_path: str, file_hash: Optional[str] = None) -> Dict:
+        """处理发票文件 - 完整流程
+
+        Args:
+            file_hash: 调用方已计算的文件内容哈希，未传入时在此计算
+        """
         logger.info(f"开始处理发票文件: {file_path}")
 
         try:
+            # 0. 按文件内容哈希查询缓存，相同内容不重复OCR
+            content_hash = file_hash or file_service.get_file_hash(file_path)
+            cached = self.result_cache.get(content_hash)
+
             # 1. 提取文本
-            text = self.extract_text_from_file(file_path)
+            if cached and cached.get('raw_text'):
+                text = cached['raw_text']
+            else:
+                text = self.extract_text_from_file(file_path)
 
             if not text.strip():
                 logger.warning(f"从文件 {file_path} 中未提取到文本")
@@ -122,14 +124,19 @@ class OCRServiceLite:
                 )
                 return {}
 
-            # 2. 提取发票信息
-            invoice_info = self.extract_invoice_info(text)
+            # 2. 提取发票信息（识别规则版本一致时直接复用缓存字段）
+            if cached and cached.get('engine_version') == ENGINE_VERSION and cached.get('fields'):
+                invoice_info = dict(cached['fields'])
+            else:
+                invoice_info = self.extract_invoice_info(text)
+                self.result_cache.put(content_hash, text, invoice_info, ENGINE_VERSION)
 
             # 3. 添加原始文本和文件信息
             invoice_info['raw_text'] = text
             invoice_info['file_path'] = file_path
             invoice_info['file_name'] = os.path.basename(file_path)
             invoice_info['file_type'] = os.path.splitext(file_path)[1].lower()
+            invoice_info['file_hash'] = content_hash
 
             # 4. 质量检查和错误处理
             is_valid, error_reason, confidence_score = self.error_handler.evaluate_recognition_quality(
@@ -1,19 +1,122 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import os
+import re
+import time
 import logging
+import threading
 import subprocess
-from typing import Optional
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# 首页可提取字符数少于该值视为没有文本层（扫描件），直接渲染页面做OCR
+TEXT_LAYER_MIN_CHARS = 20
+
+# 进程内记录的文档类别数量上限（按生成工具 Producer/Creator 区分）
+BACKEND_CACHE_SIZE = 256
+
+# 文档类别 -> 上次成功提取文本的方法，按使用时间从旧到新排列
+_backend_cache: "OrderedDict[str, str]" = OrderedDict()
+_backend_lock = threading.Lock()
+
+# 提前结束判定用的关键字段标记（只判断是否出现，字段值仍由识别引擎提取）
+_INVOICE_NUMBER_MARK = re.compile(r'(?:发票号码|号码|Invoice\s*No)[：:\s]*\d{8,20}')
+_TOTAL_AMOUNT_MARK = re.compile(r'(?:小写|价税合计)[\s\S]{0,40}?\d[\d,]*\.\d{2}')
+# 合计行：不含税金额和税额（免税发票税额为 ***），排除"价税合计"
+_SUBTOTAL_MARK = re.compile(r'(?<!税)合\s*计[\s\S]{0,40}?\d[\d,]*\.\d{2}[\s\S]{0,40}?(?:\d[\d,]*\.\d{2}|\*{3})')
+# 税号只认 纳税人识别号/统一社会信用代码 标签后的值，开户行账号等长数字串不计入
+_TAX_NUMBER_MARK = re.compile(r'(?:纳税人识别号|统一社会信用代码)[^0-9A-Za-z]{0,20}?([0-9A-Z]{15,20})(?![0-9A-Z])')
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        logger.warning(f"{name} 配置无效: {value}，使用默认值 {default}")
+        return default
+    return number if number >= 0 else default
+
+
+def _document_class(metadata: Dict[str, Any]) -> Optional[str]:
+    """以生成工具（Producer/Creator）区分文档类别，同一开票平台生成的PDF结构相同"""
+    producer = str(metadata.get('producer') or '').strip()
+    creator = str(metadata.get('creator') or '').strip()
+    if not producer and not creator:
+        return None
+    return f"{producer} | {creator}"[:200]
+
+
+def _cached_backend(document_class: Optional[str]) -> Optional[str]:
+    if document_class is None:
+        return None
+    with _backend_lock:
+        method = _backend_cache.get(document_class)
+        if method is not None:
+            _backend_cache.move_to_end(document_class)
+        return method
+
+
+def _remember_backend(document_class: Optional[str], method: str):
+    if document_class is None:
+        return
+    with _backend_lock:
+        _backend_cache[document_class] = method
+        _backend_cache.move_to_end(document_class)
+        while len(_backend_cache) > BACKEND_CACHE_SIZE:
+            _backend_cache.popitem(last=False)
+
+
+class _KeyFieldTracker:
+    """逐页记录发票号码、价税合计、合计行（不含税金额和税额）和购销双方税号是否已出现"""
+
+    def __init__(self):
+        self.invoice_number = False
+        self.total_amount = False
+        self.subtotal = False
+        self.tax_numbers = set()
+
+    def feed(self, page_text: str):
+        if not self.invoice_number:
+            self.invoice_number = _INVOICE_NUMBER_MARK.search(page_text) is not None
+        if not self.total_amount:
+            self.total_amount = _TOTAL_AMOUNT_MARK.search(page_text) is not None
+        if not self.subtotal:
+            self.subtotal = _SUBTOTAL_MARK.search(page_text) is not None
+        if len(self.tax_numbers) < 2:
+            for tax in _TAX_NUMBER_MARK.findall(page_text):
+                # 与识别引擎一致：20位纯数字为发票号码而不是税号
+                if not (len(tax) == 20 and tax.isdigit()):
+                    self.tax_numbers.add(tax)
+
+    @property
+    def complete(self) -> bool:
+        return self.invoice_number and self.total_amount and self.subtotal and len(self.tax_numbers) >= 2
+
+
 class PDFProcessor:
-    """PDF处理器 - 轻量级PDF文本提取"""
+    """PDF处理器 - 轻量级PDF文本提取
+
+    电子发票通常只有一页，多页PDF一般第1页为发票、其后为附件（清单、行程单等）。
+    逐页提取时一旦发票号码、价税合计、不含税金额和税额以及购销双方税号都已出现即停止读取后续页面（early_exit），
+    PDF_MAX_PAGES 可进一步限制最多读取的页数（0=不限制）。
+
+    提取前先读取首页字符数和文档生成工具：没有文本层的扫描件不再逐个尝试文本提取方法，
+    直接渲染页面交给OCR；有文本层时优先使用同一生成工具的文档上次成功的方法。
+    """
     
-    def __init__(self):
+    def __init__(self, max_pages: Optional[int] = None, early_exit: bool = True):
         self.available_methods = self._check_available_methods()
+        self.max_pages = _env_int('PDF_MAX_PAGES', 0) if max_pages is None else max_pages
+        self.ocr_dpi = _env_int('PDF_OCR_DPI', 200) or 200
+        self.early_exit = early_exit
         logger.info(f"可用的PDF处理方法: {self.available_methods}")
     
     def _check_available_methods(self) -> list:
@@ -48,23 +151,56 @@ class PDFProcessor:
         
         return methods
     
+    def _collect_pages(self, method: str, page_count: int, read_page: Callable[[int], Optional[str]]) -> str:
+        """逐页读取文本并记录每页耗时，达到页数上限或关键字段已齐全时停止"""
+        limit = min(page_count, self.max_pages) if self.max_pages > 0 else page_count
+        tracker = _KeyFieldTracker() if self.early_exit else None
+        parts = []
+        page_times = []
+        started = time.perf_counter()
+
+        for page_num in range(limit):
+            page_started = time.perf_counter()
+            page_text = read_page(page_num) or ""
+            page_times.append((time.perf_counter() - page_started) * 1000)
+            logger.debug(f"{method} 第 {page_num + 1}/{page_count} 页: {len(page_text)} 字符, {page_times[-1]:.1f}ms")
+
+            if page_text:
+                parts.append(page_text)
+            if tracker is not None:
+                tracker.feed(page_text)
+                if tracker.complete:
+                    break
+
+        text = "\n".join(parts) + "\n" if parts else ""
+        pages_read = len(page_times)
+        logger.info(
+            f"{method}提取文本成功，长度: {len(text)}，读取 {pages_read}/{page_count} 页，"
+            f"耗时 {(time.perf_counter() - started) * 1000:.1f}ms"
+            + (f"（最慢一页 {max(page_times):.1f}ms）" if page_times else "")
+        )
+        return text
+
+    def _read_pymupdf(self, doc, first_page_text: Optional[str] = None) -> str:
+        """从已打开的PyMuPDF文档逐页提取文本，first_page_text 为探测时已读取的首页文本"""
+        def read_page(page_num: int) -> str:
+            if page_num == 0 and first_page_text is not None:
+                return first_page_text
+            return doc.load_page(page_num).get_text()
+
+        return self._collect_pages('PyMuPDF', len(doc), read_page)
+
+    def _read_pdfplumber(self, pdf) -> str:
+        """从已打开的pdfplumber文档逐页提取文本（探测时已解析的首页对象会被复用）"""
+        return self._collect_pages('pdfplumber', len(pdf.pages), lambda page_num: pdf.pages[page_num].extract_text())
+
     def extract_text_with_pymupdf(self, pdf_path: str) -> str:
         """使用PyMuPDF提取文本"""
         try:
             import fitz
             
-            text = ""
-            doc = fitz.open(pdf_path)
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                page_text = page.get_text()
-                text += page_text + "\n"
-            
-            doc.close()
-            
-            logger.info(f"PyMuPDF提取文本成功，长度: {len(text)}")
-            return text
+            with fitz.open(pdf_path) as doc:
+                return self._read_pymupdf(doc)
             
         except Exception as e:
             logger.error(f"PyMuPDF提取文本失败: {e}")
@@ -75,15 +211,8 @@ class PDFProcessor:
         try:
             import pdfplumber
             
-            text = ""
             with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            
-            logger.info(f"pdfplumber提取文本成功，长度: {len(text)}")
-            return text
+                return self._read_pdfplumber(pdf)
             
         except Exception as e:
             logger.error(f"pdfplumber提取文本失败: {e}")
@@ -92,11 +221,13 @@ class PDFProcessor:
     def extract_text_with_pdftotext(self, pdf_path: str) -> str:
         """使用pdftotext命令行工具提取文本"""
         try:
-            # 使用pdftotext命令
+            # 使用pdftotext命令（一次调用输出整个文档，只能按页数上限截断）
+            page_range = ['-l', str(self.max_pages)] if self.max_pages > 0 else []
             result = subprocess.run([
                 'pdftotext', 
                 '-layout',  # 保持布局
                 '-enc', 'UTF-8',  # 指定编码
+                *page_range,
                 pdf_path, 
                 '-'  # 输出到stdout
             ], capture_output=True, text=True, timeout=30)
@@ -116,8 +247,111 @@ class PDFProcessor:
             logger.error(f"pdftotext提取文本失败: {e}")
             return ""
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """从PDF提取文本 - 自动选择最佳方法"""
+    def _open_document(self, pdf_path: str):
+        """用PyMuPDF（优先）或pdfplumber打开PDF，供探测、文本提取和渲染共用
+
+        Returns:
+            (方法, 文档)；两者都不可用或打开失败时为 (None, None)
+        """
+        try:
+            if 'pymupdf' in self.available_methods:
+                import fitz
+                return 'pymupdf', fitz.open(pdf_path)
+            if 'pdfplumber' in self.available_methods:
+                import pdfplumber
+                return 'pdfplumber', pdfplumber.open(pdf_path)
+        except Exception as e:
+            logger.warning(f"打开PDF失败: {pdf_path}, 错误: {e}")
+        return None, None
+
+    def _probe_document(self, backend: Optional[str], doc) -> Dict[str, Any]:
+        """在已打开的文档上探测文本层和文档类别，PyMuPDF读取的首页文本一并返回供提取复用"""
+        probe = {'has_text_layer': None, 'document_class': None, 'page_count': 0, 'first_page_text': None}
+        try:
+            if backend == 'pymupdf':
+                metadata = doc.metadata or {}
+                probe['page_count'] = len(doc)
+                probe['first_page_text'] = doc.load_page(0).get_text() if len(doc) else ""
+                chars = len(probe['first_page_text'].strip())
+            elif backend == 'pdfplumber':
+                metadata = {str(key).lower(): value for key, value in (doc.metadata or {}).items()}
+                probe['page_count'] = len(doc.pages)
+                chars = len(doc.pages[0].chars) if doc.pages else 0
+            else:
+                return probe
+        except Exception as e:
+            logger.warning(f"探测PDF文本层失败: {e}")
+            return probe
+
+        probe['has_text_layer'] = chars >= TEXT_LAYER_MIN_CHARS
+        probe['document_class'] = _document_class(metadata)
+        return probe
+
+    def probe_text_layer(self, pdf_path: str) -> Dict[str, Any]:
+        """探测PDF是否有文本层（只读取首页字符数）以及文档类别
+
+        Returns:
+            {'has_text_layer': True/False（无法探测时为None）, 'document_class': 生成工具, 'page_count': 页数}
+        """
+        backend, doc = self._open_document(pdf_path)
+        try:
+            probe = self._probe_document(backend, doc)
+        finally:
+            if doc is not None:
+                doc.close()
+        probe.pop('first_page_text')
+        return probe
+
+    def _ocr_document(self, backend: Optional[str], doc, ocr_page: Callable[[bytes], str]) -> str:
+        """在已打开的文档上渲染页面为PNG后逐页OCR"""
+        try:
+            if backend == 'pymupdf':
+                return self._collect_pages(
+                    'PyMuPDF渲染+OCR', len(doc),
+                    lambda page_num: ocr_page(doc.load_page(page_num).get_pixmap(dpi=self.ocr_dpi).tobytes('png'))
+                )
+
+            if backend == 'pdfplumber':
+                def render(page) -> bytes:
+                    buffer = io.BytesIO()
+                    page.to_image(resolution=self.ocr_dpi).original.save(buffer, format='PNG')
+                    return buffer.getvalue()
+
+                return self._collect_pages('pdfplumber渲染+OCR', len(doc.pages),
+                                           lambda page_num: ocr_page(render(doc.pages[page_num])))
+
+            logger.warning("没有可用于渲染PDF页面的方法（需要PyMuPDF或pdfplumber）")
+            return ""
+
+        except Exception as e:
+            logger.error(f"PDF页面OCR失败: {e}")
+            return ""
+
+    def extract_text_with_ocr(self, pdf_path: str, ocr_page: Callable[[bytes], str]) -> str:
+        """渲染页面为PNG后逐页OCR（扫描件），同样按页数上限和关键字段提前结束"""
+        backend, doc = self._open_document(pdf_path)
+        try:
+            return self._ocr_document(backend, doc, ocr_page)
+        finally:
+            if doc is not None:
+                doc.close()
+
+    def _ordered_methods(self, document_class: Optional[str]) -> List[str]:
+        """同类文档上次成功的方法排在最前，其余保持原有优先级"""
+        cached = _cached_backend(document_class)
+        if cached not in self.available_methods:
+            return list(self.available_methods)
+        return [cached] + [method for method in self.available_methods if method != cached]
+
+    def extract_text_from_pdf(self, pdf_path: str, ocr_page: Optional[Callable[[bytes], str]] = None) -> str:
+        """从PDF提取文本 - 自动选择最佳方法
+
+        文档只打开一次：探测、同一库的文本提取和页面渲染共用打开的文档，PyMuPDF探测读取的首页文本直接复用。
+
+        Args:
+            pdf_path: PDF文件路径
+            ocr_page: 识别单页PNG图像文本的函数；PDF没有文本层或各方法都未提取到文本时渲染页面逐页OCR
+        """
         if not os.path.exists(pdf_path):
             logger.error(f"PDF文件不存在: {pdf_path}")
             return ""
@@ -125,14 +359,31 @@ class PDFProcessor:
         if not self.available_methods:
             logger.error("没有可用的PDF处理方法")
             return ""
+
+        backend, doc = self._open_document(pdf_path)
+        try:
+            return self._extract_from_document(pdf_path, backend, doc, ocr_page)
+        finally:
+            if doc is not None:
+                doc.close()
+
+    def _extract_from_document(self, pdf_path: str, backend: Optional[str], doc,
+                               ocr_page: Optional[Callable[[bytes], str]]) -> str:
+        probe = self._probe_document(backend, doc)
+        document_class = probe['document_class']
+        if probe['has_text_layer'] is False:
+            # 扫描件：文本提取方法必然失败，直接渲染OCR
+            logger.info(f"PDF没有文本层，跳过文本提取: {pdf_path} (生成工具: {document_class})")
+            return self._ocr_document(backend, doc, ocr_page) if ocr_page else ""
         
-        # 按优先级尝试不同方法
-        for method in self.available_methods:
+        # 同类文档上次成功的方法优先，其余按优先级尝试
+        for method in self._ordered_methods(document_class):
             try:
                 if method == 'pymupdf':
-                    text = self.extract_text_with_pymupdf(pdf_path)
+                    text = (self._read_pymupdf(doc, probe['first_page_text']) if backend == method
+                            else self.extract_text_with_pymupdf(pdf_path))
                 elif method == 'pdfplumber':
-                    text = self.extract_text_with_pdfplumber(pdf_path)
+                    text = self._read_pdfplumber(doc) if backend == method else self.extract_text_with_pdfplumber(pdf_path)
                 elif method == 'pdftotext':
                     text = self.extract_text_with_pdftotext(pdf_path)
                 else:
@@ -141,6 +392,7 @@ class PDFProcessor:
                 # 如果成功提取到文本，返回结果
                 if text.strip():
                     logger.info(f"使用 {method} 成功提取PDF文本: {pdf_path}")
+                    _remember_backend(document_class, method)
                     return text
                 else:
                     logger.warning(f"{method} 提取的文本为空，尝试下一个方法")
@@ -148,6 +400,10 @@ class PDFProcessor:
             except Exception as e:
                 logger.warning(f"{method} 处理失败: {e}，尝试下一个方法")
                 continue
+
+        if ocr_page:
+            logger.warning(f"文本提取方法均未提取到文本，渲染页面OCR: {pdf_path}")
+            return self._ocr_document(backend, doc, ocr_page)
         
         logger.error(f"所有PDF处理方法都失败了: {pdf_path}")
         return ""
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from .invoice_recognition_engine import InvoiceRecognitionEngine, create_batch_executor
+
+logger = logging.getLogger(__name__)
+
+# 由识别规则产生、重新提取时可能变化的字段
+REEXTRACT_FIELDS = [
+    'invoice_number', 'invoice_date', 'total_amount',
+    'tax_amount', 'amount_without_tax',
+    'seller_name', 'seller_tax_number',
+    'buyer_name', 'buyer_tax_number',
+]
+
+AMOUNT_FIELDS = {'total_amount', 'tax_amount', 'amount_without_tax'}
+
+
+def _normalize_field(field: str, value: Any) -> Any:
+    """统一存储值与识别结果的表示（CSV中空值为''，Excel中为NaN，金额可能是字符串）"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if field in AMOUNT_FIELDS:
+        try:
+            return round(float(value), 2)
+        except (ValueError, TypeError):
+            return str(value)
+    return str(value)
+
+
+def changed_fields(record: Dict[str, Any], invoice_info: Dict[str, Any]) -> Dict[str, Any]:
+    """比较已存储记录与重新识别结果，返回有变化的字段"""
+    changes = {}
+    for field in REEXTRACT_FIELDS:
+        new_value = invoice_info.get(field)
+        if _normalize_field(field, record.get(field)) != _normalize_field(field, new_value):
+            changes[field] = new_value
+    return changes
+
+
+class ReextractRunner:
+    """重新提取任务 - 读取已存储的 raw_text 只重跑识别规则，变化字段批量写回，不重新OCR
+
+    存储服务需提供 iter_invoices(batch_size) 和 update_invoices(updates)。
+    """
+
+    def __init__(self, storage, engine: Optional[InvoiceRecognitionEngine] = None,
+                 batch_size: int = 500, write_batch_size: int = 5000):
+        self.storage = storage
+        self.engine = engine or InvoiceRecognitionEngine()
+        self.batch_size = max(1, batch_size)
+        # CSV/Excel每次写回都会整体重写文件，累积到一定数量再写
+        self.write_batch_size = max(1, write_batch_size)
+
+    def run(self, workers: int = 1,
+            progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+            cancel_event: Optional[threading.Event] = None) -> Dict[str, int]:
+        """执行重新提取
+
+        Args:
+            workers: 规则识别进程数（1为当前进程内串行，0表示使用全部CPU核心）
+            progress_callback: 每批结束时回调，参数包含 index/total/updated
+            cancel_event: 设置后在当前批次写回后停止
+
+        Returns:
+            {'total': 记录数, 'updated': 有变化的记录数, 'unchanged': 无变化数, 'skipped': 无原始文本数}
+        """
+        stats = {
+            'total': self.storage.get_invoice_stats().get('total_invoices', 0),
+            'updated': 0, 'unchanged': 0, 'skipped': 0
+        }
+        pending: List[Dict[str, Any]] = []
+        index = 0
+
+        executor = create_batch_executor(workers) if workers != 1 else None
+        try:
+            for records in self.storage.iter_invoices(self.batch_size):
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("重新提取任务已取消")
+                    break
+
+                records = [record for record in records if self._has_text(record, stats)]
+                results = self.engine.extract_batch(
+                    [str(record['raw_text']) for record in records], executor=executor
+                )
+                for record, invoice_info in zip(records, results):
+                    changes = changed_fields(record, invoice_info)
+                    if changes:
+                        pending.append(dict(changes, id=record['id']))
+                        stats['updated'] += 1
+                    else:
+                        stats['unchanged'] += 1
+
+                if len(pending) >= self.write_batch_size:
+                    self.storage.update_invoices(pending)
+                    pending = []
+
+                index = stats['updated'] + stats['unchanged'] + stats['skipped']
+                if progress_callback:
+                    progress_callback({'index': index, 'total': stats['total'], 'updated': stats['updated']})
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            # 取消或出错时也写回已完成部分
+            if pending:
+                self.storage.update_invoices(pending)
+
+        logger.info(f"重新提取完成: 总计{stats['total']}条，更新{stats['updated']}条，"
+                    f"无变化{stats['unchanged']}条，无原始文本{stats['skipped']}条")
+        return stats
+
+    @staticmethod
+    def _has_text(record: Dict[str, Any], stats: Dict[str, int]) -> bool:
+        """没有原始文本的记录无法重新提取，计入 skipped"""
+        if _normalize_field('raw_text', record.get('raw_text')) and str(record['raw_text']).strip():
+            return True
+        stats['skipped'] += 1
+        return False
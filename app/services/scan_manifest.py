@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+# 文件状态：pending 已发现未处理完 / processed 已入库 / skipped 存储中已有记录 / failed 处理失败
+# （目录监听的内存清单另用 queued 表示已进入处理队列）
+PENDING = 'pending'
+FAILED = 'failed'
+
+# 修改时间距今不足该秒数的目录不记录mtime，下次扫描仍会重新列出
+# （同一时间戳精度内的后续修改不会改变目录mtime）
+RACY_MTIME_SECONDS = 2.0
+
+# 同一清单文件的读写在进程内串行
+_manifest_lock = threading.RLock()
+
+
+def get_default_manifest_path() -> str:
+    """读取扫描清单路径配置 SCAN_MANIFEST_PATH"""
+    return os.getenv('SCAN_MANIFEST_PATH', './data/scan_manifest.json')
+
+
+def get_watch_manifest_path() -> str:
+    """目录监听使用的扫描清单，与处理流程的清单分开保存，如 scan_manifest.json -> scan_manifest.watch.json"""
+    path = Path(get_default_manifest_path())
+    return str(path.with_name(f"{path.stem}.watch{path.suffix}"))
+
+
+class ScanManifest:
+    """目录扫描清单 - 持久化每个目录的mtime和每个文件的 大小/mtime/哈希/状态
+
+    目录mtime未变化时不再列出目录内容（新增、删除、重命名文件都会改变所在目录的mtime），
+    发生变化的目录才重新列出。原地改写文件不会改变目录mtime，要发现这类修改需要逐个stat
+    清单中的文件，开销与文件总数成正比（20万个文件的空扫描也要20万次stat），因此默认关闭，
+    由 SCAN_RECHECK_FILES 开启；关闭时原地改写的文件要等所在目录变化后才会被发现。
+    扫描结果只包含新增、修改和上次未处理完的文件；处理失败的文件只在大小或mtime变化后
+    重新处理，不会在每次扫描时重复失败。
+    """
+
+    def __init__(self, manifest_path: str = None):
+        self.manifest_path = Path(manifest_path or get_default_manifest_path())
+        self.directories: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """加载清单；文件不存在或格式不符时从空清单开始（相当于一次全量扫描）"""
+        if not self.manifest_path.exists():
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                logger.info(f"扫描清单版本不一致，重新建立: {self.manifest_path}")
+                return
+            self.directories = data.get('directories', {})
+            self.files = data.get('files', {})
+            logger.info(f"已加载扫描清单: {len(self.directories)} 个目录，{len(self.files)} 个文件")
+        except Exception as e:
+            logger.warning(f"加载扫描清单失败，重新建立: {self.manifest_path}, 错误: {e}")
+            self.directories, self.files = {}, {}
+
+    def save(self):
+        """写入清单（先写临时文件再替换）"""
+        with _manifest_lock:
+            if not self._dirty:
+                return
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.manifest_path.with_name(self.manifest_path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'directories': self.directories, 'files': self.files},
+                          f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.manifest_path)
+            self._dirty = False
+        logger.info(f"扫描清单已保存: {len(self.files)} 个文件")
+
+    def reset(self):
+        """清空清单，下次扫描重新列出全部目录"""
+        with _manifest_lock:
+            self.directories, self.files = {}, {}
+            self._dirty = True
+
+    def directory_unchanged(self, directory: str, mtime_ns: int) -> Optional[List[str]]:
+        """目录mtime与清单一致时返回记录的子目录列表，否则返回None（需要重新列出）"""
+        entry = self.directories.get(directory)
+        if entry is not None and entry.get('mtime_ns') == mtime_ns:
+            return entry['subdirs']
+        return None
+
+    def directory_files(self, directory: str) -> List[str]:
+        """目录中已记录的文件路径"""
+        entry = self.directories.get(directory)
+        return list(entry.get('files', [])) if entry is not None else []
+
+    def update_directory(self, directory: str, mtime_ns: int, file_paths: List[str], subdirs: List[str]):
+        """记录重新列出的目录内容，并移除已不在目录中的文件和子目录"""
+        with _manifest_lock:
+            previous = self.directories.get(directory)
+            if previous is not None:
+                current = set(file_paths)
+                for file_path in previous.get('files', []):
+                    if file_path not in current:
+                        self.files.pop(file_path, None)
+                for subdir in set(previous.get('subdirs', [])) - set(subdirs):
+                    self._forget_directory(os.path.join(directory, subdir))
+
+            # 刚修改过的目录不记录mtime，避免同一时间戳内的后续修改被漏掉
+            racy = time.time() - mtime_ns / 1e9 < RACY_MTIME_SECONDS
+            self.directories[directory] = {
+                'mtime_ns': None if racy else mtime_ns,
+                'files': file_paths,
+                'subdirs': subdirs
+            }
+            self._dirty = True
+
+    def _forget_directory(self, directory: str):
+        """移除已删除的目录及其下所有记录"""
+        entry = self.directories.pop(directory, None)
+        if entry is None:
+            return
+        for file_path in entry.get('files', []):
+            self.files.pop(file_path, None)
+        for subdir in entry.get('subdirs', []):
+            self._forget_directory(os.path.join(directory, subdir))
+
+    def forget_directory(self, directory: str):
+        with _manifest_lock:
+            if directory in self.directories:
+                self._forget_directory(directory)
+                self._dirty = True
+
+    def update_file(self, file_path: str, file_type: str, size: int, mtime_ns: int) -> bool:
+        """记录文件的大小和mtime，新增或内容变化的文件置为pending，返回是否新增/变化"""
+        with _manifest_lock:
+            entry = self.files.get(file_path)
+            if entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                return False
+            self.files[file_path] = {
+                'file_type': file_type,
+                'size': size,
+                'mtime_ns': mtime_ns,
+                'hash': None,
+                'status': PENDING
+            }
+            self._dirty = True
+            return True
+
+    def reset_status(self, from_status: str, to_status: str) -> int:
+        """把处于 from_status 的文件改为 to_status，返回修改的数量"""
+        with _manifest_lock:
+            count = 0
+            for entry in self.files.values():
+                if entry['status'] == from_status:
+                    entry['status'] = to_status
+                    count += 1
+            if count:
+                self._dirty = True
+            return count
+
+    def mark(self, file_path: str, status: str, file_hash: str = None):
+        """更新文件处理状态（及内容哈希）"""
+        with _manifest_lock:
+            entry = self.files.get(file_path)
+            if entry is None:
+                return
+            entry['status'] = status
+            if file_hash:
+                entry['hash'] = file_hash
+            self._dirty = True
+
+    def files_with_status(self, status: str) -> List[Tuple[str, str]]:
+        """处于指定状态的文件 (路径, 类型)，按路径排序"""
+        return sorted(
+            (file_path, entry['file_type'])
+            for file_path, entry in self.files.items()
+            if entry['status'] == status
+        )
+
+    def pending_files(self) -> List[Tuple[str, str]]:
+        """所有待处理的文件 (路径, 类型)，按路径排序"""
+        return self.files_with_status(PENDING)
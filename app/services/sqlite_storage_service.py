@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import json
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Any
+from datetime import datetime
+from pathlib import Path
+
+from .invoice_keys import invoice_key
+from .invoice_query import DEFAULT_SORT, SORT_FIELDS, decode_cursor, encode_cursor, normalize_date
+from .invoice_stats import InvoiceStats
+
+logger = logging.getLogger(__name__)
+
+# 已完成建表的数据库文件（每个进程只初始化一次）
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+# InvoiceStats 计算所需的列
+_STATS_COLUMNS = ('file_type', 'processed', 'duplicate_of', 'error_reason',
+                  'total_amount', 'tax_amount', 'invoice_date', 'seller_name')
+
+
+def get_default_db_path() -> str:
+    """从 DATABASE_URL 解析SQLite文件路径（仅支持 sqlite:/// 形式）"""
+    database_url = os.getenv('DATABASE_URL', 'sqlite:///./data/invoices.db')
+    if database_url.startswith('sqlite:///'):
+        return database_url[len('sqlite:///'):]
+    logger.warning(f"DATABASE_URL 不是SQLite地址，使用默认路径: {database_url}")
+    return './data/invoices.db'
+
+
+class SQLiteStorageService:
+    """SQLite存储服务 - WAL模式 + 索引查询，替代全文件扫描"""
+
+    def __init__(self, db_file_path: str = None):
+        self.db_file_path = Path(db_file_path or get_default_db_path())
+        self.db_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 定义列结构（与Excel/CSV存储保持一致）
+        self.columns = [
+            'id', 'file_path', 'file_name', 'file_type',
+            'invoice_number', 'invoice_date', 'total_amount',
+            'tax_amount', 'amount_without_tax',
+            'seller_name', 'seller_tax_number',
+            'buyer_name', 'buyer_tax_number',
+            'raw_text', 'processed', 'created_at', 'updated_at',
+            'recognition_quality', 'confidence_score', 'error_reason',
+            'file_hash', 'duplicate_of'
+        ]
+
+        # 初始化数据库
+        self._initialize_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建数据库连接"""
+        conn = sqlite3.connect(str(self.db_file_path), timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _initialize_database(self):
+        """初始化数据库：启用WAL并创建表和索引"""
+        key = str(self.db_file_path.resolve())
+        with _init_lock:
+            if key in _initialized_paths:
+                return
+
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS invoices (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        file_path TEXT NOT NULL,
+                        file_name TEXT,
+                        file_type TEXT,
+                        invoice_number TEXT,
+                        invoice_date TEXT,
+                        total_amount REAL,
+                        tax_amount REAL,
+                        amount_without_tax REAL,
+                        seller_name TEXT,
+                        seller_tax_number TEXT,
+                        buyer_name TEXT,
+                        buyer_tax_number TEXT,
+                        raw_text TEXT,
+                        processed INTEGER DEFAULT 1,
+                        created_at TEXT,
+                        updated_at TEXT,
+                        recognition_quality TEXT,
+                        confidence_score REAL,
+                        error_reason TEXT,
+                        file_hash TEXT,
+                        duplicate_of INTEGER
+                    )
+                ''')
+                # 旧版本数据库补充新增列
+                existing = {row['name'] for row in conn.execute('PRAGMA table_info(invoices)')}
+                for column, column_type in (('file_hash', 'TEXT'), ('duplicate_of', 'INTEGER')):
+                    if column not in existing:
+                        conn.execute(f'ALTER TABLE invoices ADD COLUMN {column} {column_type}')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_file_path ON invoices (file_path)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_invoice_number ON invoices (invoice_number)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_invoice_date ON invoices (invoice_date)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_seller_tax_number ON invoices (seller_tax_number)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices (created_at)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_file_hash ON invoices (file_hash)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_invoice_key ON invoices (invoice_number, seller_tax_number)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_total_amount ON invoices (total_amount)')
+                # 增量维护的统计（单行JSON，与发票数据在同一事务中更新）
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS invoice_stats (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        data TEXT NOT NULL
+                    )
+                ''')
+                conn.commit()
+            finally:
+                conn.close()
+
+            _initialized_paths.add(key)
+            logger.info(f"使用SQLite数据库: {self.db_file_path}")
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """将数据库行转换为字典"""
+        record = dict(row)
+        record['processed'] = bool(record.get('processed'))
+        if record.get('recognition_quality'):
+            try:
+                record['recognition_quality'] = json.loads(record['recognition_quality'])
+            except (ValueError, TypeError):
+                pass
+        return record
+
+    def _prepare_record(self, invoice_data: Dict[str, Any]) -> Dict[str, Any]:
+        """按列结构整理待写入的记录"""
+        now = datetime.now().isoformat()
+        record = {
+            'created_at': now,
+            'updated_at': now,
+            'processed': True
+        }
+        for key, value in invoice_data.items():
+            if key in self.columns and key != 'id':
+                record[key] = value
+
+        # 处理复杂对象（如recognition_quality）
+        for key, value in record.items():
+            if isinstance(value, (dict, list)):
+                record[key] = json.dumps(value, ensure_ascii=False)
+        record['processed'] = 1 if record.get('processed') else 0
+        return record
+
+    def add_invoice(self, invoice_data: Dict[str, Any]) -> int:
+        """添加发票记录"""
+        return self.add_invoices([invoice_data])[0]
+
+    def add_invoices(self, records: List[Dict[str, Any]]) -> List[int]:
+        """批量添加发票记录（单个事务），返回新记录ID列表"""
+        if not records:
+            return []
+        try:
+            conn = self._connect()
+            try:
+                new_ids, added = [], []
+                with conn:
+                    for invoice_data in records:
+                        record = self._prepare_record(invoice_data)
+
+                        # 相同发票号码和销售方税号的已有记录（语义重复，事务内可见本批次已插入的记录）
+                        key = invoice_key(record.get('invoice_number'), record.get('seller_tax_number'))
+                        duplicate_of = self._find_duplicate(conn, key) if key else None
+                        if duplicate_of is not None:
+                            record['duplicate_of'] = duplicate_of
+                            logger.warning(f"发票号码与已有记录重复: {key[0]}, 已有记录ID: {duplicate_of}")
+
+                        columns = list(record.keys())
+                        placeholders = ', '.join('?' for _ in columns)
+                        cursor = conn.execute(
+                            f"INSERT INTO invoices ({', '.join(columns)}) VALUES ({placeholders})",
+                            [record[col] for col in columns]
+                        )
+                        new_ids.append(cursor.lastrowid)
+                        added.append(record)
+
+                    # 插入已取得写锁，统计的读取-修改-写入不会与其他写入交错
+                    self._update_stats(conn, added=added)
+            finally:
+                conn.close()
+
+            if len(new_ids) == 1:
+                logger.info(f"添加发票记录成功，ID: {new_ids[0]}")
+            else:
+                logger.info(f"批量添加发票记录成功: {len(new_ids)} 条，ID {new_ids[0]}-{new_ids[-1]}")
+            return new_ids
+
+        except Exception as e:
+            logger.error(f"添加发票记录失败: {e}")
+            raise
+
+    @staticmethod
+    def _find_duplicate(conn: sqlite3.Connection, key: tuple) -> Optional[int]:
+        row = conn.execute(
+            'SELECT id FROM invoices WHERE invoice_number = ? AND seller_tax_number = ? ORDER BY id LIMIT 1', key
+        ).fetchone()
+        return row['id'] if row else None
+
+    def find_by_file_hash(self, file_hash: str) -> Optional[int]:
+        """按文件内容哈希查找已有记录ID（file_hash索引）"""
+        if not file_hash:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT id FROM invoices WHERE file_hash = ? ORDER BY id LIMIT 1', (file_hash,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row['id'] if row else None
+
+    def find_duplicate_invoice(self, invoice_number: Any, seller_tax_number: Any) -> Optional[int]:
+        """按 发票号码 + 销售方税号 查找已有记录ID（组合索引）"""
+        key = invoice_key(invoice_number, seller_tax_number)
+        if key is None:
+            return None
+        conn = self._connect()
+        try:
+            return self._find_duplicate(conn, key)
+        finally:
+            conn.close()
+
+    def get_invoice_by_file_path(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """根据文件路径获取发票记录"""
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    'SELECT * FROM invoices WHERE file_path = ? ORDER BY id LIMIT 1', (file_path,)
+                ).fetchone()
+            finally:
+                conn.close()
+            return self._row_to_dict(row) if row else None
+        except Exception as e:
+            logger.error(f"查询发票记录失败: {e}")
+            return None
+
+    @staticmethod
+    def _sort_expression(sort_by: str) -> str:
+        """排序字段对应的SQL表达式，取值规范化方式与 InvoiceQueryIndex 一致"""
+        kind = SORT_FIELDS[sort_by]
+        if kind == 'date':
+            return f'norm_date({sort_by})'
+        if kind == 'text':
+            return f"NULLIF(TRIM({sort_by}), '')"
+        return sort_by
+
+    def query_invoices(self, filters: Optional[Dict[str, Any]] = None, sort_by: str = DEFAULT_SORT,
+                       sort_order: str = 'desc', limit: int = 100, offset: int = 0,
+                       cursor: Optional[str] = None) -> Dict[str, Any]:
+        """按条件过滤、排序并分页（语义与 InvoiceQueryIndex.query 相同：空值排最后，ID作为次序键）"""
+        filters = filters or {}
+        if sort_by not in SORT_FIELDS:
+            sort_by = DEFAULT_SORT
+        sort_order = 'asc' if sort_order == 'asc' else 'desc'
+        after = decode_cursor(cursor, sort_by, sort_order) if cursor else None
+
+        conditions, params = [], []
+        for field in ('invoice_number', 'seller_name', 'buyer_name'):
+            query = filters.get(field)
+            if query is not None and str(query).strip():
+                pattern = str(query).strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                conditions.append(f"{field} LIKE ? ESCAPE '\\'")
+                params.append(f'%{pattern}%')
+        if filters.get('min_amount') is not None:
+            conditions.append('total_amount >= ?')
+            params.append(float(filters['min_amount']))
+        if filters.get('max_amount') is not None:
+            conditions.append('total_amount <= ?')
+            params.append(float(filters['max_amount']))
+        start_date, end_date = normalize_date(filters.get('start_date')), normalize_date(filters.get('end_date'))
+        if start_date is not None:
+            conditions.append('norm_date(invoice_date) >= ?')
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append('norm_date(invoice_date) <= ?')
+            params.append(end_date)
+
+        expression = self._sort_expression(sort_by)
+        direction = 'ASC' if sort_order == 'asc' else 'DESC'
+        comparison = '>' if sort_order == 'asc' else '<'
+        page_conditions, page_params = list(conditions), list(params)
+        if after is not None:
+            flag, value, row_id = after
+            # 游标位于空值段（升序时 flag 表示空值，降序时表示非空）
+            if flag == (sort_order == 'asc'):
+                page_conditions.append(f'({expression} IS NULL AND id {comparison} ?)')
+                page_params.append(row_id)
+            else:
+                page_conditions.append(
+                    f'({expression} IS NULL OR {expression} {comparison} ? OR ({expression} = ? AND id {comparison} ?))'
+                )
+                page_params.extend([value, value, row_id])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        page_where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ''
+        try:
+            conn = self._connect()
+            conn.create_function('norm_date', 1, normalize_date, deterministic=True)
+            try:
+                matched = conn.execute(f'SELECT COUNT(*) FROM invoices {where}', params).fetchone()[0]
+                rows = conn.execute(
+                    f'SELECT *, {expression} AS _sort_value FROM invoices {page_where} '
+                    f'ORDER BY ({expression} IS NULL), {expression} {direction}, id {direction} LIMIT ? OFFSET ?',
+                    page_params + [limit + 1, 0 if after is not None else max(0, offset)]
+                ).fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"查询发票列表失败: {e}")
+            raise
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            if rows:
+                last = rows[-1]
+                is_null = last['_sort_value'] is None
+                flag = is_null if sort_order == 'asc' else not is_null
+                next_cursor = encode_cursor(sort_by, sort_order, (flag, last['_sort_value'], last['id']))
+
+        invoices = []
+        for row in rows:
+            record = self._row_to_dict(row)
+            record.pop('_sort_value', None)
+            invoices.append(record)
+        return {'invoices': invoices, 'matched': matched, 'next_cursor': next_cursor}
+
+    def get_all_invoices(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """获取所有发票记录"""
+        try:
+            conn = self._connect()
+            try:
+                # 按创建时间降序排序（使用created_at索引）
+                rows = conn.execute(
+                    'SELECT * FROM invoices ORDER BY created_at DESC LIMIT ? OFFSET ?', (limit, offset)
+                ).fetchall()
+            finally:
+                conn.close()
+            return [self._row_to_dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"获取发票列表失败: {e}")
+            return []
+
+    @staticmethod
+    def _load_stats(conn: sqlite3.Connection) -> Optional[InvoiceStats]:
+        row = conn.execute('SELECT data FROM invoice_stats WHERE id = 1').fetchone()
+        if row is None:
+            return None
+        try:
+            return InvoiceStats.from_dict(json.loads(row['data']))
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _rebuild_stats(conn: sqlite3.Connection) -> InvoiceStats:
+        """由全表数据重新计算统计（统计行缺失时，如旧版本数据库）"""
+        cursor = conn.execute(f"SELECT {', '.join(_STATS_COLUMNS)} FROM invoices")
+        stats = InvoiceStats.from_records(dict(row) for row in cursor)
+        logger.info(f"已重建统计信息: {stats.total_invoices} 条记录")
+        return stats
+
+    @staticmethod
+    def _save_stats(conn: sqlite3.Connection, stats: InvoiceStats):
+        if stats.extremes_stale:
+            # 删除了最大/最小金额的记录，借助 total_amount 索引重新取极值
+            row = conn.execute('SELECT MIN(total_amount), MAX(total_amount) FROM invoices').fetchone()
+            stats.set_extremes(row[0], row[1])
+        conn.execute(
+            'INSERT OR REPLACE INTO invoice_stats (id, data) VALUES (1, ?)',
+            (json.dumps(stats.to_dict(), ensure_ascii=False),)
+        )
+
+    def _update_stats(self, conn: sqlite3.Connection, removed: List[Dict[str, Any]] = (),
+                      added: List[Dict[str, Any]] = ()):
+        """在当前写事务中更新统计：移除旧记录、计入新记录（统计行缺失时重建，结果已包含本次变更）"""
+        stats = self._load_stats(conn)
+        if stats is None:
+            stats = self._rebuild_stats(conn)
+        else:
+            for record in removed:
+                stats.remove(record)
+            for record in added:
+                stats.add(record)
+        self._save_stats(conn, stats)
+
+    def _fetch_stats_rows(self, conn: sqlite3.Connection, ids: List[int]) -> List[Dict[str, Any]]:
+        """按ID读取统计所需的列（分批，避免超出SQL参数数量限制）"""
+        rows = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows.extend(dict(row) for row in conn.execute(
+                f"SELECT {', '.join(_STATS_COLUMNS)} FROM invoices WHERE id IN ({placeholders})", chunk
+            ))
+        return rows
+
+    def get_invoice_stats(self) -> Dict[str, Any]:
+        """获取发票统计信息（读取增量维护的统计行，不扫描全表）"""
+        try:
+            conn = self._connect()
+            try:
+                stats = self._load_stats(conn)
+                if stats is None:
+                    with conn:
+                        conn.execute('BEGIN IMMEDIATE')
+                        stats = self._load_stats(conn) or self._rebuild_stats(conn)
+                        self._save_stats(conn, stats)
+            finally:
+                conn.close()
+            return stats.summary()
+
+        except Exception as e:
+            logger.error(f"获取统计信息失败: {e}")
+            return InvoiceStats().summary()
+
+    def delete_invoice_by_file_path(self, file_path: str) -> bool:
+        """根据文件路径删除发票记录"""
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    # 先取得写锁，保证读取的旧记录与删除、统计更新一致
+                    conn.execute('BEGIN IMMEDIATE')
+                    removed = [dict(row) for row in conn.execute(
+                        f"SELECT {', '.join(_STATS_COLUMNS)} FROM invoices WHERE file_path = ?", (file_path,)
+                    )]
+                    cursor = conn.execute('DELETE FROM invoices WHERE file_path = ?', (file_path,))
+                    deleted = cursor.rowcount
+                    if deleted > 0:
+                        self._update_stats(conn, removed=removed)
+            finally:
+                conn.close()
+
+            if deleted > 0:
+                logger.info(f"删除发票记录成功: {file_path}")
+                return True
+            else:
+                logger.warning(f"未找到要删除的发票记录: {file_path}")
+                return False
+
+        except Exception as e:
+            logger.error(f"删除发票记录失败: {e}")
+            return False
+
+    def iter_invoices(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """按ID顺序分批读取全部记录（键集分页，每批单独查询，不一次性加载全表）"""
+        last_id = 0
+        while True:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    'SELECT * FROM invoices WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+                ).fetchall()
+            finally:
+                conn.close()
+
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            yield [self._row_to_dict(row) for row in rows]
+
+    def update_invoices(self, updates: List[Dict[str, Any]]) -> int:
+        """按ID批量更新字段（单个事务），每项为 {'id': ID, 字段: 新值, ...}，返回更新的记录数"""
+        if not updates:
+            return 0
+
+        now = datetime.now().isoformat()
+        # 按更新的列组合分组，每组一条 executemany
+        groups: Dict[tuple, List[list]] = {}
+        for update in updates:
+            columns = tuple(key for key in update if key in self.columns and key not in ('id', 'updated_at'))
+            if columns:
+                groups.setdefault(columns, []).append([update[col] for col in columns] + [now, update['id']])
+
+        # 只有更新涉及统计列时才需要读取新旧记录
+        ids = sorted({update['id'] for update in updates})
+        affects_stats = any(col in _STATS_COLUMNS for columns in groups for col in columns)
+
+        conn = self._connect()
+        try:
+            updated = 0
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                removed = self._fetch_stats_rows(conn, ids) if affects_stats else []
+                for columns, params in groups.items():
+                    assignments = ', '.join(f'{col} = ?' for col in columns + ('updated_at',))
+                    cursor = conn.executemany(f'UPDATE invoices SET {assignments} WHERE id = ?', params)
+                    updated += cursor.rowcount
+                if affects_stats:
+                    self._update_stats(conn, removed=removed, added=self._fetch_stats_rows(conn, ids))
+        finally:
+            conn.close()
+
+        logger.info(f"批量更新发票记录: {updated} 条")
+        return updated
+
+    def flush(self):
+        """与CSV存储接口保持一致；SQLite每次写入都已提交"""
+        pass
+
+    def export_to_csv(self, export_path: str = None) -> str:
+        """导出数据到CSV文件"""
+        try:
+            if export_path is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                export_path = f"./data/invoices_export_{timestamp}.csv"
+
+            # 创建导出目录
+            Path(export_path).parent.mkdir(parents=True, exist_ok=True)
+
+            conn = self._connect()
+            try:
+                cursor = conn.execute(f"SELECT {', '.join(self.columns)} FROM invoices ORDER BY id")
+                with open(export_path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(self.columns)
+                    for row in cursor:
+                        writer.writerow(list(row))
+            finally:
+                conn.close()
+
+            logger.info(f"数据导出成功: {export_path}")
+            return export_path
+
+        except Exception as e:
+            logger.error(f"导出数据失败: {e}")
+            raise
+
+    def get_db_file_path(self) -> str:
+        """获取数据库文件路径"""
+        return str(self.db_file_path)
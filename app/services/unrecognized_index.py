@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 日志行数超过 存活条目数×2 + 该值 时压缩为快照
+COMPACT_MIN_LINES = 1000
+
+# 可排序字段
+SORT_FIELDS = ('added_at', 'modified_time', 'file_size', 'confidence_score', 'file_name')
+
+# 进程内共享的索引：隔离目录 -> UnrecognizedIndex
+_indexes: Dict[str, "UnrecognizedIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+class UnrecognizedIndex:
+    """未识别发票索引 - 记录隔离目录中每个文件的分类、大小、修改时间、错误原因和置信度
+
+    变更以事件行（add/remove/clear）追加到JSONL日志：识别进程移入文件时追加 add，删除接口追加 remove/clear，
+    每条事件一次 O_APPEND 写入。读取时只回放上次位置之后新增的事件，列表查询不再遍历目录和逐个 stat 文件。
+    日志不存在时（如旧版本数据）扫描一次目录重建。
+
+    追加时持有锁文件的共享锁（flock），压缩和重建持有排他锁并在锁内回放完最后追加的事件后再替换日志，
+    其他进程的追加不会在替换时丢失（没有 fcntl 的平台不加锁）。条目以 realpath 为键，
+    分类为文件在隔离目录下的相对目录（如 low_confidence），直接位于隔离目录下的文件为 root。
+    """
+
+    def __init__(self, unrecognized_dir: str, journal_path: str):
+        self.unrecognized_dir = unrecognized_dir
+        self.journal_path = journal_path
+        self.lock_path = journal_path + '.lock'
+        self._root = os.path.realpath(unrecognized_dir)
+
+        # 读取侧状态（由 _lock 保护）
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._category_counts: Dict[str, int] = {}
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._journal_lines = 0
+
+    def _category(self, file_path: str) -> str:
+        relative_dir = os.path.dirname(os.path.relpath(file_path, self._root))
+        return relative_dir if relative_dir else "root"
+
+    @contextmanager
+    def _journal_lock(self, exclusive: bool) -> Iterator[None]:
+        """跨进程的日志锁：追加取共享锁，压缩/重建取排他锁"""
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            # 关闭描述符即释放锁
+            os.close(fd)
+
+    def _append(self, event: Dict[str, Any]):
+        line = (json.dumps(event, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        with self._journal_lock(exclusive=False):
+            fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def _make_entry(self, file_path: str, error_type: Optional[str] = None, error_reason: Optional[str] = None,
+                    confidence_score: Optional[float] = None) -> Dict[str, Any]:
+        stat = os.stat(file_path)
+        return {
+            'file_name': os.path.basename(file_path),
+            'category': self._category(file_path),
+            'file_path': file_path,
+            'file_size': stat.st_size,
+            'modified_time': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            'error_type': error_type,
+            'error_reason': error_reason,
+            'confidence_score': confidence_score,
+            'added_at': datetime.now().isoformat()
+        }
+
+    def add(self, file_path: str, error_type: Optional[str] = None, error_reason: Optional[str] = None,
+            confidence_score: Optional[float] = None):
+        """记录移入隔离目录的文件"""
+        entry = self._make_entry(os.path.realpath(file_path), error_type, error_reason, confidence_score)
+        self._append(dict(entry, op='add'))
+
+    def remove(self, file_path: str):
+        """记录已删除的文件"""
+        self._append({'op': 'remove', 'file_path': os.path.realpath(file_path)})
+
+    def clear(self):
+        """记录隔离目录已清空"""
+        self._append({'op': 'clear'})
+
+    def _apply(self, event: Dict[str, Any]):
+        op = event.pop('op', None)
+        if op == 'clear':
+            self._entries.clear()
+            self._category_counts.clear()
+            return
+        file_path = event.get('file_path')
+        if not file_path:
+            return
+        if not os.path.isabs(file_path):
+            # 旧版日志以 normpath 为键
+            file_path = event['file_path'] = os.path.realpath(file_path)
+        previous = self._entries.pop(file_path, None)
+        if previous is not None:
+            category = previous['category']
+            self._category_counts[category] -= 1
+            if self._category_counts[category] <= 0:
+                del self._category_counts[category]
+        if op == 'add':
+            self._entries[file_path] = event
+            self._category_counts[event['category']] = self._category_counts.get(event['category'], 0) + 1
+
+    def _replay(self, offset: int) -> int:
+        """回放 offset 之后的完整事件行，返回新的读取位置"""
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for raw in data[:end].splitlines():
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                continue
+            if isinstance(event, dict):
+                self._apply(event)
+                self._journal_lines += 1
+        return offset + end
+
+    def _write_snapshot(self, entries: List[Dict[str, Any]]):
+        """以当前条目重写日志（临时文件 + 替换），之后从新文件末尾继续回放（调用方需持有排他锁）"""
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(dict(entry, op='add'), ensure_ascii=False, default=str) + '\n')
+        os.replace(tmp_path, self.journal_path)
+        stat = os.stat(self.journal_path)
+        self._inode, self._offset, self._journal_lines = stat.st_ino, stat.st_size, len(entries)
+
+    def rebuild(self):
+        """扫描隔离目录重建索引（日志缺失或需要与磁盘重新同步时）"""
+        with self._lock, self._journal_lock(exclusive=True):
+            # 先回放最后追加的事件，保留其中的错误原因和置信度
+            self._replay_journal()
+            known = self._entries
+            self._entries, self._category_counts = {}, {}
+            for root, _dirs, files in os.walk(self._root):
+                for file in files:
+                    if file.endswith(('.txt', '.json')):
+                        continue
+                    file_path = os.path.join(root, file)
+                    try:
+                        entry = self._make_entry(file_path)
+                    except OSError:
+                        continue
+                    # 保留已知的错误原因和置信度
+                    previous = known.get(file_path)
+                    if previous:
+                        for field in ('error_type', 'error_reason', 'confidence_score', 'added_at'):
+                            entry[field] = previous.get(field)
+                    self._apply(dict(entry, op='add'))
+            self._write_snapshot(list(self._entries.values()))
+            logger.info(f"未识别文件索引已重建: {len(self._entries)} 个文件")
+
+    def _replay_journal(self) -> bool:
+        """回放日志中新追加的事件，日志不存在时返回False（调用方需持有 _lock）"""
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return False
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # 日志被重写（压缩或重建）：从头回放
+            self._entries, self._category_counts = {}, {}
+            self._inode, self._offset, self._journal_lines = stat.st_ino, 0, 0
+        if stat.st_size > self._offset:
+            self._offset = self._replay(self._offset)
+        return True
+
+    def _catch_up(self):
+        """回放其他进程新追加的事件，日志过长时压缩（调用方需持有 _lock）"""
+        if not self._replay_journal():
+            self.rebuild()
+            return
+        if self._journal_lines > len(self._entries) * 2 + COMPACT_MIN_LINES:
+            with self._journal_lock(exclusive=True):
+                # 持锁后不会再有新的追加：回放完最后的事件再替换
+                if self._replay_journal():
+                    self._write_snapshot(list(self._entries.values()))
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._catch_up()
+            entry = self._entries.get(os.path.realpath(file_path))
+            return dict(entry) if entry else None
+
+    def category_counts(self) -> Dict[str, int]:
+        with self._lock:
+            self._catch_up()
+            return dict(self._category_counts)
+
+    def list_files(self, category: Optional[str] = None, error_type: Optional[str] = None,
+                   name: Optional[str] = None, min_confidence: Optional[float] = None,
+                   max_confidence: Optional[float] = None, sort_by: str = 'added_at',
+                   sort_order: str = 'desc', limit: Optional[int] = 100, offset: int = 0) -> Dict[str, Any]:
+        """分页列出隔离文件（limit 为None时返回全部）
+
+        Returns:
+            {'total_count': 全部文件数, 'matched': 满足条件的文件数, 'category_counts': 各分类文件数, 'files': 本页文件}
+        """
+        with self._lock:
+            self._catch_up()
+            entries = list(self._entries.values())
+            total_count = len(entries)
+            category_counts = dict(self._category_counts)
+
+        name = name.casefold() if name else None
+        if category or error_type or name or min_confidence is not None or max_confidence is not None:
+            def matches(entry: Dict[str, Any]) -> bool:
+                confidence = entry.get('confidence_score')
+                if category and entry['category'] != category:
+                    return False
+                if error_type and entry.get('error_type') != error_type:
+                    return False
+                if name and name not in entry['file_name'].casefold():
+                    return False
+                if min_confidence is not None and (confidence is None or confidence < min_confidence):
+                    return False
+                if max_confidence is not None and (confidence is None or confidence > max_confidence):
+                    return False
+                return True
+            entries = [entry for entry in entries if matches(entry)]
+
+        # 条目按加入顺序保存，默认的按加入时间排序无需再排序；其他字段排序时缺失值排在最后
+        descending = sort_order != 'asc'
+        if sort_by not in SORT_FIELDS or sort_by == 'added_at':
+            if descending:
+                entries.reverse()
+        else:
+            present = [entry for entry in entries if entry.get(sort_by) is not None]
+            present.sort(key=lambda entry: entry[sort_by], reverse=descending)
+            entries = present + [entry for entry in entries if entry.get(sort_by) is None]
+
+        return {
+            'total_count': total_count,
+            'matched': len(entries),
+            'category_counts': category_counts,
+            'files': [dict(entry) for entry in entries[offset:offset + limit if limit is not None else None]]
+        }
+
+
+def get_unrecognized_index(unrecognized_dir: str, journal_path: str) -> UnrecognizedIndex:
+    """获取进程内共享的未识别文件索引"""
+    key = os.path.abspath(unrecognized_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = UnrecognizedIndex(unrecognized_dir, journal_path)
+        return index
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import CancelledError
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .file_service import FileService, file_service as default_file_service
+from .job_service import job_manager
+from .scan_manifest import PENDING, ScanManifest, get_watch_manifest_path
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    INOTIFY_AVAILABLE = True
+except ImportError:
+    INOTIFY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# off 不监听 / auto 优先inotify，不可用时轮询 / inotify / poll
+WATCH_MODES = ('off', 'auto', 'inotify', 'poll')
+
+# 监听清单中的文件状态：queued 已入队未处理完 / processed 已提交处理完成
+QUEUED = 'queued'
+PROCESSED = 'processed'
+
+# 进程内唯一的目录监听实例
+_watcher: Optional["InvoiceWatcher"] = None
+_watcher_lock = threading.Lock()
+
+
+def get_watch_mode() -> str:
+    """读取目录监听模式配置 WATCH_MODE（默认off）"""
+    mode = os.getenv('WATCH_MODE', 'off').strip().lower()
+    if mode not in WATCH_MODES:
+        logger.warning(f"WATCH_MODE 配置无效: {mode}，不启用目录监听")
+        return 'off'
+    return mode
+
+
+def _env_number(name: str, default, cast=float):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        logger.warning(f"{name} 配置无效: {value}，使用默认值 {default}")
+        return default
+    return number if number > 0 else default
+
+
+class InvoiceWatcher:
+    """发票目录监听 - invoices/pdf 和 invoices/imge 中新放入的文件去抖后进入有界队列，按批提交处理任务
+
+    Linux 下使用 inotify（需安装 inotify_simple），不可用时按间隔轮询扫描清单
+    （只重新列出mtime变化的目录）。文件大小在去抖时间内不再变化才入队；队列满时
+    丢弃的文件在队列清空后由一次增量扫描补处理。
+    """
+
+    def __init__(self, service_factory: Callable[[], Any], mode: str = 'auto',
+                 file_service: Optional[FileService] = None,
+                 debounce_seconds: float = 2.0, poll_interval: float = 5.0,
+                 max_queue: int = 1000, batch_size: int = 50):
+        """
+        Args:
+            service_factory: 创建发票服务（提供 process_files / process_all_invoices）
+            mode: auto / inotify / poll
+        """
+        self.service_factory = service_factory
+        self.file_service = file_service or default_file_service
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.batch_size = max(1, batch_size)
+        self.mode = self._resolve_mode(mode)
+
+        self.queue: "queue.Queue[Tuple[str, str]]" = queue.Queue(maxsize=max(1, max_queue))
+        self.stats = {'detected': 0, 'enqueued': 0, 'dropped': 0, 'batches': 0}
+
+        # 去抖中的文件: 路径 -> (类型, 到期时间, 上次看到的大小)，只在监听线程中访问
+        self._pending: Dict[str, Tuple[str, float, int]] = {}
+        # 已在队列中的路径，避免重复入队
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._overflow = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        # inotify 监听描述符 -> (目录, 文件类型)
+        self._watches: Dict[int, Tuple[str, str]] = {}
+        # 监听专用的扫描清单：轮询和启动时补扫新文件，入队后标记为 queued，批次处理完成后标记为 processed 并保存；
+        # 上次退出时仍为 queued 的文件重新置为 pending，重启后再次入队
+        self._manifest = ScanManifest(get_watch_manifest_path())
+        self._manifest.reset_status(QUEUED, PENDING)
+        self._roots = [
+            (str(self.file_service.image_dir), 'image', self.file_service.image_extensions),
+            (str(self.file_service.pdf_dir), 'pdf', self.file_service.pdf_extensions),
+        ]
+        self._extensions = {file_type: extensions for _, file_type, extensions in self._roots}
+
+    @staticmethod
+    def _resolve_mode(mode: str) -> str:
+        if mode in ('auto', 'inotify'):
+            if INOTIFY_AVAILABLE:
+                return 'inotify'
+            if mode == 'inotify':
+                logger.warning("inotify_simple 不可用，目录监听改为轮询")
+            return 'poll'
+        if mode != 'poll':
+            raise ValueError(f"不支持的监听模式: {mode}")
+        return mode
+
+    def start(self):
+        """启动监听线程和处理线程"""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._watch_loop, name="invoice-watch", daemon=True),
+            threading.Thread(target=self._consume_loop, name="invoice-watch-worker", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"目录监听已启动: 模式 {self.mode}，去抖 {self.debounce_seconds}s，队列上限 {self.queue.maxsize}")
+
+    def stop(self, timeout: float = 5.0):
+        """停止监听（正在执行的处理任务继续完成）"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("目录监听已停止")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            'mode': self.mode,
+            'running': any(thread.is_alive() for thread in self._threads),
+            'queued': self.queue.qsize(),
+            'debouncing': len(self._pending),
+            'watched_dirs': len(self._watches),
+            **stats
+        }
+
+    # ---- 发现文件 ----
+
+    def _watch_loop(self):
+        try:
+            if self.mode == 'inotify':
+                try:
+                    self._run_inotify()
+                    return
+                except OSError as e:
+                    logger.warning(f"inotify 初始化失败，目录监听改为轮询: {e}")
+                    self.mode = 'poll'
+            self._run_poll()
+        except Exception as e:
+            logger.error(f"目录监听异常退出: {e}")
+
+    def _run_inotify(self):
+        inotify = INotify()
+        try:
+            for root, file_type, _ in self._roots:
+                Path(root).mkdir(parents=True, exist_ok=True)
+                self._add_watch_tree(inotify, root, file_type, collect_files=False)
+            # 监听建立之前（如服务停止期间）放入的文件
+            self._scan_manifest()
+
+            while not self._stop.is_set():
+                for event in inotify.read(timeout=self._next_timeout_ms()):
+                    self._handle_event(inotify, event)
+                self._flush_ready()
+        finally:
+            inotify.close()
+            self._watches.clear()
+
+    def _add_watch_tree(self, inotify, directory: str, file_type: str, collect_files: bool = True):
+        """监听目录及其子目录；新建目录时同时收集监听建立前已写入的文件"""
+        mask = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+        for dirpath, _, filenames in os.walk(directory):
+            try:
+                wd = inotify.add_watch(dirpath, mask)
+            except OSError as e:
+                logger.warning(f"无法监听目录: {dirpath}, 错误: {e}")
+                continue
+            self._watches[wd] = (dirpath, file_type)
+            if collect_files:
+                for filename in filenames:
+                    self._candidate(os.path.join(dirpath, filename), file_type)
+
+    def _handle_event(self, inotify, event):
+        if event.mask & inotify_flags.Q_OVERFLOW:
+            # 内核事件队列溢出，事件已丢失，改由增量扫描补处理
+            logger.warning("inotify 事件队列溢出，将执行一次增量扫描")
+            self._overflow.set()
+            return
+        if event.mask & inotify_flags.IGNORED:
+            self._watches.pop(event.wd, None)
+            return
+
+        watch = self._watches.get(event.wd)
+        if watch is None or not event.name:
+            return
+        directory, file_type = watch
+        path = os.path.join(directory, event.name)
+        if event.mask & inotify_flags.ISDIR:
+            if event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                self._add_watch_tree(inotify, path, file_type)
+            return
+        self._candidate(path, file_type)
+
+    def _run_poll(self):
+        next_scan = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_scan:
+                self._scan_manifest()
+                next_scan = time.monotonic() + self.poll_interval
+            self._flush_ready()
+            self._stop.wait(min(self.poll_interval, self._next_timeout_ms() / 1000))
+
+    def _scan_manifest(self):
+        """增量扫描目录，把新增或修改过的文件加入去抖"""
+        for file_path, file_type in self.file_service.scan_changed_files(self._manifest):
+            self._manifest.mark(file_path, QUEUED)
+            self._candidate(file_path, file_type)
+        self._manifest.save()
+
+    def _record_processed(self, batch: List[Tuple[str, str]]):
+        """批次处理完成后写入监听清单，重启后不再重复入队（inotify 发现的文件也一并记录）"""
+        for file_path, file_type in batch:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue  # 识别失败的文件已移到未识别目录
+            self._manifest.update_file(file_path, file_type, stat.st_size, stat.st_mtime_ns)
+            self._manifest.mark(file_path, PROCESSED)
+        self._manifest.save()
+
+    # ---- 去抖与入队 ----
+
+    def _candidate(self, file_path: str, file_type: str):
+        """记录文件当前大小，去抖时间内没有新事件且大小不变时才入队"""
+        if Path(file_path).suffix.lower() not in self._extensions[file_type]:
+            return
+        try:
+            size = os.stat(file_path).st_size
+        except OSError:
+            return
+        if file_path not in self._pending:
+            with self._lock:
+                self.stats['detected'] += 1
+        self._pending[file_path] = (file_type, time.monotonic() + self.debounce_seconds, size)
+
+    def _next_timeout_ms(self) -> int:
+        if not self._pending:
+            return 1000
+        remaining = min(deadline for _, deadline, _ in self._pending.values()) - time.monotonic()
+        return max(10, min(1000, int(remaining * 1000)))
+
+    def _flush_ready(self):
+        now = time.monotonic()
+        ready = [path for path, (_, deadline, _) in self._pending.items() if deadline <= now]
+        for file_path in ready:
+            file_type, _, size = self._pending.pop(file_path)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue  # 已删除或被移走
+            if stat.st_size != size:
+                # 仍在写入
+                self._pending[file_path] = (file_type, now + self.debounce_seconds, stat.st_size)
+                continue
+            if self.file_service.should_ignore_file(Path(file_path), stat.st_size):
+                continue
+            if self.file_service.is_recent_upload(file_path):
+                continue
+            self._enqueue(file_path, file_type)
+
+    def _enqueue(self, file_path: str, file_type: str):
+        with self._lock:
+            if file_path in self._queued:
+                return
+            try:
+                self.queue.put_nowait((file_path, file_type))
+            except queue.Full:
+                self.stats['dropped'] += 1
+                self._overflow.set()
+                logger.warning(f"处理队列已满，文件稍后由增量扫描处理: {file_path}")
+                return
+            self._queued.add(file_path)
+            self.stats['enqueued'] += 1
+
+    # ---- 处理 ----
+
+    def _consume_loop(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self.queue.get(timeout=1.0)]
+            except queue.Empty:
+                if self._overflow.is_set():
+                    self._overflow.clear()
+                    self._run_job('watch_catch_up', self._catch_up)
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                self._queued.difference_update(file_path for file_path, _ in batch)
+
+            def process_batch(progress_callback, cancel_event, files=batch):
+                return self.service_factory().process_files(
+                    files, progress_callback=progress_callback, cancel_event=cancel_event
+                )
+
+            logger.info(f"目录监听提交处理: {len(batch)} 个文件")
+            self._run_job('watch_process', process_batch)
+            self._record_processed(batch)
+
+    def _catch_up(self, progress_callback, cancel_event):
+        return self.service_factory().process_all_invoices(
+            progress_callback=progress_callback, cancel_event=cancel_event
+        )
+
+    def _run_job(self, job_type: str, func: Callable[..., Any]):
+        """通过任务管理器执行（与手动处理任务串行），等待完成后再取下一批"""
+        job = job_manager.submit(job_type, func)
+        try:
+            job.future.result()
+        except CancelledError:
+            pass
+        with self._lock:
+            self.stats['batches'] += 1
+
+
+def start_watcher(service_factory: Callable[[], Any]) -> Optional[InvoiceWatcher]:
+    """按 WATCH_MODE 启动目录监听（off 时不启动）"""
+    global _watcher
+    mode = get_watch_mode()
+    if mode == 'off':
+        return None
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = InvoiceWatcher(
+                service_factory, mode,
+                debounce_seconds=_env_number('WATCH_DEBOUNCE_SECONDS', 2.0),
+                poll_interval=_env_number('WATCH_POLL_INTERVAL', 5.0),
+                max_queue=_env_number('WATCH_QUEUE_SIZE', 1000, int),
+                batch_size=_env_number('WATCH_BATCH_SIZE', 50, int)
+            )
+            _watcher.start()
+        return _watcher
+
+
+def stop_watcher():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
+
+
+def get_watcher_status() -> Dict[str, Any]:
+    """目录监听状态（未启用时只返回 mode=off）"""
+    watcher = _watcher
+    if watcher is None:
+        return {'mode': 'off', 'running': False}
+    return watcher.status()
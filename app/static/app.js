@@ -41,21 +41,72 @@ class InvoiceApp {
             const response = await fetch('/api/invoices/process', {
                 method: 'POST'
             });
-            const result = await response.json();
+            const job = await response.json();
             
             if (response.ok) {
-                this.showAlert(`处理完成！总文件: ${result.total_files}, 成功: ${result.processed_files}, 失败: ${result.failed_files}`, 'success');
-                this.refreshData();
+                this.showAlert('处理任务已提交，正在后台处理...', 'info');
+                this.watchProcessingJob(job);
             } else {
-                this.showAlert('处理失败: ' + result.detail, 'danger');
+                this.showAlert('处理失败: ' + job.detail, 'danger');
+                this.showLoading(false);
             }
         } catch (error) {
             this.showAlert('处理失败: ' + error.message, 'danger');
-        } finally {
             this.showLoading(false);
         }
     }
 
+    watchProcessingJob(job) {
+        // 通过Server-Sent Events接收逐文件处理进度
+        const processBtn = document.getElementById('processBtn');
+        processBtn.disabled = true;
+
+        const source = new EventSource(job.events_url);
+
+        source.addEventListener('progress', (e) => {
+            const progress = JSON.parse(e.data);
+            processBtn.innerHTML = `<i class="bi bi-hourglass-split"></i> 处理中 ${progress.index}/${progress.total}`;
+        });
+
+        source.addEventListener('reset', (e) => {
+            // 重连时错过的事件已被丢弃，按任务快照恢复进度
+            const snapshot = JSON.parse(e.data);
+            processBtn.innerHTML = `<i class="bi bi-hourglass-split"></i> 处理中 ${snapshot.progress.completed}/${snapshot.progress.total}`;
+        });
+
+        source.addEventListener('done', (e) => {
+            source.close();
+            const finished = JSON.parse(e.data);
+            const result = finished.result || {};
+
+            if (finished.status === 'completed') {
+                this.showAlert(`处理完成！总文件: ${result.total_files}, 成功: ${result.processed_files}, 失败: ${result.failed_files}, 跳过: ${result.skipped_files}`, 'success');
+            } else if (finished.status === 'cancelled') {
+                this.showAlert('处理任务已取消', 'warning');
+            } else {
+                this.showAlert('处理失败: ' + (finished.error || '未知错误'), 'danger');
+            }
+
+            this.finishProcessingJob();
+            this.refreshData();
+        });
+
+        source.onerror = () => {
+            // 连接中断时由浏览器自动重连；任务已不存在时停止监听
+            if (source.readyState === EventSource.CLOSED) {
+                this.showAlert('处理进度连接已断开', 'warning');
+                this.finishProcessingJob();
+            }
+        };
+    }
+
+    finishProcessingJob() {
+        const processBtn = document.getElementById('processBtn');
+        processBtn.disabled = false;
+        processBtn.innerHTML = '<i class="bi bi-play-circle"></i> 处理发票';
+        this.showLoading(false);
+    }
+
     async loadStatistics() {
         try {
             const response = await fetch('/api/invoices/stats/summary');
@@ -360,10 +411,9 @@ class InvoiceApp {
             // 更新未识别文件统计
             document.getElementById('unrecognizedFiles').textContent = data.total_count || 0;
 
-            // 计算需要审核的文件数量
-            const needsReview = (data.files || []).filter(file =>
-                file.category === 'manual_review' || file.category === 'low_confidence'
-            ).length;
+            // 计算需要审核的文件数量（按分类计数，不受分页影响）
+            const counts = data.category_counts || {};
+            const needsReview = (counts.manual_review || 0) + (counts.low_confidence || 0);
             document.getElementById('needsReview').textContent = needsReview;
 
             // 渲染未识别文件列表
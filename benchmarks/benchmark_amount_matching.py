@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+金额组合匹配微基准测试
+
+生成不同长度的金额列表（模拟成品油发票长表格中的金额），对比两两比较的原实现与
+按分哈希查找的 _match_amount_combination，并校验两者结果一致。
+
+用法:
+    python benchmarks/benchmark_amount_matching.py [--sizes 10 50 200 1000] [--rounds 20] [--seed 0]
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.invoice_recognition_engine import InvoiceRecognitionEngine
+
+
+def legacy_match_amount_combination(all_amounts, total_amount, info):
+    """原两两比较实现（O(n²)），作为对照"""
+    best_combination = None
+    min_diff = float('inf')
+    for amount1 in all_amounts:
+        for amount2 in all_amounts:
+            if amount1 != amount2:
+                if amount2 < amount1:
+                    no_tax_amount, tax_amount = amount1, amount2
+                else:
+                    no_tax_amount, tax_amount = amount2, amount1
+                diff = abs(no_tax_amount + tax_amount - total_amount)
+                if diff < min_diff and diff < 0.01:
+                    min_diff = diff
+                    best_combination = (no_tax_amount, tax_amount)
+
+    if best_combination:
+        info['amount_without_tax'], info['tax_amount'] = best_combination
+    elif total_amount in all_amounts:
+        info['amount_without_tax'] = total_amount
+        info['tax_amount'] = 0.0
+    else:
+        for rate in [0.13, 0.09, 0.06, 0.03]:
+            no_tax_amount = total_amount / (1 + rate)
+            tax_amount = total_amount - no_tax_amount
+            if any(abs(amt - no_tax_amount) < 0.01 for amt in all_amounts) and \
+                    any(abs(amt - tax_amount) < 0.01 for amt in all_amounts):
+                info['amount_without_tax'] = round(no_tax_amount, 2)
+                info['tax_amount'] = round(tax_amount, 2)
+                break
+
+
+def generate_case(rng: random.Random, size: int):
+    """生成一张发票的金额列表：随机单价/数量金额，按概率混入 不含税+税额=合计 的组合"""
+    total = round(rng.uniform(50, 20000), 2)
+    amounts = {round(rng.uniform(0.01, total), 2) for _ in range(size)}
+    kind = rng.random()
+    if kind < 0.5:
+        no_tax = round(total / 1.13, 2)
+        amounts.update({no_tax, round(total - no_tax, 2)})
+    elif kind < 0.7:
+        amounts.add(total)
+    return sorted(amounts, reverse=True), total
+
+
+def run_benchmark(sizes, rounds: int, seed: int):
+    engine = InvoiceRecognitionEngine()
+    rng = random.Random(seed)
+
+    print(f"轮数: {rounds}，随机种子: {seed}")
+    print(f"{'金额数':>8}{'原实现(ms)':>14}{'哈希(ms)':>12}{'加速比':>10}")
+
+    for size in sizes:
+        cases = [generate_case(rng, size) for _ in range(rounds)]
+        legacy_timings, hashed_timings = [], []
+        for amounts, total in cases:
+            legacy_info, hashed_info = {}, {}
+
+            start = time.perf_counter()
+            legacy_match_amount_combination(amounts, total, legacy_info)
+            legacy_timings.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            engine._match_amount_combination(amounts, total, hashed_info)
+            hashed_timings.append((time.perf_counter() - start) * 1000)
+
+            if legacy_info != hashed_info:
+                raise SystemExit(f"结果不一致: total={total}, 原实现={legacy_info}, 哈希={hashed_info}")
+
+        legacy_ms = statistics.median(legacy_timings)
+        hashed_ms = statistics.median(hashed_timings)
+        print(f"{size:>8}{legacy_ms:>14.3f}{hashed_ms:>12.3f}{legacy_ms / hashed_ms:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="金额组合匹配微基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 1000], help="每张发票的金额数")
+    parser.add_argument("--rounds", type=int, default=20, help="每种长度生成的发票数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    run_benchmark(args.sizes, args.rounds, args.seed)
+
+
+if __name__ == "__main__":
+    main()
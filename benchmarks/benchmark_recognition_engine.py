@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发票识别引擎微基准测试
+
+对 benchmarks/samples 下的样例发票文本重复执行规则提取，对比基准版本的引擎（从git中取出
+--baseline-rev 提交的 app/services，默认为改用预编译规则表之前的内联正则实现）与当前引擎
+（预编译规则表）每张发票的平均耗时，并校验两者提取的字段一致。需要在git工作区中运行。
+
+用法:
+    python benchmarks/benchmark_recognition_engine.py [--rounds 200] [--purge-re-cache] [--fuzz 0] [--seed 0]
+        [--baseline-rev c1a910b]
+
+--purge-re-cache 在每次提取前清空 re 模块的模式缓存，模拟进程内其他模块
+（pdfplumber、pandas等）大量使用正则时缓存被挤出的情况。
+--fuzz N 另外对样例做N次随机变异（插入/删除标点、空白和数字）后逐一比对两者的提取结果。
+"""
+
+import argparse
+import importlib
+import io
+import logging
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import types
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from app.services.invoice_recognition_engine import InvoiceRecognitionEngine
+
+SAMPLES_DIR = Path(__file__).resolve().parent / "samples"
+
+# 改用预编译规则表之前的提交（内联正则实现）
+BASELINE_REV = "c1a910b"
+
+# 变异时插入的字符：金额、税号和标签边界上最容易出现差异的字符
+FUZZ_CHARS = ",.，。:：¥ \n0123456789ABX年月日-/()（）"
+
+
+def load_samples():
+    """加载样例发票文本"""
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(SAMPLES_DIR.glob("*.txt"))}
+
+
+def load_baseline_engine(rev: str):
+    """从git中取出指定提交的 app/services，作为独立的包导入其中的识别引擎类
+
+    包名带上提交号，引擎内的相对导入会解析到同一提交的模块，不会与当前代码混用；
+    不执行该提交的 app/services/__init__.py。
+    """
+    try:
+        archive = subprocess.run(
+            ["git", "archive", "--format=tar", rev, "app/services"],
+            cwd=REPO_ROOT, capture_output=True, check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", b"") or b""
+        raise SystemExit(f"无法从git取出基准版本 {rev}: {stderr.decode(errors='replace').strip() or e}")
+
+    package_name = f"_baseline_services_{re.sub(r'[^0-9A-Za-z]', '_', rev)}"
+    with tempfile.TemporaryDirectory(prefix="baseline_engine_") as tmp_dir:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tmp_dir)
+        package = types.ModuleType(package_name)
+        package.__path__ = [str(Path(tmp_dir) / "app" / "services")]
+        sys.modules[package_name] = package
+        # 导入完成后临时目录即可删除，模块已在内存中
+        module = importlib.import_module(f"{package_name}.invoice_recognition_engine")
+    return module.InvoiceRecognitionEngine
+
+
+def check_same(legacy, current, text: str, name: str):
+    """两个引擎的提取结果必须一致"""
+    legacy_info = legacy.extract_invoice_info(text)
+    current_info = current.extract_invoice_info(text)
+    if legacy_info != current_info:
+        diff = {key: (legacy_info.get(key), current_info.get(key))
+                for key in set(legacy_info) | set(current_info)
+                if legacy_info.get(key) != current_info.get(key)}
+        raise SystemExit(f"结果不一致: {name}, 字段(原实现, 当前): {diff}\n文本: {text!r}")
+
+
+def time_engine(engine, text: str, rounds: int, purge_re_cache: bool):
+    timings = []
+    for _ in range(rounds):
+        if purge_re_cache:
+            re.purge()
+        start = time.perf_counter()
+        engine.extract_invoice_info(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def mutate(rng: random.Random, text: str) -> str:
+    """随机插入、删除或替换若干字符"""
+    chars = list(text)
+    for _ in range(rng.randint(1, 8)):
+        position = rng.randrange(len(chars) + 1)
+        action = rng.random()
+        if action < 0.4 or not chars:
+            chars.insert(position, rng.choice(FUZZ_CHARS))
+        elif action < 0.7:
+            del chars[min(position, len(chars) - 1)]
+        else:
+            chars[min(position, len(chars) - 1)] = rng.choice(FUZZ_CHARS)
+    return ''.join(chars)
+
+
+def run_benchmark(legacy_class, rounds: int, purge_re_cache: bool = False):
+    samples = load_samples()
+    legacy, current = legacy_class(), InvoiceRecognitionEngine()
+
+    # 校验结果一致，同时预热（排除首次调用的导入和初始化开销）
+    for name, text in samples.items():
+        check_same(legacy, current, text, name)
+
+    print(f"样例数: {len(samples)}，轮数: {rounds}，清空re缓存: {'是' if purge_re_cache else '否'}")
+    print(f"{'样例':<28}{'原实现(ms)':>12}{'当前(ms)':>12}{'加速比':>10}")
+
+    all_legacy, all_current = [], []
+    for name, text in samples.items():
+        legacy_timings = time_engine(legacy, text, rounds, purge_re_cache)
+        current_timings = time_engine(current, text, rounds, purge_re_cache)
+        all_legacy.extend(legacy_timings)
+        all_current.extend(current_timings)
+        legacy_ms, current_ms = statistics.mean(legacy_timings), statistics.mean(current_timings)
+        print(f"{name:<28}{legacy_ms:>12.3f}{current_ms:>12.3f}{legacy_ms / current_ms:>10.1f}")
+
+    legacy_ms, current_ms = statistics.mean(all_legacy), statistics.mean(all_current)
+    print(f"{'全部':<28}{legacy_ms:>12.3f}{current_ms:>12.3f}{legacy_ms / current_ms:>10.1f}")
+
+
+def run_fuzz(legacy_class, cases: int, seed: int):
+    samples = list(load_samples().items())
+    legacy, current = legacy_class(), InvoiceRecognitionEngine()
+    rng = random.Random(seed)
+    for index in range(cases):
+        name, text = rng.choice(samples)
+        check_same(legacy, current, mutate(rng, text), f"{name} 变异#{index}")
+    print(f"随机变异 {cases} 例，提取结果全部一致（随机种子: {seed}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="发票识别引擎微基准测试")
+    parser.add_argument("--rounds", type=int, default=200, help="每个样例的重复次数")
+    parser.add_argument("--purge-re-cache", action="store_true", help="每次提取前清空re模块缓存")
+    parser.add_argument("--fuzz", type=int, default=0, help="随机变异比对的样例数（0=不执行）")
+    parser.add_argument("--seed", type=int, default=0, help="随机变异的随机种子")
+    parser.add_argument("--baseline-rev", default=BASELINE_REV, help=f"作为对照的git提交（默认{BASELINE_REV}）")
+    parser.add_argument("--log-level", default="ERROR", help="引擎日志级别（默认ERROR，排除日志输出开销）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.ERROR))
+    legacy_class = load_baseline_engine(args.baseline_rev)
+    print(f"基准版本: {args.baseline_rev}")
+    run_benchmark(legacy_class, args.rounds, args.purge_re_cache)
+    if args.fuzz:
+        run_fuzz(legacy_class, args.fuzz, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,8 @@ def check_dependencies():
         storage_type = os.getenv('STORAGE_TYPE', 'excel')
         if storage_type == 'csv':
             print("✓ 使用CSV存储模式（无pandas依赖）")
+        elif storage_type == 'sqlite':
+            print("✓ 使用SQLite存储模式（WAL + 索引查询）")
         else:
             try:
                 import pandas
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the batched storage writer and file batch processing
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services import batch_processor
+from app.services.batch_processor import BatchProcessor, StorageWriteBuffer
+
+
+class RecordingStorage:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def add_invoices(self, records):
+        if self.fail:
+            raise IOError("disk full")
+        self.batches.append([record['file_path'] for record in records])
+        return list(range(1, len(records) + 1))
+
+
+class TestStorageWriteBuffer:
+    """Test flushing by record count, by age and on failure"""
+
+    @pytest.mark.unit
+    def test_flushes_every_n_records(self):
+        """Records are written in blocks of max_records plus a final partial block"""
+        storage = RecordingStorage()
+        writer = StorageWriteBuffer(storage, max_records=2, max_seconds=60)
+        for name in ('a', 'b', 'c'):
+            writer.add({'file_path': name})
+
+        assert storage.batches == [['a', 'b']]
+        writer.flush()
+        assert storage.batches == [['a', 'b'], ['c']]
+        assert writer.written == 3
+
+    @pytest.mark.unit
+    def test_flushes_after_interval(self):
+        """A partial block is written once its oldest record has waited max_seconds"""
+        storage = RecordingStorage()
+        writer = StorageWriteBuffer(storage, max_records=100, max_seconds=0.05)
+        writer.add({'file_path': 'a'})
+        writer.flush_if_due()
+        assert storage.batches == []
+
+        time.sleep(0.06)
+        writer.flush_if_due()
+        assert storage.batches == [['a']]
+
+    @pytest.mark.unit
+    def test_failed_write_is_reported(self):
+        """Records that could not be written are handed to on_failed"""
+        failed = []
+        writer = StorageWriteBuffer(RecordingStorage(fail=True), max_records=1, max_seconds=60,
+                                    on_failed=failed.extend)
+        writer.add({'file_path': 'a'})
+
+        assert failed == [{'file_path': 'a'}]
+        assert writer.written == 0
+
+
+class TestProcessFilesHashing:
+    """Test that each candidate file is hashed only once"""
+
+    @pytest.mark.unit
+    def test_dedup_hash_is_passed_to_ocr(self, tmp_path, monkeypatch):
+        """The hash computed for the duplicate check reaches the OCR service"""
+        from app.services.file_service import FileService
+        from app.services.invoice_service_minimal import InvoiceServiceMinimal
+        from app.services.scan_manifest import ScanManifest
+
+        invoice = tmp_path / 'a.pdf'
+        invoice.write_bytes(b'%PDF-1.4 test')
+        hashed = []
+        received = []
+
+        class FakeOCR:
+            def process_invoice_file(self, file_path, file_hash=None):
+                received.append(file_hash)
+                return {}
+
+        file_service = FileService()
+        get_file_hash = file_service.get_file_hash
+        monkeypatch.setattr(file_service, 'get_file_hash', lambda path: hashed.append(path) or get_file_hash(path))
+        monkeypatch.setattr(file_service, 'is_valid_file', lambda path: True)
+        service = InvoiceServiceMinimal.__new__(InvoiceServiceMinimal)
+        service.file_service = file_service
+        service.ocr_service = FakeOCR()
+        service.storage = RecordingStorage()
+        service.storage.get_invoice_by_file_path = lambda path: None
+        service.storage.find_by_file_hash = lambda file_hash: None
+        service.storage.flush = lambda: None
+
+        service.process_files([(str(invoice), 'pdf')], workers=1,
+                              manifest=ScanManifest(str(tmp_path / 'manifest.json')))
+
+        assert hashed == [str(invoice)]
+        assert received == [get_file_hash(str(invoice))]
+
+
+class TestBatchProcessorCancel:
+    """Test cancelling a parallel run"""
+
+    @pytest.mark.unit
+    def test_completed_file_is_stored_before_cancel(self, monkeypatch):
+        """A result that finished when cancel was requested is still stored and reported"""
+        cancel_event = threading.Event()
+
+        def process_file(file_path, file_type, file_hash):
+            # Cancel arrives while the first file is being processed
+            cancel_event.set()
+            return file_path, file_type, {'invoice_number': file_path}
+
+        monkeypatch.setattr(batch_processor, 'ProcessPoolExecutor',
+                            lambda max_workers, mp_context, initializer, initargs: ThreadPoolExecutor(max_workers))
+        monkeypatch.setattr(batch_processor, '_process_file_in_worker', process_file)
+        stored, completed = [], []
+
+        files = [(f'{index}.pdf', 'pdf') for index in range(5)]
+        stats = BatchProcessor(object, workers=1).run(
+            files, lambda file_path, file_type, info: stored.append(file_path) or True,
+            on_complete=lambda path, status: completed.append((path, status)),
+            cancel_event=cancel_event)
+
+        assert stats == {'processed': 1, 'failed': 0}
+        assert len(stored) == 1
+        assert completed == [(stored[0], 'processed')]
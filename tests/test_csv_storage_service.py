@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the CSV storage service
+"""
+
+import os
+import pytest
+
+from app.services.csv_storage_service import CSVStorageService
+from app.services.invoice_query import encode_cursor
+
+
+@pytest.fixture(scope="function")
+def csv_storage(tmp_path):
+    """Create a CSV storage service backed by a temporary file"""
+    return CSVStorageService(str(tmp_path / "invoices.csv"), fsync_batch_size=2)
+
+
+class TestCSVAppendWrites:
+    """Test append-only write path"""
+
+    @pytest.mark.unit
+    def test_add_invoice_appends_rows(self, csv_storage, sample_invoice_data):
+        """Each insert appends one row and ids increase monotonically"""
+        first_id = csv_storage.add_invoice(sample_invoice_data)
+        size_after_first = os.path.getsize(csv_storage.get_csv_file_path())
+
+        second = dict(sample_invoice_data, file_path='/test/path/second.pdf')
+        second_id = csv_storage.add_invoice(second)
+
+        assert (first_id, second_id) == (1, 2)
+        assert os.path.getsize(csv_storage.get_csv_file_path()) > size_after_first
+        assert csv_storage.get_invoice_by_file_path('/test/path/second.pdf')['id'] == 2
+
+    @pytest.mark.unit
+    def test_max_id_survives_new_instance(self, csv_storage, sample_invoice_data):
+        """A second service instance continues from the persisted max id"""
+        csv_storage.add_invoice(sample_invoice_data)
+        csv_storage.add_invoice(dict(sample_invoice_data, file_path='/b.pdf'))
+
+        other = CSVStorageService(csv_storage.get_csv_file_path())
+        assert other.add_invoice(dict(sample_invoice_data, file_path='/c.pdf')) == 3
+
+    @pytest.mark.unit
+    def test_delete_and_compact(self, csv_storage, sample_invoice_data):
+        """Deleting and compacting keep ids stable"""
+        for name in ('a', 'b', 'c'):
+            csv_storage.add_invoice(dict(sample_invoice_data, file_path=f'/{name}.pdf'))
+
+        assert csv_storage.delete_invoice_by_file_path('/b.pdf')
+        assert csv_storage.compact() == 2
+        assert csv_storage.add_invoice(dict(sample_invoice_data, file_path='/d.pdf')) == 4
+
+        ids = sorted(row['id'] for row in csv_storage.get_all_invoices())
+        assert ids == [1, 3, 4]
+
+
+class TestCSVDeduplication:
+    """Test content-hash and invoice-number indexes"""
+
+    @pytest.mark.unit
+    def test_hash_and_semantic_duplicates(self, csv_storage, sample_invoice_data):
+        """Hash lookups hit, and a repeated invoice number is flagged at insert"""
+        first_id = csv_storage.add_invoice(dict(sample_invoice_data, file_hash='h1'))
+        second_id = csv_storage.add_invoice(dict(sample_invoice_data, file_path='/copy.pdf', file_hash='h2'))
+
+        assert csv_storage.find_by_file_hash('h1') == first_id
+        assert csv_storage.find_by_file_hash('missing') is None
+        assert csv_storage.get_invoice_by_file_path('/copy.pdf')['duplicate_of'] == str(first_id)
+
+        # Indexes are rebuilt from the file for a fresh process
+        other = CSVStorageService(csv_storage.get_csv_file_path())
+        assert other.find_by_file_hash('h2') == second_id
+        assert other.find_duplicate_invoice('12345678', '123456789012345678') == first_id
+
+    @pytest.mark.unit
+    def test_old_header_is_migrated(self, tmp_path, sample_invoice_data):
+        """A CSV written before the hash columns existed is rewritten with them"""
+        path = tmp_path / "old.csv"
+        path.write_text("id,file_path,invoice_number\n1,/old.pdf,A1\n", encoding='utf-8')
+
+        storage = CSVStorageService(str(path))
+        new_id = storage.add_invoice(dict(sample_invoice_data, file_hash='h1'))
+
+        assert new_id == 2
+        assert storage.get_invoice_by_file_path('/old.pdf')['invoice_number'] == 'A1'
+        assert storage.get_invoice_by_file_path(sample_invoice_data['file_path'])['file_hash'] == 'h1'
+
+    @pytest.mark.unit
+    def test_add_invoices_writes_block(self, csv_storage, sample_invoice_data):
+        """A batch gets consecutive ids and earlier rows of the same batch count as duplicates"""
+        csv_storage.add_invoice(dict(sample_invoice_data, invoice_number='1'))
+        ids = csv_storage.add_invoices([
+            dict(sample_invoice_data, file_path='/a.pdf', invoice_number='2', file_hash='ha'),
+            dict(sample_invoice_data, file_path='/b.pdf', invoice_number='2'),
+        ])
+
+        assert ids == [2, 3]
+        assert csv_storage.find_by_file_hash('ha') == 2
+        assert csv_storage.get_invoice_by_file_path('/b.pdf')['duplicate_of'] == '2'
+        assert csv_storage.add_invoices([]) == []
+
+    @pytest.mark.unit
+    def test_file_path_lookup_uses_index(self, csv_storage, sample_invoice_data, monkeypatch):
+        """Path lookups are answered from the index and follow later appends"""
+        csv_storage.add_invoice(dict(sample_invoice_data, file_path='/a.pdf'))
+        assert csv_storage.get_invoice_by_file_path('/a.pdf')['id'] == 1
+
+        loads = []
+        load_data = csv_storage._load_data
+        monkeypatch.setattr(csv_storage, '_load_data', lambda: loads.append(1) or load_data())
+        for name in range(20):
+            assert csv_storage.get_invoice_by_file_path(f'/missing{name}.pdf') is None
+        assert csv_storage.get_invoice_by_file_path('/a.pdf')['id'] == 1
+        assert loads == []
+
+        csv_storage.add_invoice(dict(sample_invoice_data, file_path='/b.pdf'))
+        assert csv_storage.get_invoice_by_file_path('/b.pdf')['id'] == 2
+        assert CSVStorageService(csv_storage.get_csv_file_path()).get_invoice_by_file_path('/b.pdf')['id'] == 2
+
+
+    @pytest.mark.unit
+    def test_same_size_external_rewrite_is_detected(self, csv_storage, sample_invoice_data):
+        """An external edit that keeps the byte length still invalidates the cached indexes"""
+        csv_storage.add_invoice(dict(sample_invoice_data, file_hash='h1'))
+        assert csv_storage.find_by_file_hash('h1') == 1
+
+        path = csv_storage.get_csv_file_path()
+        with open(path, 'rb') as f:
+            content = f.read()
+        size = os.path.getsize(path)
+        stat = os.stat(path)
+        with open(path, 'wb') as f:
+            f.write(content.replace(b',h1,', b',h9,'))
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert os.path.getsize(path) == size
+
+        assert csv_storage.find_by_file_hash('h1') is None
+        assert csv_storage.find_by_file_hash('h9') == 1
+
+class TestCSVQuery:
+    """Filtering, sorting and cursor pagination over the cached query index"""
+
+    @pytest.fixture
+    def populated(self, csv_storage, sample_invoice_data):
+        rows = [
+            ('/1.pdf', 'N1', '2024-1-5', 100.0, '上海甲公司'),
+            ('/2.pdf', 'N2', '2024年02月10日', 250.0, '北京乙公司'),
+            ('/3.pdf', 'N3', '2024-03-01', 250.0, '上海丙公司'),
+            ('/4.pdf', 'N4', '2024-04-20', None, 'Acme Ltd'),
+            ('/5.pdf', 'N5', '', 80.0, '上海甲公司'),
+        ]
+        csv_storage.add_invoices([
+            dict(sample_invoice_data, file_path=path, invoice_number=number, invoice_date=date,
+                 total_amount=amount, seller_name=seller)
+            for path, number, date, amount, seller in rows
+        ])
+        return csv_storage
+
+    @pytest.mark.unit
+    def test_filters(self, populated):
+        """Substring, amount range and normalized date range filters combine"""
+        def numbers(**filters):
+            return sorted(r['invoice_number'] for r in populated.query_invoices(filters)['invoices'])
+
+        assert numbers(seller_name='上海') == ['N1', 'N3', 'N5']
+        assert numbers(seller_name='acme') == ['N4']
+        assert numbers(min_amount=90, max_amount=250) == ['N1', 'N2', 'N3']
+        assert numbers(start_date='2024-02-01', end_date='2024-03-31') == ['N2', 'N3']
+        assert numbers(seller_name='上海', min_amount=200) == ['N3']
+        assert numbers(buyer_name='不存在') == []
+
+    @pytest.mark.unit
+    def test_cursor_pages_match_full_sort(self, populated):
+        """Walking pages by cursor yields the full order with nulls last"""
+        for sort_order in ('asc', 'desc'):
+            full = populated.query_invoices(sort_by='total_amount', sort_order=sort_order, limit=10)
+            seen, cursor = [], None
+            while True:
+                page = populated.query_invoices(sort_by='total_amount', sort_order=sort_order,
+                                                limit=2, cursor=cursor)
+                seen.extend(r['invoice_number'] for r in page['invoices'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            assert seen == [r['invoice_number'] for r in full['invoices']]
+            assert seen[-1] == 'N4'
+        assert seen[:3] == ['N3', 'N2', 'N1']
+
+        cursor = populated.query_invoices(sort_by='total_amount', limit=1)['next_cursor']
+        with pytest.raises(ValueError):
+            populated.query_invoices(sort_by='invoice_date', cursor=cursor)
+
+    @pytest.mark.unit
+    def test_malformed_cursor_values_are_rejected(self, populated):
+        """A well-formed cursor whose values have the wrong types is a ValueError, not a TypeError"""
+        for key in ((False, 'abc', 1), ('yes', 100.0, 1), (False, 100.0, '1'), (False, True, 1)):
+            cursor = encode_cursor('total_amount', 'asc', key)
+            with pytest.raises(ValueError):
+                populated.query_invoices(sort_by='total_amount', sort_order='asc', cursor=cursor)
+        cursor = encode_cursor('invoice_date', 'asc', (False, 20240101, 1))
+        with pytest.raises(ValueError):
+            populated.query_invoices(sort_by='invoice_date', sort_order='asc', cursor=cursor)
+
+
+class TestCSVStats:
+    """Running aggregates persisted next to the CSV"""
+
+    @pytest.mark.unit
+    def test_stats_follow_appends_and_deletes(self, csv_storage, sample_invoice_data):
+        """Appends update the sidecar incrementally; rewrites recompute it"""
+        csv_storage.add_invoices([
+            dict(sample_invoice_data, file_path='/a.pdf', invoice_number='A', total_amount=100.0),
+            dict(sample_invoice_data, file_path='/b.pdf', invoice_number='B', total_amount=300.0,
+                 file_type='image', invoice_date='2024年2月3日'),
+        ])
+        stats = csv_storage.get_invoice_stats()
+
+        assert stats['total_invoices'] == 2
+        assert stats['total_amount'] == 400.0
+        assert stats['avg_amount'] == 200.0
+        assert (stats['min_amount'], stats['max_amount']) == (100.0, 300.0)
+        assert stats['by_file_type'] == {'pdf': 1, 'image': 1}
+        assert stats['by_month'] == {'2024-01': {'count': 1, 'total_amount': 100.0},
+                                     '2024-02': {'count': 1, 'total_amount': 300.0}}
+        assert stats['top_sellers'][0]['count'] == 2
+        assert csv_storage.stats_path.exists()
+
+        csv_storage.delete_invoice_by_file_path('/b.pdf')
+        reopened = CSVStorageService(str(csv_storage.csv_file_path))
+        stats = reopened.get_invoice_stats()
+        assert stats['total_invoices'] == 1
+        assert stats['max_amount'] == 100.0
+        assert stats['by_file_type'] == {'pdf': 1}
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the append-only error log
+"""
+
+import json
+import threading
+import pytest
+
+from app.services.error_log import ErrorLog, get_error_log
+
+
+def entry(n, error_type='low_confidence'):
+    return {'original_path': f'/{n}.pdf', 'error_type': error_type, 'confidence_score': 0.5}
+
+
+class TestErrorLog:
+    """Test concurrent appends, rotation and incremental counters"""
+
+    @pytest.mark.unit
+    def test_concurrent_appends_are_not_lost(self, tmp_path):
+        """Threads append without a lock and every line survives"""
+        log = ErrorLog(str(tmp_path / 'error_log.jsonl'))
+        threads = [threading.Thread(target=lambda t=t: [log.append(entry(t * 100 + i)) for i in range(100)])
+                   for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        lines = (tmp_path / 'error_log.jsonl').read_text(encoding='utf-8').splitlines()
+        assert len(lines) == 400
+        assert log.statistics()['total_errors'] == 400
+
+    @pytest.mark.unit
+    def test_counters_follow_other_writers_and_rotation(self, tmp_path):
+        """Counters pick up appends from another writer and survive rotation"""
+        path = str(tmp_path / 'error_log.jsonl')
+        reader = ErrorLog(path, max_bytes=400, backups=5)
+        writer = ErrorLog(path, max_bytes=400, backups=5)
+
+        writer.append(entry(0, 'parsing_errors'))
+        assert reader.statistics()['error_types'] == {'parsing_errors': 1}
+
+        for n in range(1, 12):
+            writer.append(entry(n))
+        assert (tmp_path / 'error_log.jsonl.1').exists()
+
+        stats = reader.statistics()
+        assert stats['total_errors'] == 12
+        assert stats['error_types'] == {'parsing_errors': 1, 'low_confidence': 11}
+        assert stats['recent_errors'][-1]['original_path'] == '/11.pdf'
+        assert stats['avg_confidence'] == pytest.approx(0.5)
+
+    @pytest.mark.unit
+    def test_legacy_json_log_is_converted(self, tmp_path):
+        """The old rewrite-everything JSON file becomes JSONL once"""
+        legacy = tmp_path / 'error_log.json'
+        legacy.write_text(json.dumps([entry(1), entry(2)]), encoding='utf-8')
+
+        log = get_error_log(str(tmp_path / 'error_log.jsonl'), str(legacy))
+
+        assert not legacy.exists()
+        assert log.statistics()['total_errors'] == 2
+
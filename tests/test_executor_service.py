@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the per-category executors and their metrics
+"""
+
+import asyncio
+import threading
+import pytest
+
+from app.services.executor_service import CategoryExecutor
+
+
+class TestCategoryExecutor:
+    """Test queue, completion and failure counters"""
+
+    @pytest.mark.unit
+    def test_failures_are_not_counted_as_completed(self):
+        """A raising call only increments failed"""
+        executor = CategoryExecutor('test', 1)
+
+        def fail():
+            raise RuntimeError("boom")
+
+        async def main():
+            assert await executor.run(lambda: 42) == 42
+            with pytest.raises(RuntimeError):
+                await executor.run(fail)
+
+        asyncio.run(main())
+        metrics = executor.get_metrics()
+        assert (metrics['completed'], metrics['failed'], metrics['active'], metrics['queued']) == (1, 1, 0, 0)
+
+    @pytest.mark.unit
+    def test_cancelled_waiter_releases_queue_slot(self):
+        """A request cancelled before its job starts does not leave a queued job behind"""
+        executor = CategoryExecutor('test', 1)
+        release = threading.Event()
+
+        async def main():
+            blocker = asyncio.ensure_future(executor.run(release.wait))
+            waiting = asyncio.ensure_future(executor.run(lambda: 1))
+            await asyncio.sleep(0.05)
+            assert executor.get_metrics()['queued'] == 1
+            waiting.cancel()
+            await asyncio.sleep(0.05)
+            release.set()
+            await blocker
+
+        asyncio.run(main())
+        metrics = executor.get_metrics()
+        assert (metrics['queued'], metrics['active'], metrics['completed']) == (0, 0, 1)
+        executor.executor.shutdown()
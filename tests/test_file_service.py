@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for streaming uploads and incremental scanning in the file service
+"""
+
+import hashlib
+import io
+import os
+import pytest
+from starlette.datastructures import Headers, UploadFile
+
+from app.services.file_service import FileService
+from app.services.scan_manifest import ScanManifest
+
+
+def make_upload(filename, content, content_type="application/pdf"):
+    return UploadFile(
+        file=io.BytesIO(content),
+        filename=filename,
+        headers=Headers({"content-type": content_type})
+    )
+
+
+class TestStreamingUpload:
+    """Test chunked upload saving"""
+
+    @pytest.mark.unit
+    def test_upload_is_hashed_and_renamed(self, tmp_path):
+        """Saved file is moved into the PDF directory with its hashes"""
+        service = FileService(str(tmp_path / "invoices"))
+        content = b"%PDF-1.4 " + b"x" * 3000
+
+        result = service.save_uploaded_file(make_upload("a.pdf", content))
+
+        assert result['success']
+        assert result['file_size'] == len(content)
+        assert result['md5'] == hashlib.md5(content).hexdigest()
+        assert result['sha256'] == hashlib.sha256(content).hexdigest()
+        assert (service.pdf_dir / "a.pdf").read_bytes() == content
+        assert [p.name for p in service.pdf_dir.iterdir()] == ["a.pdf"]
+
+    @pytest.mark.unit
+    def test_oversized_upload_is_rejected(self, tmp_path):
+        """Uploads over the size limit leave no file behind"""
+        service = FileService(str(tmp_path / "invoices"), max_file_size=1024)
+
+        result = service.save_uploaded_file(make_upload("big.pdf", b"0" * 4096))
+
+        assert not result['success']
+        assert list(service.pdf_dir.iterdir()) == []
+
+
+def age(path, seconds=60):
+    """Push mtime into the past so the directory is not treated as just modified"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - int(seconds * 1e9)))
+
+
+class TestIncrementalScan:
+    """Test manifest-based directory scanning"""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        return FileService(str(tmp_path / "invoices"))
+
+    @staticmethod
+    def write_pdf(directory, name):
+        path = directory / name
+        path.write_bytes(b"%PDF-1.4 " + b"x" * 200)
+        return str(path)
+
+    @pytest.mark.unit
+    def test_only_new_and_unprocessed_files_are_returned(self, service, tmp_path):
+        """Processed files drop out; a new file is the only one returned on the next scan"""
+        manifest_path = tmp_path / "manifest.json"
+        first = self.write_pdf(service.pdf_dir, "a.pdf")
+        (service.pdf_dir / "notes.txt").write_text("not an invoice")
+
+        manifest = ScanManifest(manifest_path)
+        assert service.scan_changed_files(manifest) == [(first, 'pdf')]
+        manifest.mark(first, 'processed', 'abc')
+        manifest.save()
+
+        manifest = ScanManifest(manifest_path)
+        assert service.scan_changed_files(manifest) == []
+        assert manifest.files[first]['hash'] == 'abc'
+
+        second = self.write_pdf(service.pdf_dir, "b.pdf")
+        assert service.scan_changed_files(manifest) == [(second, 'pdf')]
+
+    @pytest.mark.unit
+    def test_unchanged_directory_is_not_listed(self, service, tmp_path, monkeypatch):
+        """Directories whose mtime matches the manifest are not scanned again"""
+        nested = service.pdf_dir / "2024"
+        nested.mkdir()
+        path = self.write_pdf(nested, "a.pdf")
+        for directory in (nested, service.pdf_dir, service.image_dir):
+            age(directory)
+
+        manifest = ScanManifest(tmp_path / "manifest.json")
+        assert service.scan_changed_files(manifest) == [(path, 'pdf')]
+
+        listed = []
+        original = os.scandir
+        monkeypatch.setattr(os, "scandir", lambda d: listed.append(d) or original(d))
+        assert service.scan_changed_files(manifest) == [(path, 'pdf')]
+        assert listed == []
+
+    @pytest.mark.unit
+    def test_modified_and_deleted_files(self, tmp_path):
+        """With rechecking on, a file rewritten in an unchanged directory becomes pending again"""
+        service = FileService(str(tmp_path / "invoices"), recheck_files=True)
+        manifest = ScanManifest(tmp_path / "manifest.json")
+        kept = self.write_pdf(service.pdf_dir, "a.pdf")
+        removed = self.write_pdf(service.pdf_dir, "b.pdf")
+        for directory in (service.pdf_dir, service.image_dir):
+            age(directory)
+        service.scan_changed_files(manifest)
+        manifest.mark(kept, 'processed')
+        manifest.mark(removed, 'processed')
+
+        # Rewriting in place leaves the directory mtime untouched
+        mtime_ns = os.stat(service.pdf_dir).st_mtime_ns
+        with open(kept, "ab") as f:
+            f.write(b"more")
+        assert os.stat(service.pdf_dir).st_mtime_ns == mtime_ns
+        assert service.scan_changed_files(manifest) == [(kept, 'pdf')]
+        manifest.mark(kept, 'processed')
+
+        os.remove(removed)
+        assert service.scan_changed_files(manifest) == []
+        assert removed not in manifest.files
+
+    @pytest.mark.unit
+    def test_in_place_rewrite_is_not_rechecked_by_default(self, service, tmp_path, monkeypatch):
+        """Without rechecking, files in an unchanged directory are not stat'ed"""
+        manifest = ScanManifest(tmp_path / "manifest.json")
+        path = self.write_pdf(service.pdf_dir, "a.pdf")
+        for directory in (service.pdf_dir, service.image_dir):
+            age(directory)
+        service.scan_changed_files(manifest)
+        manifest.mark(path, 'processed')
+
+        with open(path, "ab") as f:
+            f.write(b"more")
+        stat_calls = []
+        original = os.stat
+        monkeypatch.setattr(os, "stat", lambda p, *a, **k: stat_calls.append(str(p)) or original(p, *a, **k))
+        assert service.scan_changed_files(manifest) == []
+        assert path not in stat_calls
+
+    @pytest.mark.unit
+    def test_failed_files_are_retried_only_after_change(self, service, tmp_path):
+        """A failed file is not returned again until its size or mtime changes"""
+        manifest = ScanManifest(tmp_path / "manifest.json")
+        path = self.write_pdf(service.pdf_dir, "a.pdf")
+        for directory in (service.pdf_dir, service.image_dir):
+            age(directory)
+        service.scan_changed_files(manifest)
+
+        manifest.mark(path, 'failed')
+        assert service.scan_changed_files(manifest) == []
+        assert manifest.files[path]['status'] == 'failed'
+
+        with open(path, "ab") as f:
+            f.write(b"fixed")
+        assert service.scan_changed_files(manifest) == [(path, 'pdf')]
+        manifest.mark(path, 'processed')
+        assert service.scan_changed_files(manifest) == []
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Regression tests for the rule-based invoice recognition engine
+
+Sample texts live in benchmarks/samples and are shared with the micro-benchmark.
+"""
+
+from pathlib import Path
+import random
+import pytest
+
+from app.services.invoice_recognition_engine import InvoiceRecognitionEngine
+
+SAMPLES_DIR = Path(__file__).resolve().parent.parent / "benchmarks" / "samples"
+
+EXPECTED = {
+    "electronic_standard.txt": {
+        'invoice_type': 'electronic',
+        'invoice_number': '24332000000123456789',
+        'invoice_date': '2024-03-15',
+        'seller_name': '杭州云帆网络科技有限公司',
+        'seller_tax_number': '91330106MA2CFQ8L5X',
+        'buyer_name': '宁波牧柏科技咨询有限公司',
+        'buyer_tax_number': '91330225MA2J4X2M2B',
+        'total_amount': 1000.0,
+        'invoice_content': '*信息技术服务*技术服务费',
+    },
+    "special_vat.txt": {
+        'invoice_type': 'special',
+        'invoice_number': '03951872',
+        'invoice_date': '2023-11-02',
+        'seller_name': '宁波文远办公用品有限公司',
+        'seller_tax_number': '91330201MA28A1B2C3',
+        'total_amount': 1000.05,
+        'invoice_content': '*办公用品*打印纸',
+    },
+    "fuel_station.txt": {
+        'invoice_type': 'fuel',
+        'invoice_number': '45678901',
+        'invoice_date': '2024-1-8',
+        'seller_name': '中国石化销售股份有限公司浙江宁波石油分公司',
+        'seller_tax_number': '913302007900726311',
+        'amount_without_tax': 268.83,
+        'tax_amount': 34.95,
+        'total_amount': 303.78,
+        'invoice_content': '*汽油*92号车用汽油(VIB)',
+    },
+    "ocr_noisy.txt": {
+        'invoice_number': '12345678901',
+        'invoice_date': '2022-7-21',
+        'seller_name': '上海星联贸易商行',
+        'buyer_tax_number': '91330225MA2J4X2M2B',
+        'amount_without_tax': 520.0,
+        'tax_amount': 30.0,
+        'total_amount': 550.0,
+        'recognition_attempts': 2,
+    },
+    "tax_exempt.txt": {
+        'invoice_number': '24442000000987654321',
+        'invoice_date': '2024-6-30',
+        'seller_name': '宁波市象山县丹城老李餐饮店',
+        'seller_tax_number': '92330225MA2H7KXX1N',
+        'amount_without_tax': 268.0,
+        'tax_amount': 0.0,
+        'total_amount': 268.0,
+    },
+    "long_itemized.txt": {
+        'invoice_type': 'special',
+        'invoice_number': '24332000000555501234',
+        'invoice_date': '2024-09-12',
+        'seller_name': '宁波市鄞州区百汇办公用品商行',
+        'seller_tax_number': '92330212MA2GQ8RT6W',
+        'buyer_tax_number': '91330225MA2J4X2M2B',
+        'amount_without_tax': 3519.14,
+        'tax_amount': 0.0,
+        'total_amount': 3519.14,
+        'recognition_attempts': 1,
+    },
+    "unrecognizable.txt": {
+        'invoice_number': None,
+        'invoice_date': None,
+        'total_amount': None,
+        'recognition_attempts': 3,
+    },
+}
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return InvoiceRecognitionEngine()
+
+
+class TestInvoiceRecognitionEngine:
+    """Test field extraction on the sample corpus"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("sample_name", sorted(EXPECTED))
+    def test_sample_extraction(self, engine, sample_name):
+        """Extracted fields match the expected values for each sample"""
+        text = (SAMPLES_DIR / sample_name).read_text(encoding="utf-8")
+        info = engine.extract_invoice_info(text)
+
+        for field, expected in EXPECTED[sample_name].items():
+            assert info[field] == expected, field
+
+    @pytest.mark.unit
+    def test_rules_are_precompiled(self):
+        """All rule patterns are compiled at class load"""
+        for name, rule in InvoiceRecognitionEngine.RULES.items():
+            patterns = rule if isinstance(rule, tuple) else (rule,)
+            assert all(hasattr(pattern, 'search') for pattern in patterns), name
+
+    @pytest.mark.unit
+    def test_company_lines_match_full_text_search(self, engine):
+        """Matching only lines with a company suffix finds the same names as a full-text search"""
+        pattern = InvoiceRecognitionEngine.RULES['company']
+        texts = [(SAMPLES_DIR / name).read_text(encoding="utf-8") for name in sorted(EXPECTED)]
+        texts += ["甲乙有限公司丙丁店\n\n名称：宁波商行", "无后缀的一行\r\n尾行厂", "店"]
+
+        for text in texts:
+            expected = [(m.start(), m.group(1)) for m in pattern.finditer(text)]
+            assert [(m.start(), m.group(1)) for m in engine._iter_company_matches(text)] == expected
+
+    @pytest.mark.unit
+    def test_invoice_type_follows_keyword_edits(self):
+        """Invoice type detection uses the engine's current keyword lists"""
+        engine = InvoiceRecognitionEngine()
+        text = "机动车销售统一发票\n合计 ¥100.00"
+        assert engine._identify_invoice_type(text) == 'electronic'
+
+        engine.invoice_type_keywords['special'].append('机动车销售统一发票')
+        assert engine._identify_invoice_type(text) == 'special'
+
+        engine.invoice_type_keywords['fuel'].append('机动车')
+        assert engine._identify_invoice_type(text) == 'fuel'
+
+    @pytest.mark.unit
+    def test_leading_separators_stay_in_amounts(self, engine):
+        """An amount written as ",.30" is read as 0.30"""
+        assert engine.extract_invoice_info("电子发票\n金额 ,.30\n")['total_amount'] == 0.3
+
+    @pytest.mark.unit
+    def test_amount_pairing_matches_pairwise_search(self, engine):
+        """Cent-bucket pairing picks the same combination as comparing every pair"""
+        def pairwise(amounts, total):
+            best, min_diff = None, float('inf')
+            for a in amounts:
+                for b in amounts:
+                    diff = abs(max(a, b) + min(a, b) - total)
+                    if a != b and diff < min_diff and diff < 0.01:
+                        best, min_diff = (max(a, b), min(a, b)), diff
+            return best
+
+        rng = random.Random(0)
+        for _ in range(300):
+            total = round(rng.uniform(1, 500), 2)
+            amounts = sorted({round(rng.uniform(0.01, total), 2) for _ in range(rng.randint(2, 40))}, reverse=True)
+            if rng.random() < 0.5:
+                amounts.append(round(total - amounts[0], 2))
+            info = {}
+
+            engine._match_amount_combination(amounts, total, info)
+
+            expected = pairwise(amounts, total)
+            if expected:
+                assert (info['amount_without_tax'], info['tax_amount']) == expected
+
+    @pytest.mark.unit
+    def test_amount_pairing_infers_tax_rate(self, engine):
+        """Without an exact pair the 9% split is recovered from near matches"""
+        info = {}
+        engine._match_amount_combination([91.75, 8.26, 3.0], 100.0, info)
+
+        assert (info['amount_without_tax'], info['tax_amount']) == (91.74, 8.26)
+
+
+class TestExtractBatch:
+    """Test bulk re-extraction over many texts"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_batch_matches_single_calls_in_order(self, engine, workers):
+        """Batch results equal per-text results and keep input order"""
+        texts = [(SAMPLES_DIR / name).read_text(encoding="utf-8") for name in sorted(EXPECTED)] * 3
+
+        results = engine.extract_batch(texts, workers=workers, chunksize=4)
+
+        assert results == [engine.extract_invoice_info(text) for text in texts]
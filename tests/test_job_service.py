@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for job progress events and SSE resumption
+"""
+
+import pytest
+
+from app.services.job_service import ProcessingJob
+
+
+def make_job(count, max_events=5):
+    job = ProcessingJob('test', max_events=max_events)
+    for index in range(1, count + 1):
+        job.add_event('progress', {'index': index})
+    return job
+
+
+class TestEventResume:
+    """Test resuming the event stream from a Last-Event-ID"""
+
+    @pytest.mark.unit
+    def test_resume_within_retained_events(self):
+        """Events after the given seq are returned without a reset"""
+        job = make_job(8)
+
+        reset_seq, events = job.events_since(5)
+
+        assert reset_seq is None
+        assert [event['seq'] for event in events] == [6, 7, 8]
+        assert job.events_since(8) == (None, [])
+
+    @pytest.mark.unit
+    def test_evicted_seq_requests_reset(self):
+        """A seq whose successors were dropped resumes after a reset from the oldest retained event"""
+        job = make_job(8)
+
+        reset_seq, events = job.events_since(1)
+        assert reset_seq == 3
+        assert [event['seq'] for event in events] == [4, 5, 6, 7, 8]
+
+        # An id from the future (e.g. another job) is also reset
+        reset_seq, events = job.events_since(42)
+        assert reset_seq == 3
+        assert len(events) == 5
+
+    @pytest.mark.unit
+    def test_stream_honours_last_event_id(self, monkeypatch):
+        """The SSE endpoint resumes from the Last-Event-ID header and ends after done"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from app.api.jobs import router
+        from app.services.job_service import job_manager
+
+        job = make_job(8)
+        job.status = 'completed'
+        job.add_event('done', job.to_dict())
+        monkeypatch.setattr(job_manager, 'get_job', lambda job_id: job if job_id == job.job_id else None)
+        app = FastAPI()
+        app.include_router(router)
+        client = TestClient(app)
+        url = f"/api/invoices/jobs/{job.job_id}/events"
+
+        body = client.get(url, headers={'Last-Event-ID': '6'}).text
+        assert body.startswith('id: 7\nevent: progress\n')
+        assert 'event: reset' not in body
+
+        body = client.get(url, headers={'Last-Event-ID': '2'}).text
+        assert body.startswith('id: 4\nevent: reset\n')
+        assert 'id: 5\nevent: progress\n' in body
+
+        assert client.get(url, headers={'Last-Event-ID': '9'}).text == ''
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for page-aware PDF text extraction
+"""
+
+import pytest
+
+from app.services.pdf_processor import PDFProcessor
+
+INVOICE_PAGE = (
+    "电子发票（普通发票）\n发票号码：24332000000012345678\n开票日期：2024年03月05日\n"
+    "购买方 统一社会信用代码/纳税人识别号：91330225MA2J4X2M2B\n"
+    "销售方 统一社会信用代码/纳税人识别号：91330200MA28XYZ12Q\n"
+    "开户行及账号：中国银行宁波分行 6217000010001234567\n"
+    "合 计\n¥30.99\n¥4.03\n"
+    "价税合计（大写）叁拾伍圆零贰分\n（小写）\n¥35.02\n"
+)
+
+
+def reader(pages, calls):
+    def read_page(page_num):
+        calls.append(page_num)
+        return pages[page_num]
+    return read_page
+
+
+class TestPageCollection:
+    """Test early exit and the page limit"""
+
+    @pytest.mark.unit
+    def test_stops_after_invoice_page(self):
+        """Attachment pages after a complete invoice page are not read"""
+        calls = []
+        pages = [INVOICE_PAGE, "附件：行程单", "附件：清单"]
+
+        text = PDFProcessor()._collect_pages('test', len(pages), reader(pages, calls))
+
+        assert calls == [0]
+        assert text == INVOICE_PAGE + "\n"
+
+    @pytest.mark.unit
+    def test_account_numbers_do_not_count_as_tax_ids(self):
+        """Bank account numbers and English names are not mistaken for the seller tax ID"""
+        calls = []
+        first = INVOICE_PAGE.replace("销售方 统一社会信用代码/纳税人识别号：91330200MA28XYZ12Q\n", "ACMEINTERNATIONALLTD\n")
+        pages = [first, "销售方 纳税人识别号：\n91330200MA28XYZ12Q", "附件"]
+
+        PDFProcessor()._collect_pages('test', len(pages), reader(pages, calls))
+
+        assert calls == [0, 1]
+
+    @pytest.mark.unit
+    def test_fields_spread_over_pages_and_page_limit(self):
+        """Reading continues until every field has been seen, bounded by max_pages"""
+        head, tail = INVOICE_PAGE.split("价税合计")
+        pages = [head, "", "价税合计" + tail, "附件"]
+
+        calls = []
+        text = PDFProcessor()._collect_pages('test', len(pages), reader(pages, calls))
+        assert calls == [0, 1, 2]
+        assert text == head + "\n" + "价税合计" + tail + "\n"
+
+        calls = []
+        PDFProcessor(max_pages=2)._collect_pages('test', len(pages), reader(pages, calls))
+        assert calls == [0, 1]
+
+        calls = []
+        PDFProcessor(early_exit=False)._collect_pages('test', 2, reader([INVOICE_PAGE, "附件"], calls))
+        assert calls == [0, 1]
+
+
+class TestBackendRouting:
+    """Test the text-layer probe and the per-producer backend cache"""
+
+    @pytest.fixture
+    def processor(self, tmp_path):
+        processor = PDFProcessor()
+        processor.available_methods = ['pymupdf', 'pdfplumber', 'pdftotext']
+        processor.calls = []
+        for method, text in (('pymupdf', ''), ('pdfplumber', INVOICE_PAGE), ('pdftotext', INVOICE_PAGE)):
+            setattr(processor, f'extract_text_with_{method}',
+                    lambda path, method=method, text=text: processor.calls.append(method) or text)
+        processor._open_document = lambda path: (None, None)
+        processor._ocr_document = lambda backend, doc, ocr_page: processor.calls.append('ocr') or ocr_page(b'png')
+        (tmp_path / 'invoice.pdf').write_bytes(b'%PDF')
+        return processor
+
+    @pytest.mark.unit
+    def test_successful_backend_is_tried_first_for_same_producer(self, processor, tmp_path):
+        """A second document from the same producer skips the backend that failed before"""
+        path = str(tmp_path / 'invoice.pdf')
+        processor._probe_document = lambda backend, doc: {
+            'has_text_layer': True, 'document_class': 'routing-test | platform', 'page_count': 1,
+            'first_page_text': None}
+
+        assert processor.extract_text_from_pdf(path) == INVOICE_PAGE
+        assert processor.calls == ['pymupdf', 'pdfplumber']
+
+        processor.calls.clear()
+        assert processor.extract_text_from_pdf(path) == INVOICE_PAGE
+        assert processor.calls == ['pdfplumber']
+
+    @pytest.mark.unit
+    def test_scanned_pdf_goes_straight_to_ocr(self, processor, tmp_path):
+        """Without a text layer no text backend is attempted"""
+        path = str(tmp_path / 'invoice.pdf')
+        processor._probe_document = lambda backend, doc: {
+            'has_text_layer': False, 'document_class': 'routing-test | scanner', 'page_count': 1,
+            'first_page_text': None}
+
+        assert processor.extract_text_from_pdf(path) == ''
+        assert processor.extract_text_from_pdf(path, ocr_page=lambda png: 'OCR') == 'OCR'
+        assert processor.calls == ['ocr']
+
+
+class TestRealDocuments:
+    """Test the probe and extraction against generated PDFs"""
+
+    @pytest.fixture(params=['pymupdf', 'pdfplumber'])
+    def processor(self, request):
+        fitz = pytest.importorskip('fitz')
+        if request.param == 'pdfplumber':
+            pytest.importorskip('pdfplumber')
+        processor = PDFProcessor()
+        processor.available_methods = [request.param]
+        processor.fitz = fitz
+        return processor
+
+    def _text_pdf(self, fitz, path):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((50, 72), "Invoice No: 24332000000012345678 Total 35.02")
+        doc.new_page().insert_text((50, 72), "Attachment")
+        doc.set_metadata({'producer': 'test-generator'})
+        doc.save(str(path))
+        doc.close()
+
+    def _image_pdf(self, fitz, path):
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 40, 40), False)
+        pixmap.set_rect(pixmap.irect, (200, 200, 200))
+        doc = fitz.open()
+        doc.new_page().insert_image(fitz.Rect(50, 50, 250, 250), pixmap=pixmap)
+        doc.save(str(path))
+        doc.close()
+
+    @pytest.mark.unit
+    def test_text_pdf_is_opened_once(self, processor, tmp_path):
+        """The probe detects the text layer and extraction reuses the opened document"""
+        path = tmp_path / 'text.pdf'
+        self._text_pdf(processor.fitz, path)
+
+        probe = processor.probe_text_layer(str(path))
+        assert probe == {'has_text_layer': True, 'document_class': 'test-generator | ', 'page_count': 2}
+
+        opened = []
+        open_document = processor._open_document
+        processor._open_document = lambda pdf_path: opened.append(pdf_path) or open_document(pdf_path)
+        ocr_calls = []
+        text = processor.extract_text_from_pdf(str(path), ocr_page=lambda png: ocr_calls.append(png) or '')
+
+        assert opened == [str(path)]
+        assert ocr_calls == []
+        assert '24332000000012345678' in text
+        assert 'Attachment' in text
+
+    @pytest.mark.unit
+    def test_image_only_pdf_is_rendered_for_ocr(self, processor, tmp_path):
+        """A PDF without a text layer is rendered page by page and handed to OCR"""
+        path = tmp_path / 'scan.pdf'
+        self._image_pdf(processor.fitz, path)
+
+        probe = processor.probe_text_layer(str(path))
+        assert probe['has_text_layer'] is False
+        assert probe['page_count'] == 1
+
+        rendered = []
+        text = processor.extract_text_from_pdf(str(path), ocr_page=lambda png: rendered.append(png) or 'OCR')
+
+        assert text == 'OCR\n'
+        assert len(rendered) == 1
+        assert rendered[0].startswith(b'\x89PNG')
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for re-running the rule engine over stored raw text
+"""
+
+from pathlib import Path
+import pytest
+
+from app.services.csv_storage_service import CSVStorageService
+from app.services.reextract_service import ReextractRunner
+
+SAMPLE_TEXT = (Path(__file__).resolve().parent.parent / "benchmarks" / "samples" / "electronic_standard.txt").read_text(encoding="utf-8")
+
+
+class TestReextractRunner:
+    """Test re-extraction against CSV storage"""
+
+    @pytest.mark.unit
+    def test_stale_fields_are_rewritten_once(self, tmp_path, sample_invoice_data):
+        """Changed fields are written back and a second run finds nothing to update"""
+        storage = CSVStorageService(str(tmp_path / "invoices.csv"))
+        storage.add_invoice(dict(sample_invoice_data, raw_text=SAMPLE_TEXT))
+        storage.add_invoice(dict(sample_invoice_data, file_path='/empty.pdf', raw_text=''))
+
+        progress = []
+        stats = ReextractRunner(storage, batch_size=1).run(progress_callback=progress.append)
+
+        assert stats == {'total': 2, 'updated': 1, 'unchanged': 0, 'skipped': 1}
+        assert progress[-1] == {'index': 2, 'total': 2, 'updated': 1}
+        record = storage.get_invoice_by_file_path(sample_invoice_data['file_path'])
+        assert record['invoice_number'] == '24332000000123456789'
+        assert record['total_amount'] == 1000.0
+
+        assert ReextractRunner(storage).run()['unchanged'] == 1
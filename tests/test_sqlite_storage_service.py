@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the SQLite storage service
+"""
+
+import sqlite3
+import pytest
+
+from app.services.sqlite_storage_service import SQLiteStorageService
+
+
+@pytest.fixture(scope="function")
+def sqlite_storage(tmp_path):
+    """Create a SQLite storage service backed by a temporary database"""
+    return SQLiteStorageService(str(tmp_path / "invoices.db"))
+
+
+class TestSQLiteStorage:
+    """Test SQLite storage backend"""
+
+    @pytest.mark.database
+    def test_wal_mode_and_indexes(self, sqlite_storage):
+        """Database runs in WAL mode with the lookup indexes"""
+        conn = sqlite3.connect(sqlite_storage.get_db_file_path())
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list('invoices')")}
+        conn.close()
+
+        assert journal_mode == 'wal'
+        for column in ('file_path', 'invoice_number', 'invoice_date', 'seller_tax_number', 'file_hash', 'invoice_key'):
+            assert f'idx_invoices_{column}' in indexes
+
+    @pytest.mark.database
+    def test_add_query_and_stats(self, sqlite_storage, sample_invoice_data):
+        """Records round-trip and stats are aggregated in SQL"""
+        sqlite_storage.add_invoice(dict(sample_invoice_data, recognition_quality={'is_valid': True}))
+        sqlite_storage.add_invoice(dict(sample_invoice_data, file_path='/b.pdf', total_amount=500.0))
+
+        record = sqlite_storage.get_invoice_by_file_path(sample_invoice_data['file_path'])
+        assert record['id'] == 1
+        assert record['recognition_quality'] == {'is_valid': True}
+
+        stats = sqlite_storage.get_invoice_stats()
+        assert stats['total_invoices'] == 2
+        assert stats['total_amount'] == pytest.approx(1500.0)
+
+        assert sqlite_storage.delete_invoice_by_file_path('/b.pdf')
+        assert sqlite_storage.get_invoice_by_file_path('/b.pdf') is None
+
+    @pytest.mark.database
+    def test_iter_and_bulk_update(self, sqlite_storage, sample_invoice_data):
+        """Records stream in id order and bulk updates touch only the given fields"""
+        for name in ('a', 'b', 'c'):
+            sqlite_storage.add_invoice(dict(sample_invoice_data, file_path=f'/{name}.pdf'))
+
+        batches = list(sqlite_storage.iter_invoices(batch_size=2))
+        assert [[record['id'] for record in batch] for batch in batches] == [[1, 2], [3]]
+
+        updated = sqlite_storage.update_invoices([
+            {'id': 1, 'invoice_number': '87654321'},
+            {'id': 3, 'invoice_number': '11112222', 'total_amount': 9.5},
+        ])
+
+        assert updated == 2
+        assert sqlite_storage.get_invoice_by_file_path('/a.pdf')['invoice_number'] == '87654321'
+        assert sqlite_storage.get_invoice_by_file_path('/b.pdf')['invoice_number'] == '12345678'
+        assert sqlite_storage.get_invoice_by_file_path('/c.pdf')['total_amount'] == 9.5
+
+    @pytest.mark.database
+    def test_hash_and_semantic_duplicates(self, sqlite_storage, sample_invoice_data):
+        """Hash lookups hit, and a repeated invoice number is flagged at insert"""
+        first_id = sqlite_storage.add_invoice(dict(sample_invoice_data, file_hash='h1'))
+        sqlite_storage.add_invoice(dict(sample_invoice_data, file_path='/copy.pdf', file_hash='h2'))
+
+        assert sqlite_storage.find_by_file_hash('h1') == first_id
+        assert sqlite_storage.find_by_file_hash('missing') is None
+        assert sqlite_storage.get_invoice_by_file_path('/copy.pdf')['duplicate_of'] == first_id
+        assert sqlite_storage.find_duplicate_invoice(' 12345678 ', '123456789012345678') == first_id
+
+    @pytest.mark.database
+    def test_query_filters_and_cursor(self, sqlite_storage, sample_invoice_data):
+        """SQL filters and keyset pages follow the same rules as the in-memory index"""
+        for number, date, amount, seller in [('N1', '2024-1-5', 100.0, '上海甲公司'),
+                                             ('N2', '2024-02-10', 250.0, '北京乙公司'),
+                                             ('N3', '2024-03-01', 250.0, '上海丙公司'),
+                                             ('N4', '2024-04-20', None, '上海丁公司')]:
+            sqlite_storage.add_invoice(dict(sample_invoice_data, file_path=f'/{number}.pdf', invoice_number=number,
+                                            invoice_date=date, total_amount=amount, seller_name=seller))
+
+        result = sqlite_storage.query_invoices({'seller_name': '上海', 'end_date': '2024-03-31'})
+        assert sorted(r['invoice_number'] for r in result['invoices']) == ['N1', 'N3']
+        assert result['matched'] == 2
+
+        seen, cursor = [], None
+        while True:
+            page = sqlite_storage.query_invoices(sort_by='total_amount', limit=1, cursor=cursor)
+            seen.extend(r['invoice_number'] for r in page['invoices'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert seen == ['N3', 'N2', 'N1', 'N4']
+
+    @pytest.mark.database
+    def test_stats_row_tracks_writes(self, sqlite_storage, sample_invoice_data):
+        """The stats row follows inserts, updates and deletes, including a removed maximum"""
+        for path, amount in [('/a.pdf', 100.0), ('/b.pdf', 300.0), ('/c.pdf', None)]:
+            sqlite_storage.add_invoice(dict(sample_invoice_data, file_path=path, total_amount=amount))
+
+        stats = sqlite_storage.get_invoice_stats()
+        assert (stats['total_invoices'], stats['total_amount'], stats['max_amount']) == (3, 400.0, 300.0)
+        assert stats['duplicate_count'] == 2
+
+        sqlite_storage.update_invoices([{'id': 3, 'total_amount': 50.0}])
+        sqlite_storage.delete_invoice_by_file_path('/b.pdf')
+        stats = sqlite_storage.get_invoice_stats()
+        assert (stats['total_invoices'], stats['total_amount']) == (2, 150.0)
+        assert (stats['min_amount'], stats['max_amount']) == (50.0, 100.0)
+
+        conn = sqlite_storage._connect()
+        try:
+            conn.execute('DELETE FROM invoice_stats')
+            conn.commit()
+        finally:
+            conn.close()
+        assert sqlite_storage.get_invoice_stats()['total_amount'] == 150.0
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the index of quarantined (unrecognized) invoices
+"""
+
+import os
+import threading
+import time
+import pytest
+
+from app.services import unrecognized_index
+from app.services.unrecognized_index import UnrecognizedIndex
+from app.services.error_handling_service import ErrorHandlingService
+
+
+class TestUnrecognizedIndex:
+    """Test the quarantine index used by the review screen"""
+
+    @pytest.fixture
+    def handler(self, tmp_path):
+        return ErrorHandlingService(str(tmp_path / 'invoices'))
+
+    def quarantine(self, handler, tmp_path, name, error_reason, confidence):
+        source = tmp_path / name
+        source.write_bytes(b'%PDF' + name.encode())
+        return handler.handle_unrecognized_invoice(str(source), {}, error_reason, confidence)
+
+    @pytest.mark.unit
+    def test_listing_filters_and_deletes(self, handler, tmp_path):
+        """Quarantined files are listed from the index and deletes keep it in sync"""
+        low = self.quarantine(handler, tmp_path, 'a.pdf', '识别质量低', 0.2)
+        self.quarantine(handler, tmp_path, 'b.pdf', '缺少关键字段: total_amount', 0.5)
+        self.quarantine(handler, tmp_path, 'c.pdf', '缺少关键字段: buyer_name', 0.4)
+
+        listing = handler.list_unrecognized_files(limit=2)
+        assert listing['total_count'] == 3
+        assert listing['category_counts'] == {'low_confidence': 1, 'missing_critical_fields': 2}
+        assert [f['file_name'] for f in listing['files']] == ['c.pdf', 'b.pdf']
+
+        listing = handler.list_unrecognized_files(category='missing_critical_fields', sort_by='confidence_score')
+        assert [f['confidence_score'] for f in listing['files']] == [0.5, 0.4]
+        assert handler.list_unrecognized_files(name='A.PDF')['files'][0]['error_reason'] == '识别质量低'
+
+        handler.delete_unrecognized_file(low)
+        assert handler.list_unrecognized_files()['category_counts'] == {'missing_critical_fields': 2}
+        assert handler.clear_unrecognized_files() == 2
+        assert handler.list_unrecognized_files()['total_count'] == 0
+
+    @pytest.mark.unit
+    def test_missing_journal_is_rebuilt_from_disk(self, handler, tmp_path):
+        """Files quarantined before the index existed are picked up by one directory scan"""
+        target = tmp_path / 'invoices' / 'unrecognized' / 'manual_review' / 'old.pdf'
+        target.write_bytes(b'%PDF')
+
+        listing = handler.list_unrecognized_files()
+
+        assert listing['category_counts'] == {'manual_review': 1}
+        assert listing['files'][0]['file_size'] == 4
+
+    @pytest.mark.unit
+    def test_delete_by_any_spelling_of_the_path(self, handler, tmp_path, monkeypatch):
+        """Relative and absolute spellings of a quarantined file resolve to the same entry"""
+        target = self.quarantine(handler, tmp_path, 'a.pdf', '识别质量低', 0.2)
+        monkeypatch.chdir(tmp_path)
+
+        relative = os.path.relpath(target, tmp_path)
+        assert handler.unrecognized_index.get(relative)['confidence_score'] == 0.2
+        handler.delete_unrecognized_file(os.path.abspath(relative))
+
+        assert handler.list_unrecognized_files()['total_count'] == 0
+
+    @pytest.mark.unit
+    def test_nested_directories_keep_their_own_category(self, handler, tmp_path):
+        """The category is the whole directory below the quarantine root"""
+        nested = tmp_path / 'invoices' / 'unrecognized' / 'manual_review' / '2024'
+        nested.mkdir(parents=True)
+        (nested / 'a.pdf').write_bytes(b'%PDF')
+        (nested.parent / 'b.pdf').write_bytes(b'%PDF')
+
+        counts = handler.list_unrecognized_files()['category_counts']
+
+        assert counts == {os.path.join('manual_review', '2024'): 1, 'manual_review': 1}
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(not unrecognized_index.FCNTL_AVAILABLE, reason="fcntl not available")
+    def test_append_during_compaction_is_kept(self, handler, tmp_path, monkeypatch):
+        """An add from another process while the journal is being compacted survives the rewrite"""
+        monkeypatch.setattr(unrecognized_index, 'COMPACT_MIN_LINES', 0)
+        index = handler.unrecognized_index
+        first = self.quarantine(handler, tmp_path, 'a.pdf', '识别质量低', 0.2)
+        index.remove(first)
+        index.add(first, 'low_confidence', '识别质量低', 0.2)
+
+        # Another process appends through its own instance while the snapshot is being written
+        other = UnrecognizedIndex(index.unrecognized_dir, index.journal_path)
+        late = tmp_path / 'invoices' / 'unrecognized' / 'low_confidence' / 'late.pdf'
+        late.write_bytes(b'%PDF')
+        writer = threading.Thread(target=other.add, args=(str(late),))
+        write_snapshot = index._write_snapshot
+
+        def slow_snapshot(entries):
+            writer.start()
+            time.sleep(0.2)
+            write_snapshot(entries)
+
+        monkeypatch.setattr(index, '_write_snapshot', slow_snapshot)
+        index.list_files()
+        writer.join()
+        monkeypatch.setattr(index, '_write_snapshot', write_snapshot)
+
+        names = [entry['file_name'] for entry in index.list_files()['files']]
+        assert sorted(names) == ['a.pdf', 'late.pdf']
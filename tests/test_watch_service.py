@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the invoice directory watcher
+"""
+
+import threading
+import time
+import pytest
+
+from app.services.file_service import FileService
+from app.services import watch_service
+from app.services.watch_service import InvoiceWatcher
+
+
+class RecordingService:
+    """Stands in for an invoice service and records what the watcher submits"""
+
+    def __init__(self):
+        self.batches = []
+        self.catch_ups = 0
+        self.processed = threading.Event()
+
+    def __call__(self):
+        return self
+
+    def process_files(self, files, progress_callback=None, cancel_event=None):
+        self.batches.append(list(files))
+        self.processed.set()
+        return {'total': len(files)}
+
+    def process_all_invoices(self, progress_callback=None, cancel_event=None):
+        self.catch_ups += 1
+        self.processed.set()
+        return {'total': 0}
+
+
+@pytest.fixture
+def file_service(tmp_path, monkeypatch):
+    monkeypatch.setenv("SCAN_MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    return FileService(str(tmp_path / "invoices"))
+
+
+def drop_pdf(directory, name):
+    path = directory / name
+    path.write_bytes(b"%PDF-1.4 " + b"x" * 200)
+    return str(path)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestInvoiceWatcher:
+    """Test debounced detection and queued processing"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("mode", [
+        "poll",
+        pytest.param("inotify", marks=pytest.mark.skipif(
+            not watch_service.INOTIFY_AVAILABLE, reason="inotify_simple not installed")),
+    ])
+    def test_dropped_file_is_processed(self, file_service, mode):
+        """A file dropped into invoices/pdf is submitted once; other files are ignored"""
+        service = RecordingService()
+        existing = drop_pdf(file_service.pdf_dir, "before.pdf")
+        watcher = InvoiceWatcher(service, mode, file_service=file_service,
+                                 debounce_seconds=0.2, poll_interval=0.1)
+        watcher.start()
+        try:
+            assert wait_for(lambda: watcher.stats['batches'] >= 1)
+            assert service.batches == [[(existing, 'pdf')]]
+
+            (file_service.pdf_dir / "notes.txt").write_text("x" * 200)
+            dropped = drop_pdf(file_service.pdf_dir, "after.pdf")
+            assert wait_for(lambda: watcher.stats['batches'] >= 2)
+            assert service.batches[1] == [(dropped, 'pdf')]
+        finally:
+            watcher.stop()
+
+    @pytest.mark.unit
+    def test_restart_does_not_resubmit_processed_files(self, file_service):
+        """The watch manifest is saved after each batch, so a restart only picks up new files"""
+        service = RecordingService()
+        path = drop_pdf(file_service.pdf_dir, "a.pdf")
+        watcher = InvoiceWatcher(service, "poll", file_service=file_service,
+                                 debounce_seconds=0.05, poll_interval=0.05)
+        watcher.start()
+        try:
+            assert wait_for(lambda: watcher.stats['batches'] >= 1)
+        finally:
+            watcher.stop()
+
+        restarted = InvoiceWatcher(service, "poll", file_service=file_service,
+                                   debounce_seconds=0.05, poll_interval=0.05)
+        restarted.start()
+        try:
+            time.sleep(0.5)
+            dropped = drop_pdf(file_service.pdf_dir, "b.pdf")
+            assert wait_for(lambda: restarted.stats['batches'] >= 1)
+        finally:
+            restarted.stop()
+        assert service.batches == [[(path, 'pdf')], [(dropped, 'pdf')]]
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(not watch_service.INOTIFY_AVAILABLE, reason="inotify_simple not installed")
+    def test_inotify_watches_new_subdirectories(self, file_service):
+        """A directory created after startup is watched, including files written before its watch existed"""
+        service = RecordingService()
+        watcher = InvoiceWatcher(service, "inotify", file_service=file_service, debounce_seconds=0.1)
+        watcher.start()
+        try:
+            assert wait_for(lambda: watcher.status()['watched_dirs'] >= 2)
+            nested = file_service.pdf_dir / "2024" / "03"
+            nested.mkdir(parents=True)
+            path = drop_pdf(nested, "a.pdf")
+            assert wait_for(lambda: watcher.stats['batches'] >= 1)
+            assert service.batches == [[(path, 'pdf')]]
+            assert watcher.status()['watched_dirs'] == 4
+        finally:
+            watcher.stop()
+
+    @pytest.mark.unit
+    def test_growing_file_waits_for_stable_size(self, file_service):
+        """A file whose size changes is held back until it stops growing"""
+        watcher = InvoiceWatcher(RecordingService(), "poll", file_service=file_service,
+                                 debounce_seconds=0.05)
+        path = drop_pdf(file_service.pdf_dir, "a.pdf")
+        watcher._candidate(path, 'pdf')
+        with open(path, "ab") as f:
+            f.write(b"more")
+
+        time.sleep(0.1)
+        watcher._flush_ready()
+        assert watcher.queue.empty()
+
+        time.sleep(0.1)
+        watcher._flush_ready()
+        assert watcher.queue.get_nowait() == (path, 'pdf')
+
+    @pytest.mark.unit
+    def test_full_queue_falls_back_to_incremental_scan(self, file_service):
+        """Files that do not fit in the bounded queue trigger one catch-up scan"""
+        service = RecordingService()
+        watcher = InvoiceWatcher(service, "poll", file_service=file_service, max_queue=1)
+        watcher._enqueue("a.pdf", 'pdf')
+        watcher._enqueue("a.pdf", 'pdf')
+        watcher._enqueue("b.pdf", 'pdf')
+        assert watcher.stats['enqueued'] == 1
+        assert watcher.stats['dropped'] == 1
+
+        watcher._threads = [threading.Thread(target=watcher._consume_loop, daemon=True)]
+        watcher._threads[0].start()
+        try:
+            assert wait_for(lambda: service.catch_ups == 1)
+            assert service.batches == [[("a.pdf", 'pdf')]]
+        finally:
+            watcher.stop()